@@ -0,0 +1,10 @@
+#!/bin/sh
+
+### Audit table maintenance, depending on AUDIT_RETENTION_MONTHS env var
+### Creates the upcoming monthly partitions and drops the ones older than the retention
+
+set -e
+
+psql -v ON_ERROR_STOP=1 -d "$PGDATABASE" -U "$PGUSER" -c "SELECT audit_create_partitions(${AUDIT_PARTITIONS_AHEAD:-2})"
+psql -v ON_ERROR_STOP=1 -d "$PGDATABASE" -U "$PGUSER" -tc "SELECT audit_drop_partitions(${AUDIT_RETENTION_MONTHS})" | \
+    sed '/^\s*$/d;s/^\s*/Dropped partition /'
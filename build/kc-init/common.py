@@ -4,6 +4,8 @@ from typing import List
 import requests
 import time
 from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 from settings import settings
@@ -11,6 +13,32 @@ from settings import settings
 logger = logging.getLogger('realm_common')
 logger.setLevel(logging.INFO)
 
+
+class KeycloakSession(requests.Session):
+  """
+  Reuses the connection to keycloak across calls, with a default
+  timeout and retries on transient errors (idempotent methods only)
+  """
+  def __init__(self, timeout:int, retries:int):
+    super().__init__()
+    self.timeout = timeout
+    adapter = HTTPAdapter(max_retries=Retry(
+      total=retries,
+      backoff_factor=0.5,
+      status_forcelist=(502, 503, 504),
+      allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+      raise_on_status=False
+    ))
+    self.mount("http://", adapter)
+    self.mount("https://", adapter)
+
+  def request(self, method, url, *args, **kwargs):
+    kwargs.setdefault("timeout", self.timeout)
+    return super().request(method, url, *args, **kwargs)
+
+
+session = KeycloakSession(settings.request_timeout, settings.request_retries)
+
 def health_check():
     """
     Checks Keycloak's pod ready state, as the normal health_check
@@ -21,7 +49,7 @@ def health_check():
     for i in range(1, settings.max_retries):
       logger.info(f"Health check {i}/{settings.max_retries}")
       try:
-        hc_resp = requests.get(f"{settings.keycloak_url}/realms/master")
+        hc_resp = session.get(f"{settings.keycloak_url}/realms/master")
         if hc_resp.ok:
           logger.info("Keycloak is alive")
           break
@@ -52,7 +80,7 @@ def login(kc_url:str, kc_user:str, kc_pass:str) -> str:
       'Content-Type': 'application/x-www-form-urlencoded'
     }
 
-    response = requests.post(url, headers=headers, data={
+    response = session.post(url, headers=headers, data={
       'client_id': 'admin-cli',
       'grant_type': 'password',
       'username': kc_user,
@@ -84,7 +112,7 @@ def get_role(role_name:str, admin_token:str, realm:str=settings.keycloak_realm):
       'Authorization': f'Bearer {admin_token}'
     }
 
-    response = requests.get(
+    response = session.get(
       f"{settings.keycloak_url}/admin/realms/{realm}/roles",
       headers=headers
     )
@@ -117,7 +145,7 @@ def create_user(
     headers= {
       'Authorization': f'Bearer {admin_token}'
     }
-    response_create_user = requests.post(
+    response_create_user = session.post(
       f"{settings.keycloak_url}/admin/realms/{realm}/users",
       headers=headers,
       json={
@@ -138,7 +166,7 @@ def create_user(
     )
     is_response_good(response_create_user)
 
-    response_user_id = requests.get(
+    response_user_id = session.get(
       f"{settings.keycloak_url}/admin/realms/{realm}/users",
       params={"username": username},
       headers=headers
@@ -153,7 +181,7 @@ def create_user(
     return user_id
 
 def assign_role(role_name, role_id, admin_token, realm, user_id):
-  response_assign_role = requests.post(
+  response_assign_role = session.post(
     f"{settings.keycloak_url}/admin/realms/{realm}/users/{user_id}/role-mappings/realm",
     headers={
       'Content-Type': 'application/json',
@@ -173,7 +201,7 @@ def set_token_exchange_v2(admin_token:str):
   We don't actively use this, but it could be useful
   in the future
   """
-  all_clients = requests.get(
+  all_clients = session.get(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients",
     headers = {
       'Authorization': f'Bearer {admin_token}'
@@ -184,7 +212,7 @@ def set_token_exchange_v2(admin_token:str):
   all_clients = all_clients.json()
   client_id = list(filter(lambda x: x["clientId"] == 'global', all_clients))[0]['id']
 
-  global_client_resp = requests.get(
+  global_client_resp = session.get(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients/{client_id}",
     headers = {
       'Content-Type': 'application/json',
@@ -197,7 +225,7 @@ def set_token_exchange_v2(admin_token:str):
 
   client_properties = global_client_resp.json()
   client_properties["attributes"]["standard.token.exchange.enabled"] = True
-  global_put_client_resp = requests.put(
+  global_put_client_resp = session.put(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients/{client_id}",
     json=client_properties,
     headers = {
@@ -211,7 +239,7 @@ def set_token_exchange_v2(admin_token:str):
 
 def set_token_exchange_for_global_client(admin_token:str):
   logger.info("Setting up the token exchange for global client")
-  all_clients = requests.get(
+  all_clients = session.get(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients",
     headers = {
       'Authorization': f'Bearer {admin_token}'
@@ -225,7 +253,7 @@ def set_token_exchange_for_global_client(admin_token:str):
   rm_client_id = list(filter(lambda x: x["clientId"] == 'realm-management', all_clients))[0]['id']
 
   logger.info("Enabling the Permissions on the global client")
-  client_permission_resp = requests.put(
+  client_permission_resp = session.put(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients/{client_id}/management/permissions",
     json={"enabled": True},
     headers = {
@@ -239,7 +267,7 @@ def set_token_exchange_for_global_client(admin_token:str):
 
   logger.info("Fetching the token exchange scope")
   # Fetching the token exchange scope
-  client_te_scope_resp = requests.get(
+  client_te_scope_resp = session.get(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients/{rm_client_id}/authz/resource-server/scope?permission=false&name=token-exchange",
     headers = {
         'Authorization': f'Bearer {admin_token}'
@@ -250,7 +278,7 @@ def set_token_exchange_for_global_client(admin_token:str):
 
   logger.info("Fetching the global resource reference")
   # Fetching the global resource reference in the realm-management client
-  resource_scope_resp = requests.get(
+  resource_scope_resp = session.get(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients/{rm_client_id}/authz/resource-server/resource?name=client.resource.{client_id}",
     headers = {
         'Authorization': f'Bearer {admin_token}'
@@ -261,7 +289,7 @@ def set_token_exchange_for_global_client(admin_token:str):
 
   logger.info("Creating the client policy")
   # Creating the client policy
-  global_client_policy_resp = requests.post(
+  global_client_policy_resp = session.post(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients/{rm_client_id}/authz/resource-server/policy/client",
     json={
       "name": "token-exchange-global",
@@ -274,7 +302,7 @@ def set_token_exchange_for_global_client(admin_token:str):
     }
   )
   if global_client_policy_resp.status_code == 409:
-    global_client_policy_resp = requests.get(
+    global_client_policy_resp = session.get(
       f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients/{rm_client_id}/authz/resource-server/policy/client?name=token-exchange-global",
       headers = {
         'Authorization': f'Bearer {admin_token}'
@@ -292,7 +320,7 @@ def set_token_exchange_for_global_client(admin_token:str):
   logger.info("Updating permissions")
     # Getting auto-created permission for token-exchange
   token_exch_name = f"token-exchange.permission.client.{client_id}"
-  token_exch_permission_resp = requests.get(
+  token_exch_permission_resp = session.get(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients/{rm_client_id}/authz/resource-server/permission/scope?name={token_exch_name}",
     headers = {
         'Authorization': f'Bearer {admin_token}'
@@ -305,7 +333,7 @@ def set_token_exchange_for_global_client(admin_token:str):
   token_exch_permission_id = token_exch_permission_resp.json()[0]["id"]
 
   # Updating the permission
-  client_permission_resp = requests.put(
+  client_permission_resp = session.put(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/clients/{rm_client_id}/authz/resource-server/permission/scope/{token_exch_permission_id}",
     json={
         "name": token_exch_name,
@@ -324,7 +352,7 @@ def set_token_exchange_for_global_client(admin_token:str):
 
 def set_users_required_fields(admin_token:str):
   # Setting the users' required field to not require firstName and lastName
-  user_profiles_resp = requests.get(
+  user_profiles_resp = session.get(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/users/profile",
     headers={'Authorization': f'Bearer {admin_token}'}
   )
@@ -337,7 +365,7 @@ def set_users_required_fields(admin_token:str):
     if attribute["name"] in ["firstName", "lastName"]:
       attribute.pop("required", None)
 
-  user_edit_profiles_resp = requests.put(
+  user_edit_profiles_resp = session.put(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}/users/profile",
     json=edit_upd,
     headers={
@@ -351,7 +379,7 @@ def set_users_required_fields(admin_token:str):
 
 def enable_user_profile_at_realm_level(admin_token:str):
   # Enable user profiles on a realm level
-  realm_settings = requests.get(
+  realm_settings = session.get(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}",
     headers={'Authorization': f'Bearer {admin_token}'}
   )
@@ -362,7 +390,7 @@ def enable_user_profile_at_realm_level(admin_token:str):
   r_settings = realm_settings.json()
   r_settings["attributes"]["userProfileEnabled"] = True
 
-  update_settings = requests.put(
+  update_settings = session.put(
     f"{settings.keycloak_url}/admin/realms/{settings.keycloak_realm}",
     json=r_settings,
     headers={'Authorization': f'Bearer {admin_token}'}
@@ -374,7 +402,7 @@ def enable_user_profile_at_realm_level(admin_token:str):
 def delete_bootstrap_user(admin_token:str):
   # Delete temp admin user
   logger.info("Deleting temp user")
-  user_id_resp = requests.get(
+  user_id_resp = session.get(
     f"{settings.keycloak_url}/admin/realms/master/users/",
     headers={'Authorization': f'Bearer {admin_token}'}
   )
@@ -383,7 +411,7 @@ def delete_bootstrap_user(admin_token:str):
     exit(1)
 
   user_id = list(filter(lambda x: x["username"] == settings.kc_bootstrap_admin_username, user_id_resp.json()))[0]['id']
-  user_delete_resp = requests.delete(
+  user_delete_resp = session.delete(
     f"{settings.keycloak_url}/admin/realms/master/users/{user_id}",
     headers={'Authorization': f'Bearer {admin_token}'}
   )
@@ -17,6 +17,8 @@ class Settings:
   realm:str = "master"
   kc_namespace:str = "keycloak"
   max_retries:int = 20
+  request_timeout:int = 30
+  request_retries:int = 3
   kc_replicas:int = 2
 
   def __init__(self):
@@ -15,7 +15,13 @@ from app import (
     main, admin_api, datasets_api, tasks_api, requests_api,
     containers_api, registries_api, users_api
 )
+from app.helpers.audit_writer import start_audit_writer
 from app.helpers.base_model import build_sql_uri, db
+from app.helpers.const import AUDIT_ASYNC, TASK_INFORMER, TASK_QUEUE
+from app.helpers.digest_refresher import digest_refresher, start_digest_refresher
+from app.helpers.informer import start_informers
+from app.helpers.task_queue import start_task_queue
+from app.helpers.task_scheduler import task_scheduler
 from app.helpers.exceptions import LogAndException
 from app.fn_flask import FNFlask
 
@@ -76,6 +82,15 @@ def create_app():
     app.register_blueprint(registries_api.bp)
     app.register_blueprint(users_api.bp)
 
+    if AUDIT_ASYNC:
+        start_audit_writer()
+    if TASK_INFORMER:
+        start_informers()
+    if TASK_QUEUE or task_scheduler.enabled:
+        start_task_queue(app)
+    if digest_refresher.enabled:
+        start_digest_refresher(app)
+
     @app.teardown_appcontext
     # pylint: disable=unused-argument
     def shutdown_session(exception=None):
@@ -1,6 +1,8 @@
 """
 admin endpoints:
 - GET /audit
+- GET /metrics
+- PATCH /delivery-secret
 """
 
 from http import HTTPStatus
@@ -14,6 +16,7 @@ from .helpers.const import (
 )
 from .helpers.exceptions import FeatureNotAvailableException, InvalidRequest
 from .helpers.kubernetes import KubernetesClient
+from .helpers.metrics import collect
 from .helpers.query_filters import parse_query_params
 from .helpers.wrappers import audit, auth
 from .models.audit import Audit
@@ -33,6 +36,16 @@ def get_audit_logs():
     """
     return parse_query_params(Audit, request.args.copy()), HTTPStatus.OK
 
+@bp.route('/metrics', methods=['GET'])
+@auth(scope='can_do_admin', check_dataset=False)
+def get_metrics():
+    """
+    GET /metrics endpoint.
+        Returns the in-process counters (caches, latencies, etc.)
+        of the backend replica serving the request
+    """
+    return collect(), HTTPStatus.OK
+
 @bp.route('/delivery-secret', methods=['PATCH'])
 @auth(scope='can_do_admin', check_dataset=False)
 @audit
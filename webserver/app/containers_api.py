@@ -14,6 +14,7 @@ from .helpers.query_filters import parse_query_params
 
 from .helpers.base_model import db
 from .helpers.exceptions import InvalidRequest
+from .helpers.registry_sync import registry_sync
 from .helpers.wrappers import audit, auth
 from .models.container import Container
 from .models.registry import Registry
@@ -63,6 +64,8 @@ def add_image():
         )
 
     image = Container(**body)
+    # Tasks will run by digest, without checking the registry
+    image.resolve_digest()
     image.add()
     return {"id": image.id}, HTTPStatus.CREATED
 
@@ -102,6 +105,7 @@ def patch_datasets_by_id_or_name(image_id:int=None):
     for field in ["ml", "dashboard"]:
         if data.get(field) and isinstance(data.get(field), bool):
             setattr(image, field, data.get(field))
+    session.commit()
 
     return {}, HTTPStatus.CREATED
 
@@ -113,38 +117,18 @@ def sync():
     """
     POST /containers/sync
         syncs up the list of available containers from the
-        available registries and adds them to the DB table
+        available registries and adds them to the DB table,
+        with the digest each tag points to
         with both dashboard and ml flags to false, effectively
         making them not usable. To "enable" them one of those
         flags has to set to true. This is done to avoid undesirable
         or unintended containers to be used on a node.
+        Registries are queried concurrently, and only repositories
+        modified since the last sync are listed again.
     """
-    synched = []
-    for registry in Registry.query.filter(Registry.active).all():
-        for image in registry.fetch_image_list():
-            for key in ["tag", "sha"]:
-                for tag_or_sha in image[key]:
-                    if Container.query.filter(
-                        Container.name==image["name"],
-                        getattr(Container, key)==tag_or_sha,
-                        Container.registry_id==registry.id
-                    ).one_or_none():
-                        logger.info("Image %s already synched", image["name"])
-                        continue
-                    if key == "tag":
-                        data = Container.validate(
-                            {"name": image["name"], "registry": registry.url, "tag": tag_or_sha}
-                        )
-                    else:
-                        data = Container.validate(
-                            {"name": image["name"], "registry": registry.url, "sha": tag_or_sha}
-                        )
-                    cont = Container(**data)
-                    cont.add(commit=False)
-                    synched.append(cont.full_image_name())
-    session.commit()
+    synched = registry_sync.sync(Registry.query.filter(Registry.active).all())
     return {
-        "info": "The sync considers only the latest 100 tag per image. If an older one is needed,"
+        "info": "Repositories not modified since the last sync are skipped. If an image is missing,"
                 " add it manually via the POST /images endpoint",
         "images": synched
         }, HTTPStatus.CREATED
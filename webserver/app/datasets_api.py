@@ -19,9 +19,10 @@ from kubernetes.client import ApiException
 from .helpers.base_model import db
 from .helpers.const import DEFAULT_NAMESPACE
 from .helpers.exceptions import DBRecordNotFoundError, InvalidRequest
+from .helpers.identity import current_identity
 from .helpers.keycloak import Keycloak
 from .helpers.kubernetes import KubernetesClient
-from .helpers.query_validator import validate
+from .helpers.query_validator import count, count_cache, validate
 from .helpers.wrappers import auth, audit
 from .models.dataset import Dataset
 from .models.catalogue import Catalogue
@@ -59,12 +60,9 @@ def post_datasets():
         dict_body = body.pop("dictionaries", [])
         dataset = Dataset(**body)
 
-        kc_client = Keycloak()
-        token_info = kc_client.decode_token(kc_client.get_token_from_headers())
-        user_id = kc_client.get_user_by_email(token_info["email"])["id"]
         dataset.add(
             commit=False,
-            user_id=user_id
+            user_id=current_identity().id
         )
         if cata_body:
             cata_data = Catalogue.validate(cata_body)
@@ -115,6 +113,7 @@ def delete_datasets_by_id_or_name(dataset_id:int=None, dataset_name:str=None):
     except Exception as exc:
         session.rollback()
         raise InvalidRequest("Error while deleting the record") from exc
+    count_cache.invalidate_prefix((ds.id,))
 
     v1 = KubernetesClient()
     try:
@@ -182,6 +181,8 @@ def patch_datasets_by_id_or_name(dataset_id:int=None, dataset_name:str=None):
         raise
 
     session.commit()
+    # Counts of the previous connection details are outdated
+    count_cache.invalidate_prefix((ds.id,))
     return Dataset.sanitized_dict(ds), HTTPStatus.ACCEPTED
 
 @bp.route('/<dataset_name>/catalogue', methods=['GET'])
@@ -286,12 +287,25 @@ def post_transfer_token():
 def select_beacon():
     """
     POST /dataset/datasets/selection/beacon endpoint.
-        Checks the validity of a query on a dataset
+        Checks the validity of a query on a dataset.
+        With mode "count", also returns how many rows
+        it selects, if not under the small-cell threshold
     """
     body = request.json.copy()
     dataset = Dataset.get_by_id(body['dataset_id'])
-
-    if validate(body['query'], dataset):
+    mode = body.get("mode", "validate")
+
+    if mode == "count":
+        result = count(body['query'], dataset)
+        if result is not None:
+            return {
+                "query": body['query'],
+                "result": "Ok",
+                **result
+            }, HTTPStatus.OK
+    elif mode != "validate":
+        raise InvalidRequest("mode should be either validate or count")
+    elif validate(body['query'], dataset):
         return {
             "query": body['query'],
             "result": "Ok"
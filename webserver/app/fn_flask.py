@@ -6,6 +6,8 @@ from flask import Flask, request
 from flask.wrappers import Response
 from flask_sqlalchemy.pagination import QueryPagination
 
+from app.helpers.pagination import CursorPage
+
 
 class FNFlask(Flask):
     """
@@ -21,6 +23,9 @@ class FNFlask(Flask):
             return super().make_response(rv)
 
         body, status_code = rv
+        if isinstance(body, (QueryPagination, CursorPage)) and body.items:
+            type(body.items[0]).prepare_page(body.items)
+
         if isinstance(body, QueryPagination):
             page = int(request.values.get("page", '1'))
             per_page = int(request.values.get("per_page", '25'))
@@ -32,4 +37,13 @@ class FNFlask(Flask):
             jsonized["total"] = body.total
             jsonized["pages"] = body.pages
             return super().make_response((jsonized, status_code))
+        if isinstance(body, CursorPage):
+            jsonized = {
+                "items": [obj.sanitized_dict() for obj in body.items],
+                "limit": body.limit,
+                "next_cursor": body.next_cursor
+            }
+            if body.total is not None:
+                jsonized["total"] = body.total
+            return super().make_response((jsonized, status_code))
         return super().make_response(rv)
@@ -0,0 +1,154 @@
+"""
+Streaming archive helpers for the task results.
+
+The results are read from the task volume as an uncompressed tar
+stream, either from a results job or from a local folder. They can be
+sent as they are, or converted to a zip on the fly, one member at a
+time, so neither the whole archive nor any single file is ever held
+in memory or written to disk.
+"""
+import io
+import os
+import stat
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator
+
+CHUNK_SIZE = 64 * 1024
+# zip can't store timestamps before 1980
+ZIP_MIN_MTIME = 315532800
+
+
+class IterStream(io.RawIOBase):
+    """
+    Read-only, unseekable file object on top of an iterator of bytes
+    """
+    def __init__(self, chunks:Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _tar_info(name:str, st:os.stat_result) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.mtime = int(st.st_mtime)
+    info.mode = stat.S_IMODE(st.st_mode)
+    if stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    else:
+        info.size = st.st_size
+    return info
+
+
+def directory_to_tar(path:Path) -> Iterator[bytes]:
+    """
+    Streams a folder as an uncompressed tar, with the same relative
+    member names as `tar cf - -C path .`.
+    Only folders and regular files are archived, symlinks are
+    skipped rather than followed, as the content is user generated
+    """
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        root_path = Path(root)
+        relative = root_path.relative_to(path)
+        yield _tar_info(f"./{relative}" if relative.parts else ".", os.lstat(root)).tobuf(format=tarfile.PAX_FORMAT)
+
+        for name in sorted(files):
+            try:
+                fd = os.open(root_path / name, os.O_RDONLY | os.O_NOFOLLOW)
+            except OSError:
+                # symlinks, or removed in the meantime
+                continue
+            with os.fdopen(fd, "rb") as source:
+                st = os.fstat(source.fileno())
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                info = _tar_info(f"./{relative / name}", st)
+                yield info.tobuf(format=tarfile.PAX_FORMAT)
+                left = info.size
+                while left:
+                    data = source.read(min(left, CHUNK_SIZE))
+                    if not data:
+                        # The file shrunk since the header was written
+                        data = b"\0" * min(left, CHUNK_SIZE)
+                    yield data
+                    left -= len(data)
+                if info.size % tarfile.BLOCKSIZE:
+                    yield b"\0" * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+    yield b"\0" * tarfile.BLOCKSIZE * 2
+
+
+class _Sink(io.RawIOBase):
+    """
+    Unseekable file object collecting what zipfile writes,
+    until it's drained into the response
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def tar_to_zip(chunks:Iterable[bytes], compression:int=zipfile.ZIP_DEFLATED) -> Iterator[bytes]:
+    """
+    Converts a tar stream into a zip stream. Member names
+    are made relative, and only files and folders are kept.
+    As the output is not seekable, zipfile writes sizes and crc
+    in a data descriptor after each member, switching to zip64
+    for files larger than 4GB
+    """
+    sink = _Sink()
+    with tarfile.open(fileobj=IterStream(chunks), mode="r|") as tar, \
+            zipfile.ZipFile(sink, "w", compression=compression, allowZip64=True) as zip_file:
+        for member in tar:
+            name = member.name.removeprefix("./").lstrip("/")
+            if name in ("", ".") or not (member.isfile() or member.isdir()):
+                continue
+
+            zinfo = zipfile.ZipInfo(
+                name + "/" if member.isdir() else name,
+                date_time=time.localtime(max(member.mtime, ZIP_MIN_MTIME))[:6]
+            )
+            zinfo.external_attr = (member.mode & 0xFFFF) << 16
+            if member.isdir():
+                zip_file.writestr(zinfo, b"")
+                continue
+
+            zinfo.compress_type = compression
+            zinfo.file_size = member.size
+            source = tar.extractfile(member)
+            with zip_file.open(zinfo, "w") as dest:
+                while data := source.read(CHUNK_SIZE):
+                    dest.write(data)
+                    if out := sink.drain():
+                        yield out
+            if out := sink.drain():
+                yield out
+    # Central directory
+    if out := sink.drain():
+        yield out
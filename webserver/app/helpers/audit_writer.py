@@ -0,0 +1,230 @@
+"""
+Asynchronous audit log writer.
+
+Requests only enqueue the audit record, a single daemon thread
+bulk-inserts them in batches of AUDIT_BATCH_SIZE records or every
+AUDIT_FLUSH_INTERVAL_MS milliseconds, whichever comes first.
+
+The queue is bounded (AUDIT_QUEUE_SIZE). When it's full the
+AUDIT_QUEUE_FULL_POLICY applies:
+    - block: wait up to AUDIT_QUEUE_BLOCK_MS for a free slot, then
+        write the record synchronously, so it's never lost
+    - drop: discard the record, count it and log it
+Pending records are flushed on interpreter exit and on SIGTERM.
+"""
+import atexit
+import logging
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app.helpers.base_model import engine
+from app.helpers.const import (
+    AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL_MS, AUDIT_QUEUE_BLOCK_MS,
+    AUDIT_QUEUE_FULL_POLICY, AUDIT_QUEUE_SIZE
+)
+from app.helpers.metrics import register_collector
+from app.models.audit import Audit
+
+logger = logging.getLogger('audit_writer')
+logger.setLevel(logging.INFO)
+
+_STOP = object()
+
+
+class AuditWriter:
+    def __init__(
+            self,
+            bind=engine,
+            maxsize:int=AUDIT_QUEUE_SIZE,
+            batch_size:int=AUDIT_BATCH_SIZE,
+            flush_interval:float=AUDIT_FLUSH_INTERVAL_MS / 1000,
+            policy:str=AUDIT_QUEUE_FULL_POLICY,
+            block_timeout:float=AUDIT_QUEUE_BLOCK_MS / 1000
+        ):
+        if policy not in ("block", "drop"):
+            raise ValueError(f"Unsupported audit queue policy {policy}")
+        self.bind = bind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.sync_writes = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="audit-writer", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, record:dict):
+        """
+        Enqueues an audit record, a dict with the Audit columns.
+        The event_time is set here, so it reflects the request
+        and not when it's written
+        """
+        record.setdefault("event_time", datetime.now())
+        if not self.running:
+            self._write_sync(record)
+            return
+
+        try:
+            if self.policy == "block":
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            if self.policy == "block":
+                self._write_sync(record)
+            else:
+                self.dropped += 1
+                logger.warning(
+                    "Audit queue is full, dropped record for %s %s",
+                    record.get("http_method"), record.get("endpoint")
+                )
+
+    def flush(self, timeout:float=None) -> bool:
+        """
+        Waits until every record enqueued so far has been written.
+        Returns False if the timeout expired before that
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                if not self.running:
+                    return False
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                # Wake up periodically to notice a dead worker
+                self._queue.all_tasks_done.wait(
+                    min(remaining, 1) if remaining is not None else 1
+                )
+        return True
+
+    def stop(self, timeout:float=None):
+        """
+        Writes all pending records and stops the worker
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "maxsize": self._queue.maxsize,
+            "written": self.written,
+            "dropped": self.dropped,
+            "sync_writes": self.sync_writes,
+            "failed": self.failed,
+            "running": self.running
+        }
+
+    def _write_sync(self, record:dict):
+        self.sync_writes += 1
+        self._insert([record])
+
+    def _insert(self, batch:list[dict]):
+        """
+        Single multi-row INSERT for the whole batch
+        """
+        try:
+            with self.bind.begin() as conn:
+                conn.execute(insert(Audit.__table__), batch)
+            self.written += len(batch)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            # Never let the worker die on a DB hiccup, the records
+            # are logged so they can still be traced
+            self.failed += len(batch)
+            logger.error("Failed to write %s audit records: %s", len(batch), exc)
+            for record in batch:
+                logger.error("Unsaved audit record: %s", record)
+
+    def _run(self):
+        batch = []
+        stopping = False
+        while not stopping:
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(record)
+
+            if batch:
+                self._insert(batch)
+                for _ in batch:
+                    self._queue.task_done()
+                batch = []
+
+        # Records enqueued after the stop marker still get written
+        leftovers = []
+        pending = 0
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pending += 1
+            if record is not _STOP:
+                leftovers.append(record)
+        for i in range(0, len(leftovers), self.batch_size):
+            self._insert(leftovers[i:i + self.batch_size])
+        for _ in range(pending):
+            self._queue.task_done()
+
+
+audit_writer = AuditWriter()
+register_collector("audit_writer", audit_writer.stats)
+
+
+def _sigterm_handler(signum, frame):
+    audit_writer.stop(timeout=10)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.raise_signal(signum)
+
+
+def start_audit_writer():
+    """
+    Starts the background worker and makes sure pending records
+    are written before the process exits
+    """
+    audit_writer.start()
+    atexit.register(audit_writer.stop, 10)
+    # Only the main thread can install signal handlers, and we don't
+    # want to override one the server might have set already
+    if threading.current_thread() is threading.main_thread() \
+            and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _sigterm_handler)
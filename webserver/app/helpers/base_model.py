@@ -5,8 +5,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_sqlalchemy.pagination import QueryPagination
 from sqlalchemy import create_engine, Column
 from sqlalchemy.orm import Relationship, declarative_base
-from app.helpers.exceptions import DBRecordNotFoundError, InvalidDBEntry, InvalidRequest
+from app.helpers.exceptions import DBRecordNotFoundError, InvalidDBEntry
 from app.helpers.const import build_sql_uri
+from app.helpers.pagination import CursorPage, Pagination
 
 
 engine = create_engine(build_sql_uri())
@@ -17,14 +18,8 @@ db = SQLAlchemy(model_class=Base)
 # Another helper class for common methods
 class BaseModel():
     @classmethod
-    def _query(cls) -> QueryPagination:
-        try:
-            page = int(request.values.get("page", '1'))
-            per_page = int(request.values.get("per_page", '25'))
-        except ValueError as ve:
-            raise InvalidRequest("page and per_page parameters should be integers") from ve
-
-        return cls.query.paginate(page=page, per_page=per_page)
+    def _query(cls) -> QueryPagination|CursorPage:
+        return Pagination.from_args(request.values.copy()).apply(cls.query, cls)
 
     def sanitized_dict(self) -> dict[str, bool|int|str]:
         """
@@ -45,6 +40,13 @@ class BaseModel():
                     jsonized[field] = str(val)
         return jsonized
 
+    @classmethod
+    def prepare_page(cls, items:list[Self]):
+        """
+        Called with a page of results before they are serialized,
+        models can override it to batch any per-item lookup
+        """
+
     def add(self, commit=True):
         db.session.add(self)
         db.session.flush()
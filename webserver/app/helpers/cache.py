@@ -0,0 +1,110 @@
+"""
+In-process caching helpers.
+
+TTLCache is a bounded, thread-safe mapping where each entry expires
+after a given number of seconds, and the least recently used entries
+are evicted once the max size is reached.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize:int=1024, ttl:float=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key:Hashable) -> Any:
+        """
+        Lookup without locking, callers must hold the lock
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key:Hashable, default:Any=None) -> Any:
+        with self._lock:
+            value = self._get(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key:Hashable, value:Any, ttl:float=None):
+        """
+        :ttl: overrides the cache default for this entry only
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key:Hashable, factory:Callable[[], Any], ttl:float=None) -> Any:
+        """
+        Returns the cached value, or calls factory and caches its result.
+        factory runs without holding the lock, so two threads missing
+        the same key at the same time might both call it.
+        Exceptions raised by factory are not cached.
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = factory()
+        self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key:Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_prefix(self, prefix:tuple):
+        """
+        With tuple keys, drops all entries starting with prefix
+        """
+        with self._lock:
+            for key in [k for k in self._data if isinstance(k, tuple) and k[:len(prefix)] == prefix]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize
+            }
@@ -41,12 +41,79 @@ CLEANUP_AFTER_DAYS = int(os.getenv("CLEANUP_AFTER_DAYS"))
 TASK_POD_RESULTS_PATH = os.getenv("TASK_POD_RESULTS_PATH")
 TASK_POD_INPUTS_PATH = "/mnt/inputs"
 RESULTS_PATH = os.getenv("RESULTS_PATH")
+# Read-only mount of the task results volume, when the backend shares the
+# tasks storage. Results are then read from there instead of a results job
+SHARED_RESULTS_PATH = os.getenv("SHARED_RESULTS_PATH")
+# Size of the finished tasks results cache on the backend volume, 0 disables it
+RESULTS_CACHE_MAX_MB = int(os.getenv("RESULTS_CACHE_MAX_MB", "2048"))
 PUBLIC_URL = os.getenv("PUBLIC_URL")
 CRD_DOMAIN = os.getenv("CRD_DOMAIN")
 TASK_REVIEW = os.getenv("TASK_REVIEW")
 TASK_CONTROLLER= os.getenv("TASK_CONTROLLER")
+TASK_INFORMER = os.getenv("TASK_INFORMER")
+TASK_RECONCILER = os.getenv("TASK_RECONCILER")
+# Queue mode for task submissions, pods are created by a pool of workers
+TASK_QUEUE = os.getenv("TASK_QUEUE")
+TASK_QUEUE_WORKERS = int(os.getenv("TASK_QUEUE_WORKERS", "4"))
+TASK_QUEUE_MAX_ATTEMPTS = int(os.getenv("TASK_QUEUE_MAX_ATTEMPTS", "5"))
+TASK_QUEUE_RETRY_SECONDS = int(os.getenv("TASK_QUEUE_RETRY_SECONDS", "5"))
+TASK_QUEUE_POLL_SECONDS = float(os.getenv("TASK_QUEUE_POLL_SECONDS", "2"))
+# A worker that claimed a task and didn't start it within this
+# time is considered gone, and the task is claimed again
+TASK_QUEUE_CLAIM_TIMEOUT = int(os.getenv("TASK_QUEUE_CLAIM_TIMEOUT", "600"))
+# Max number of tasks starting or running at the same time, 0 means no limit.
+# Any of them enables the queue, excess tasks wait for a free slot
+TASK_MAX_ACTIVE = int(os.getenv("TASK_MAX_ACTIVE", "0"))
+TASK_MAX_ACTIVE_PER_USER = int(os.getenv("TASK_MAX_ACTIVE_PER_USER", "0"))
+TASK_MAX_ACTIVE_PER_PROJECT = int(os.getenv("TASK_MAX_ACTIVE_PER_PROJECT", "0"))
+TASK_MAX_ACTIVE_PER_DATASET = int(os.getenv("TASK_MAX_ACTIVE_PER_DATASET", "0"))
+# How long registry image existence checks are cached for, in seconds.
+# Images not found are cached for less, so that a push is picked up soon
+REGISTRY_IMAGE_CACHE_TTL = int(os.getenv("REGISTRY_IMAGE_CACHE_TTL", "300"))
+REGISTRY_IMAGE_CACHE_NEGATIVE_TTL = int(os.getenv("REGISTRY_IMAGE_CACHE_NEGATIVE_TTL", "30"))
+REGISTRY_IMAGE_CACHE_SIZE = int(os.getenv("REGISTRY_IMAGE_CACHE_SIZE", "1024"))
+# Concurrent registry requests during /containers/sync
+REGISTRY_SYNC_WORKERS = int(os.getenv("REGISTRY_SYNC_WORKERS", "8"))
+# Registry bearer tokens are reused until they expire, or for this
+# many seconds if their expiry is unknown. Credentials read from the
+# pull secrets are reused for REGISTRY_CREDENTIALS_TTL seconds
+REGISTRY_TOKEN_TTL = int(os.getenv("REGISTRY_TOKEN_TTL", "300"))
+REGISTRY_CREDENTIALS_TTL = int(os.getenv("REGISTRY_CREDENTIALS_TTL", "300"))
+# Containers tags are resolved to their digest when added, and
+# resolved again every this many minutes, in case they were pushed again.
+# 0 disables the refresh
+CONTAINER_DIGEST_REFRESH_MINUTES = int(os.getenv("CONTAINER_DIGEST_REFRESH_MINUTES", "60"))
+# POST /tasks/batch size, and pods created at the same time for it
+TASK_BATCH_MAX_SIZE = int(os.getenv("TASK_BATCH_MAX_SIZE", "100"))
+TASK_BATCH_WORKERS = int(os.getenv("TASK_BATCH_WORKERS", "8"))
+# Connections to the datasets databases (i.e. for the beacon), per dataset
+# and backend process. Engines unused for DATASET_ENGINE_IDLE_SECONDS are
+# disposed of, credentials are read from their secret at most every
+# DATASET_CREDENTIALS_TTL seconds
+DATASET_POOL_SIZE = int(os.getenv("DATASET_POOL_SIZE", "2"))
+DATASET_POOL_MAX_OVERFLOW = int(os.getenv("DATASET_POOL_MAX_OVERFLOW", "3"))
+DATASET_ENGINE_IDLE_SECONDS = int(os.getenv("DATASET_ENGINE_IDLE_SECONDS", "600"))
+DATASET_CREDENTIALS_TTL = int(os.getenv("DATASET_CREDENTIALS_TTL", "300"))
+# Longest a beacon query validation can take on the dataset database
+DATASET_QUERY_TIMEOUT_SECONDS = int(os.getenv("DATASET_QUERY_TIMEOUT_SECONDS", "10"))
+# Beacon counts below this (but above 0) are not disclosed.
+# Counts are cached for BEACON_COUNT_CACHE_TTL seconds
+BEACON_MIN_COUNT = int(os.getenv("BEACON_MIN_COUNT", "5"))
+BEACON_COUNT_CACHE_TTL = int(os.getenv("BEACON_COUNT_CACHE_TTL", "300"))
+BEACON_COUNT_CACHE_SIZE = int(os.getenv("BEACON_COUNT_CACHE_SIZE", "1024"))
+# Connections kept open to the k8s API server, per backend process
+KUBERNETES_POOL_SIZE = int(os.getenv("KUBERNETES_POOL_SIZE", "8"))
 STORAGE_CLASS = os.getenv("STORAGE_CLASS")
 GITHUB_DELIVERY = os.getenv("GITHUB_DELIVERY")
 OTHER_DELIVERY = os.getenv("OTHER_DELIVERY")
 ALPINE_IMAGE = os.getenv("ALPINE_IMAGE")
 AUTO_DELIVERY_RESULTS = os.getenv("AUTO_DELIVERY_RESULTS")
+
+# Audit log writer. When enabled, audit records are written in batches
+# by a background thread instead of within each request
+AUDIT_ASYNC = os.getenv("AUDIT_ASYNC", "false").lower() == "true"
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "100"))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "500"))
+AUDIT_QUEUE_FULL_POLICY = os.getenv("AUDIT_QUEUE_FULL_POLICY", "block").lower()
+AUDIT_QUEUE_BLOCK_MS = int(os.getenv("AUDIT_QUEUE_BLOCK_MS", "100"))
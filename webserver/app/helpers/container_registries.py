@@ -1,18 +1,108 @@
-from base64 import b64encode
+from base64 import b64encode, urlsafe_b64decode
+from http.cookiejar import DefaultCookiePolicy
+import hashlib
 import json
+import threading
+import time
 from typing import List
+from urllib.parse import urljoin
 import requests
 import logging
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError
 
+from app.helpers.cache import TTLCache
 from app.helpers.kubernetes import KubernetesClient
 from app.helpers.exceptions import ContainerRegistryException
-from app.helpers.const import TASK_NAMESPACE
+from app.helpers.const import (
+    REGISTRY_CREDENTIALS_TTL, REGISTRY_IMAGE_CACHE_NEGATIVE_TTL, REGISTRY_IMAGE_CACHE_SIZE,
+    REGISTRY_IMAGE_CACHE_TTL, REGISTRY_SYNC_WORKERS, REGISTRY_TOKEN_TTL, TASK_NAMESPACE
+)
+from app.helpers.metrics import register_collector
 
 
 logger = logging.getLogger('registries_handler')
 logger.setLevel(logging.INFO)
 
+# Accepted manifests when resolving a tag, multi-arch indexes first,
+# so the digest is the one a pull by tag would resolve to
+MANIFEST_MEDIA_TYPES = ", ".join([
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.oci.image.manifest.v1+json"
+])
+
+# Stops following a listing pagination after this many pages
+MAX_LIST_PAGES = 100
+
+# (registry, image, tag, sha) -> whether the registry has it.
+# Shared across requests, invalidated on /containers/sync
+# and when a registry is changed
+image_cache = TTLCache(maxsize=REGISTRY_IMAGE_CACHE_SIZE, ttl=REGISTRY_IMAGE_CACHE_TTL)
+register_collector("registry_image_cache", image_cache.stats)
+
+
+# (registry class, registry, credentials hash, scope) -> bearer token
+token_cache = TTLCache(maxsize=1024, ttl=REGISTRY_TOKEN_TTL)
+register_collector("registry_token_cache", token_cache.stats)
+
+# Pull secret name -> registry credentials, so clients are
+# not built from a Kubernetes API call every time
+credentials_cache = TTLCache(maxsize=256, ttl=REGISTRY_CREDENTIALS_TTL)
+
+# Tokens are renewed this many seconds before they expire
+TOKEN_EXPIRY_MARGIN = 30
+
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(registry:str) -> requests.Session:
+    """
+    HTTP session shared by the clients of a registry, so that
+    connections are kept alive and reused. Cookies are not kept,
+    requests only carry the credentials they're given
+    """
+    with _sessions_lock:
+        session = _sessions.get(registry)
+        if session is None:
+            session = requests.Session()
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(pool_maxsize=REGISTRY_SYNC_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[registry] = session
+        return session
+
+
+def token_ttl(token:str) -> float:
+    """
+    Seconds the token can be reused for. Registry tokens are
+    usually JWTs, their exp claim is used when present
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return min(claims["exp"] - time.time() - TOKEN_EXPIRY_MARGIN, REGISTRY_TOKEN_TTL)
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return REGISTRY_TOKEN_TTL
+
+
+def cached_image_check(registry:str, image:str, tag:str|None, sha:str|None, check) -> bool:
+    """
+    Returns the cached result of check(), the existence check of
+    image:tag or image@sha on registry, running it on a miss.
+    Negative results are cached for REGISTRY_IMAGE_CACHE_NEGATIVE_TTL,
+    errors (i.e. the registry is unreachable) are not cached
+    """
+    key = (registry, image, tag, sha)
+    exists = image_cache.get(key)
+    if exists is None:
+        exists = bool(check())
+        image_cache.set(key, exists, None if exists else REGISTRY_IMAGE_CACHE_NEGATIVE_TTL)
+    return exists
+
 
 class BaseRegistry:
     token_field = None
@@ -21,13 +111,15 @@ class BaseRegistry:
     list_repo_url = None
     creds = None
     organization = ''
-    request_args = {}
+    manifests_url = None
     api_login = True
     list_req_params = {"page": 1, "page_size": 100}
 
     def __init__(self, registry:str, secret_name:str=None, creds:dict={}):
         self.registry = registry
         self.secret_name = secret_name
+        self.request_args = {}
+        self.session = get_session(registry)
         self.creds = creds
         if secret_name is not None:
             self.creds = self.get_secret()
@@ -46,26 +138,110 @@ class BaseRegistry:
             "token": dockerjson['auths'][key]["password"]
         }
 
-    def list_repos(self) -> list[str]:
+    def _fetch_repos(self) -> list|dict:
         """
         Depending on the provider, will need to run
             different api requests to get a list of
             available images
         """
-        try:
-            list_resp = requests.get(
-                self.list_repo_url % {"service": self.registry, "organization": self.organization},
-                headers={"Authorization": f"Bearer {self._token}"}
-            )
-            if not list_resp.ok:
-                logger.error(list_resp.text)
-                raise ContainerRegistryException("Could not fetch the list of images", 500)
-        except ConnectionError as ce:
-            raise ContainerRegistryException(
-                f"Failed to fetch the list of available containers from {self.registry}",
-                500
-            ) from ce
-        return list_resp.json()
+        body, _ = self._get_pages(
+            self.list_repo_url % {"service": self.registry, "organization": self.organization},
+            None,
+            error=("Could not fetch the list of images", 500),
+            connection_error=f"Failed to fetch the list of available containers from {self.registry}"
+        )
+        return body
+
+    def _repo_names(self, body:list|dict) -> list[str]:
+        raise NotImplementedError()
+
+    def list_repo_names(self) -> list[str]:
+        return self._repo_names(self._fetch_repos())
+
+    def list_repos(self) -> List[dict[str, str | List[str]]]:
+        images = []
+        for image in self.list_repo_names():
+            properties = {"name": image}
+            properties.update(self.get_image_tags(image))
+            images.append(properties)
+        return images
+
+    def _get_pages(
+            self,
+            url:str,
+            image:str|None,
+            error:tuple[str, int|None],
+            connection_error:str,
+            params:dict=None,
+            validators:dict=None
+        ) -> tuple[list|dict|None, dict]:
+        """
+        GETs a listing, with a token for the image or registry scope,
+        following its pagination, either the Link header
+        (Registry v2 API, GitHub) or the `next` field (Docker Hub), and
+        merges the pages. With the validators of a previous listing the
+        first page is a conditional request, if it is not modified
+        the body is None.
+        Returns the body and the validators of the first page
+        """
+        conditional = {}
+        if validators and validators.get("etag"):
+            conditional["If-None-Match"] = validators["etag"]
+        if validators and validators.get("last_modified"):
+            conditional["If-Modified-Since"] = validators["last_modified"]
+
+        body = None
+        new_validators = {}
+        for page in range(MAX_LIST_PAGES):
+            try:
+                response = self._authorized_request(
+                    "GET", url, image, params=params, headers=conditional
+                )
+            except ConnectionError as ce:
+                raise ContainerRegistryException(connection_error, 500) from ce
+
+            if page == 0:
+                if response.status_code == 304:
+                    return None, validators
+                new_validators = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified")
+                }
+                conditional = {}
+            if not response.ok:
+                logger.info(response.text)
+                raise ContainerRegistryException(*error)
+
+            page_body = response.json()
+            body = self._merge_pages(body, page_body)
+            url = self._next_page_url(response, page_body)
+            if url is None:
+                break
+            # The next url carries the query string already
+            params = None
+        else:
+            logger.warning("Listing truncated after %s pages: %s", MAX_LIST_PAGES, url)
+        return body, new_validators
+
+    @staticmethod
+    def _merge_pages(body:list|dict|None, page:list|dict) -> list|dict:
+        if body is None:
+            return page
+        if isinstance(body, list) and isinstance(page, list):
+            return body + page
+        if isinstance(body, dict) and isinstance(page, dict):
+            for key in ("repositories", "tags", "results"):
+                if isinstance(body.get(key), list) and isinstance(page.get(key), list):
+                    body[key] += page[key]
+        return body
+
+    @staticmethod
+    def _next_page_url(response:requests.Response, page:list|dict) -> str|None:
+        if "next" in response.links:
+            return urljoin(response.url, response.links["next"]["url"])
+        if isinstance(page, dict) and isinstance(page.get("next"), str):
+            return page["next"]
+        return None
 
     def login(self, image:str=None) -> str:
         """
@@ -74,7 +250,7 @@ class BaseRegistry:
         """
         url = self.repo_login_url if image else  self.login_url
         try:
-            response_auth = requests.get(
+            response_auth = self.session.get(
                 url % self.get_url_string_params(image_name=image),
                 **self.request_args
             )
@@ -91,6 +267,50 @@ class BaseRegistry:
                 500
             ) from ce
 
+    def _token_key(self, image:str=None) -> tuple:
+        creds = self.creds or {}
+        creds_hash = hashlib.sha256(f"{creds.get('user')}:{creds.get('token')}".encode()).hexdigest()
+        # Same token for any image, if the login isn't scoped
+        scope = image if self.repo_login_url != self.login_url else None
+        return (type(self).__name__, self.registry, creds_hash, scope)
+
+    def get_token(self, image:str=None, refresh:bool=False) -> str:
+        """
+        As login, reusing the last token for the same credentials
+        and scope until it expires. refresh forces a new login
+        """
+        if not self.api_login:
+            return self.login(image)
+
+        key = self._token_key(image)
+        token = None if refresh else token_cache.get(key)
+        if token is None:
+            token = self.login(image)
+            ttl = token_ttl(token)
+            if ttl > 0:
+                token_cache.set(key, token, ttl)
+        return token
+
+    def _authorized_request(
+            self, method:str, url:str, image:str=None, headers:dict=None, **kwargs
+        ) -> requests.Response:
+        """
+        Registry API request with the token for the image, or registry, scope.
+        A token rejected as expired is renewed, and the request sent again, once
+        """
+        response = None
+        for _ in range(2):
+            response = self.session.request(
+                method,
+                url,
+                headers={"Authorization": f"Bearer {self.get_token(image)}", **(headers or {})},
+                **kwargs
+            )
+            if response.status_code != 401 or not self.api_login:
+                break
+            token_cache.invalidate(self._token_key(image))
+        return response
+
     def get_url_string_params(self, image_name:str=None) -> dict[str,str]:
         return {
             "service": self.registry,
@@ -98,6 +318,29 @@ class BaseRegistry:
             "organization": self.organization
         }
 
+    def _fetch_tags(self, image:str, validators:dict=None) -> tuple[list|dict|None, dict]:
+        """
+        The raw tags listing of image, all pages, and its validators.
+        The listing is None if unchanged since validators
+        """
+        return self._get_pages(
+            self.tags_url % self.get_url_string_params(image_name=image),
+            image,
+            error=(f"Failed to fetch the list of tags for {image}", None),
+            connection_error=f"Failed to fetch the list of tags from {self.registry}/{image}",
+            params=self.list_req_params,
+            validators=validators
+        )
+
+    def _format_tags(self, image:str, tags_list:list|dict) -> dict[str, str|List[str]]:
+        return tags_list
+
+    def _tag_digests(self, tags_list:list|dict) -> dict[str, str]:
+        """
+        The digest of each tag, when the listing has them
+        """
+        return {}
+
     def get_image_tags(self, image:str) -> dict[str, str|List[str]]:
         """
         Works as an existence check. If the tag for the image
@@ -105,24 +348,22 @@ class BaseRegistry:
         return True.
         This should work on any docker Registry v2 as it's a standard
         """
-        token = self.login(image)
-
-        try:
-            response_metadata = requests.get(
-                self.tags_url % self.get_url_string_params(image_name=image),
-                params=self.list_req_params,
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            if not response_metadata.ok:
-                logger.info(response_metadata.text)
-                raise ContainerRegistryException(f"Failed to fetch the list of tags for {image}")
+        tags_list, _ = self._fetch_tags(image)
+        return self._format_tags(image, tags_list)
 
-            return response_metadata.json()
-        except ConnectionError as ce:
-            raise ContainerRegistryException(
-                f"Failed to fetch the list of tags from {self.registry}/{image}",
-                500
-            ) from ce
+    def get_image_tags_if_changed(
+            self, image:str, validators:dict=None
+        ) -> tuple[dict[str, str|List[str]]|None, dict[str, str], dict]:
+        """
+        As get_image_tags, with a conditional request when validators
+        (etag and last_modified of a previous listing) are given.
+        Returns the tags, or None if the listing didn't change,
+        the digests known from the listing, and the new validators
+        """
+        tags_list, new_validators = self._fetch_tags(image, validators)
+        if tags_list is None:
+            return None, {}, new_validators
+        return self._format_tags(image, tags_list), self._tag_digests(tags_list), new_validators
 
     def has_image_tag_or_sha(self, image:str, tag:str=None, sha:str=None) -> bool:
         """
@@ -134,6 +375,44 @@ class BaseRegistry:
 
         return tag in tags_list["tag"] or sha in tags_list["sha"]
 
+    def get_tag_digest(self, image:str, tag:str) -> str|None:
+        """
+        Returns the digest the tag currently points to, as used to
+        pull the image by digest (i.e. image@sha256:...).
+        Standard Registry v2 API, the digest of the manifest
+        (or manifest list, for multi-arch images) is in the
+        Docker-Content-Digest header
+        """
+        if self.manifests_url is None:
+            return None
+
+        try:
+            response = self._authorized_request(
+                "HEAD",
+                self.manifests_url % self.get_url_string_params(image_name=image) + tag,
+                image,
+                headers={"Accept": MANIFEST_MEDIA_TYPES}
+            )
+        except ConnectionError as ce:
+            raise ContainerRegistryException(
+                f"Failed to fetch the digest of {self.registry}/{image}:{tag}",
+                500
+            ) from ce
+        if response.status_code == 404:
+            return None
+        if not response.ok:
+            raise ContainerRegistryException(f"Failed to fetch the digest of {image}:{tag}")
+        return response.headers.get("Docker-Content-Digest")
+
+    def resolve_digest(self, image:str, tag:str=None, sha:str=None) -> str|None:
+        """
+        Returns the immutable digest for image:tag, or the sha
+        itself if the registry has it. None if not found
+        """
+        if sha:
+            return sha if self.has_image_tag_or_sha(image, sha=sha) else None
+        return self.get_tag_digest(image, tag)
+
 
 class AzureRegistry(BaseRegistry):
     # https://docker-docs.uclv.cu/registry/spec/api for api schemas
@@ -141,6 +420,7 @@ class AzureRegistry(BaseRegistry):
     repo_login_url = "https://%(service)s/oauth2/token?service=%(service)s&scope=repository:%(image)s:*"
     tags_url = "https://%(service)s/v2/%(image)s/tags/list"
     digest_url = "https://%(service)s/v2/%(image)s/manifests/"
+    manifests_url = digest_url
     list_repo_url = "https://%(service)s/v2/_catalog"
     token_field = "access_token"
     list_req_params = {"n": 100}
@@ -150,18 +430,15 @@ class AzureRegistry(BaseRegistry):
 
         self.auth = b64encode(f"{self.creds['user']}:{self.creds['token']}".encode()).decode()
         self.request_args["headers"] = {"Authorization": f"Basic {self.auth}"}
-        self._token = self.login()
+        self._token = self.get_token()
 
     def get_image_digest(self, image:str, tag:str) -> dict[str, str]:
-        token = self.login(image)
-
         try:
-            response_metadata = requests.get(
+            response_metadata = self._authorized_request(
+                "GET",
                 self.digest_url % self.get_url_string_params(image_name=image) + tag,
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/vnd.docker.distribution.manifest.v2+json"
-                    }
+                image,
+                headers={"Accept": "application/vnd.docker.distribution.manifest.v2+json"}
             )
 
             if not response_metadata.ok:
@@ -175,26 +452,21 @@ class AzureRegistry(BaseRegistry):
                 500
             ) from ce
 
-    def get_image_tags(self, image:str) -> dict[str, str|List[str]]:
-        tags_list = super().get_image_tags(image)
+    def _format_tags(self, image:str, tags_list:dict) -> dict[str, str|List[str]]:
         full_tags = {"tag": [], "sha": []}
 
         if tags_list:
             full_tags["tag"] = [t for t in tags_list.get("tags", [])]
 
             for t in full_tags["tag"]:
-                full_tags["sha"] = [self.get_image_digest(image, t)]
+                digest = self.get_image_digest(image, t)
+                if digest not in full_tags["sha"]:
+                    full_tags["sha"].append(digest)
 
         return full_tags
 
-    def list_repos(self) -> List[dict[str, str | List[str]]]:
-        list_images = super().list_repos()
-        images = []
-        for image in list_images["repositories"]:
-            properties = {"name": image}
-            properties.update(self.get_image_tags(image))
-            images.append(properties)
-        return images
+    def _repo_names(self, body:dict) -> list[str]:
+        return body["repositories"]
 
 class DockerRegistry(BaseRegistry):
     # https://docs.docker.com/reference/api/hub/latest/#tag/repositories
@@ -210,11 +482,9 @@ class DockerRegistry(BaseRegistry):
         self.organization = registry
         self.request_args["json"] = {"username": self.creds['user'], "password": self.creds['token']}
         self.request_args["headers"] = {"Content-Type": "application/json"}
-        self._token = self.login()
-
-    def get_image_tags(self, image:str) -> dict[str, str|List[str]]:
-        tags_list = super().get_image_tags(image)
+        self._token = self.get_token()
 
+    def _format_tags(self, image:str, tags_list:dict) -> dict[str, str|List[str]]:
         metadata = {"name": image, "tag": [], "sha": []}
         for t in tags_list["results"]:
             metadata["tag"].append(t["name"])
@@ -222,9 +492,29 @@ class DockerRegistry(BaseRegistry):
 
         return metadata
 
-    def list_repos(self) -> List[dict[str, str | List[str]]]:
-        list_images = super().list_repos()
-        return [self.get_image_tags(image["name"]) for image in list_images["results"]]
+    def _tag_digests(self, tags_list:dict) -> dict[str, str]:
+        return {t["name"]: t["digest"] for t in tags_list["results"] if t.get("digest")}
+
+    def get_tag_digest(self, image:str, tag:str) -> str|None:
+        try:
+            response = self._authorized_request(
+                "GET",
+                f"{self.tags_url % self.get_url_string_params(image_name=image)}/{tag}",
+                image
+            )
+        except ConnectionError as ce:
+            raise ContainerRegistryException(
+                f"Failed to fetch the digest of {self.registry}/{image}:{tag}",
+                500
+            ) from ce
+        if response.status_code == 404:
+            return None
+        if not response.ok:
+            raise ContainerRegistryException(f"Failed to fetch the digest of {image}:{tag}")
+        return response.json().get("digest")
+
+    def _repo_names(self, body:dict) -> list[str]:
+        return [image["name"] for image in body["results"]]
 
 
 class GitHubRegistry(BaseRegistry):
@@ -254,48 +544,32 @@ class GitHubRegistry(BaseRegistry):
         logging.info("Auth on github skipped, an organization name is needed")
         return self._token
 
-    def get_image_tags(self, image:str) -> dict[str, str|List[str]]:
+    @staticmethod
+    def _version_tags(version:dict) -> list[str]:
+        tags = version["metadata"]["container"]["tags"]
+        return tags if isinstance(tags, list) else [tags]
+
+    def _format_tags(self, image:str, tags_list:list[dict]) -> dict[str, str|List[str]]:
         """
-        Works as a list of available tags/sha. Limiting to only 100 tags per
-        image
+        Package versions, each one being a digest with its tags
         """
-        token = self.login(image)
-        tags_list = []
-
-        try:
-            response_metadata = requests.get(
-                self.tags_url % self.get_url_string_params(image_name=image),
-                params=self.list_req_params,
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            if not response_metadata.ok:
-                logger.info(response_metadata.text)
-                raise ContainerRegistryException(f"Failed to fetch the list of tags for {image}")
-
-            tags_list += response_metadata.json()
-
-        except ConnectionError as ce:
-            raise ContainerRegistryException(
-                f"Failed to fetch the list of tags from {self.registry}/{image}",
-                500
-            ) from ce
-
         t_list = []
         s_list = []
         for tags in tags_list:
-            if isinstance(tags["metadata"]["container"]["tags"], list):
-                t_list += tags["metadata"]["container"]["tags"]
-            else:
-                t_list.append(tags["metadata"]["container"]["tags"])
+            t_list += self._version_tags(tags)
             s_list.append(tags["name"])
 
         return {"tag": t_list,"sha": s_list}
 
-    def list_repos(self) -> List[dict[str, str | List[str]]]:
-        list_images = super().list_repos()
-        images = []
-        for img in list_images:
-            properties = {"name": img["name"]}
-            properties.update(self.get_image_tags(img["name"]))
-            images.append(properties)
-        return images
+    def _tag_digests(self, tags_list:list[dict]) -> dict[str, str]:
+        return {tag: version["name"] for version in tags_list for tag in self._version_tags(version)}
+
+    def get_tag_digest(self, image:str, tag:str) -> str|None:
+        """
+        Versions are named after their digest
+        """
+        tags_list, _ = self._fetch_tags(image)
+        return self._tag_digests(tags_list).get(tag)
+
+    def _repo_names(self, body:list[dict]) -> list[str]:
+        return [img["name"] for img in body]
@@ -0,0 +1,181 @@
+"""
+Connections to the datasets databases, used to run queries
+directly against them (i.e. POST /datasets/selection/beacon).
+
+One SQLAlchemy engine is kept per dataset, with a small connection
+pool (DATASET_POOL_SIZE + DATASET_POOL_MAX_OVERFLOW) checked with a
+pre-ping before use. Engines are keyed by the dataset connection
+details and credentials, a change in either creates a new engine,
+and are disposed of when unused for DATASET_ENGINE_IDLE_SECONDS, or
+when the dataset is updated or deleted.
+Credentials are read from the dataset secret at most every
+DATASET_CREDENTIALS_TTL seconds.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import Engine, URL, create_engine
+from sqlalchemy.exc import NoSuchModuleError
+
+from app.helpers.cache import TTLCache
+from app.helpers.const import (
+    DATASET_CREDENTIALS_TTL, DATASET_ENGINE_IDLE_SECONDS, DATASET_POOL_MAX_OVERFLOW,
+    DATASET_POOL_SIZE, DATASET_QUERY_TIMEOUT_SECONDS, build_sql_uri
+)
+from app.helpers.exceptions import DBError
+from app.helpers.metrics import register_collector
+
+logger = logging.getLogger('dataset_engines')
+logger.setLevel(logging.INFO)
+
+# SQLAlchemy dialect and driver for each of the supported dataset types
+DIALECTS = {
+    "postgres": "postgresql+psycopg2",
+    "mssql": "mssql+pymssql",
+    "mysql": "mysql+pymysql",
+    "mariadb": "mariadb+pymysql",
+    "oracle": "oracle+oracledb"
+}
+# Driver options, where the statement timeout can't be set per session
+CONNECT_ARGS = {
+    "mssql": {"timeout": DATASET_QUERY_TIMEOUT_SECONDS, "login_timeout": DATASET_QUERY_TIMEOUT_SECONDS}
+}
+# Connections are recycled after this many seconds, before
+# the database or a firewall drops them
+POOL_RECYCLE_SECONDS = 1800
+# Seconds to wait for a free connection of the pool
+POOL_TIMEOUT_SECONDS = 10
+
+
+def build_dataset_url(dataset, user:str, password:str) -> str|URL:
+    host = re.sub('http(s)*://', '', dataset.host)
+    if dataset.type == "postgres":
+        return build_sql_uri(
+            host=host,
+            port=dataset.port,
+            username=user,
+            password=password,
+            database=dataset.name
+        )
+    if dataset.type == "oracle":
+        return URL.create(
+            DIALECTS["oracle"],
+            username=user,
+            password=password,
+            host=host,
+            port=dataset.port,
+            query={"service_name": dataset.name}
+        )
+    return URL.create(
+        DIALECTS[dataset.type],
+        username=user,
+        password=password,
+        host=host,
+        port=dataset.port,
+        database=dataset.name
+    )
+
+
+class DatasetEngineManager:
+    def __init__(
+            self,
+            pool_size:int=DATASET_POOL_SIZE,
+            max_overflow:int=DATASET_POOL_MAX_OVERFLOW,
+            idle_seconds:float=DATASET_ENGINE_IDLE_SECONDS,
+            credentials_ttl:float=DATASET_CREDENTIALS_TTL
+        ):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.idle_seconds = idle_seconds
+        self.credentials = TTLCache(maxsize=256, ttl=credentials_ttl)
+        # dataset id -> (config key, engine, last used)
+        self._engines: dict[int, tuple[str, Engine, float]] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.disposed = 0
+
+    @staticmethod
+    def _config_key(dataset, user:str, password:str) -> str:
+        return hashlib.sha256(json.dumps([
+            dataset.type, dataset.host, dataset.port, dataset.name, user, password
+        ]).encode()).hexdigest()
+
+    def _create_engine(self, dataset, user:str, password:str) -> Engine:
+        try:
+            return create_engine(
+                build_dataset_url(dataset, user, password),
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_pre_ping=True,
+                pool_recycle=POOL_RECYCLE_SECONDS,
+                pool_timeout=POOL_TIMEOUT_SECONDS,
+                connect_args=CONNECT_ARGS.get(dataset.type, {})
+            )
+        except (ImportError, NoSuchModuleError) as exc:
+            logger.error("No driver for %s: %s", dataset.type, exc)
+            raise DBError(f"Connections to {dataset.type} databases are not available", 500) from exc
+
+    def get_engine(self, dataset) -> Engine:
+        """
+        The engine for the dataset, created on first use
+        or if its connection details changed
+        """
+        user, password = self.credentials.get_or_set(dataset.id, dataset.get_credentials)
+        key = self._config_key(dataset, user, password)
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            entry = self._engines.pop(dataset.id, None)
+            if entry is not None and entry[0] != key:
+                stale.append(entry[1])
+                entry = None
+            engine = entry[1] if entry else None
+            for dataset_id, (_, idle_engine, last_used) in list(self._engines.items()):
+                if now - last_used > self.idle_seconds:
+                    stale.append(idle_engine)
+                    del self._engines[dataset_id]
+            if engine is None:
+                engine = self._create_engine(dataset, user, password)
+                self.created += 1
+            self._engines[dataset.id] = (key, engine, now)
+
+        self._dispose_engines(stale)
+        return engine
+
+    def _dispose_engines(self, engines:list[Engine]):
+        # Connections checked out are closed when returned
+        for engine in engines:
+            engine.dispose()
+            self.disposed += 1
+
+    def dispose(self, dataset_id:int):
+        """
+        Closes the dataset connections, and forgets its credentials
+        """
+        self.credentials.invalidate(dataset_id)
+        with self._lock:
+            entry = self._engines.pop(dataset_id, None)
+        if entry is not None:
+            self._dispose_engines([entry[1]])
+
+    def dispose_all(self):
+        self.credentials.clear()
+        with self._lock:
+            engines = [entry[1] for entry in self._engines.values()]
+            self._engines.clear()
+        self._dispose_engines(engines)
+
+    def stats(self) -> dict:
+        return {
+            "engines": len(self._engines),
+            "created": self.created,
+            "disposed": self.disposed
+        }
+
+
+dataset_engines = DatasetEngineManager()
+register_collector("dataset_engines", dataset_engines.stats)
@@ -0,0 +1,151 @@
+"""
+Periodic refresh of the containers digests.
+
+Tags are resolved to their digest when a container is added or synced,
+and task pods run by digest, so starting a task needs no registry
+request. A tag can be pushed again though, so every
+CONTAINER_DIGEST_REFRESH_MINUTES the tags resolved longer than that
+ago are resolved again, one registry client per registry. A sha is
+immutable, and only resolved if it never was.
+A tag not found anymore clears the digest, so the next task with
+that image goes through the registry check, and fails.
+
+Every backend process runs the refresher, a transaction level advisory
+lock makes sure only one of them does the work at any given time.
+"""
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import func, select
+
+from app.helpers.base_model import db
+from app.helpers.const import CONTAINER_DIGEST_REFRESH_MINUTES
+from app.helpers.container_registries import image_cache
+from app.helpers.exceptions import ContainerRegistryException
+from app.helpers.metrics import register_collector
+from app.models.container import Container
+from app.models.registry import Registry
+
+logger = logging.getLogger('digest_refresher')
+logger.setLevel(logging.INFO)
+
+# Arbitrary key of the advisory lock held while refreshing
+REFRESH_LOCK_ID = 727362
+
+
+class DigestRefresher:
+    def __init__(self, interval_minutes:int=CONTAINER_DIGEST_REFRESH_MINUTES):
+        self.interval = timedelta(minutes=interval_minutes)
+        self.app = None
+        self._thread: threading.Thread|None = None
+        self._stop = threading.Event()
+        self.runs = 0
+        self.resolved = 0
+        self.changed = 0
+        self.errors = 0
+        self.last_run_at: datetime|None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > timedelta(0)
+
+    def refresh(self) -> int:
+        """
+        Resolves the stale digests again. Must be called within an
+        app context. Returns the number of containers checked
+        """
+        session = db.session
+        locked = session.execute(select(func.pg_try_advisory_xact_lock(REFRESH_LOCK_ID))).scalar()
+        if not locked:
+            session.rollback()
+            return 0
+
+        checked = 0
+        try:
+            stale_before = datetime.now() - self.interval
+            containers: list[Container] = Container.query.join(Registry).filter(
+                Registry.active,
+                (Container.digest_resolved_at == None) | (Container.digest_resolved_at < stale_before),
+                Container.tag.isnot(None) | (
+                    (Container.digest == None) & (Container.digest_resolved_at == None)
+                )
+            ).order_by(Container.registry_id, Container.id).all()
+
+            clients = {}
+            for container in containers:
+                registry = container.registry
+                try:
+                    if registry.id not in clients:
+                        clients[registry.id] = registry.get_registry_class()
+                except ContainerRegistryException as cre:
+                    logger.warning("Skipping the digests of registry %s: %s", registry.url, cre.description)
+                    clients[registry.id] = None
+                if clients[registry.id] is None:
+                    self.errors += 1
+                    continue
+
+                previous = container.digest
+                resolved_at = container.digest_resolved_at
+                container.resolve_digest(clients[registry.id])
+                checked += 1
+                if container.digest_resolved_at == resolved_at:
+                    self.errors += 1
+                    continue
+                self.resolved += 1
+                if container.digest != previous:
+                    self.changed += 1
+                    image_cache.invalidate_prefix((registry.url, container.name))
+                    logger.info("%s now points to %s", container.full_image_name(), container.digest)
+            # Releases the lock as well
+            session.commit()
+        except:
+            session.rollback()
+            raise
+
+        self.runs += 1
+        self.last_run_at = datetime.now()
+        return checked
+
+    def _run(self):
+        while not self._stop.wait(self.interval.total_seconds()):
+            try:
+                with self.app.app_context():
+                    self.refresh()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.error("Digest refresh failed: %s", exc)
+
+    def start(self, app:Flask):
+        self.app = app
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="digest-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout:float=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "resolved": self.resolved,
+            "changed": self.changed,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None
+        }
+
+
+digest_refresher = DigestRefresher()
+register_collector("digest_refresher", digest_refresher.stats)
+
+
+def start_digest_refresher(app:Flask):
+    """
+    Starts the refresh thread, the first refresh
+    happens after a whole interval
+    """
+    digest_refresher.start(app)
+    atexit.register(digest_refresher.stop, 5)
@@ -0,0 +1,76 @@
+"""
+Shared HTTP session for the services the backend talks to
+on every request (i.e. Keycloak).
+
+requests' module-level functions open a new connection per call,
+have no timeout and never retry. PooledSession keeps connections alive
+in a bounded pool, applies default timeouts, retries transient
+failures on idempotent methods and records per-endpoint latencies.
+"""
+import re
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.helpers.metrics import Histogram
+
+# Ids in paths are replaced, so that latencies are grouped by endpoint
+ID_PATTERN = re.compile(
+    r'/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d+)(?=/|$)',
+    re.IGNORECASE
+)
+
+
+def endpoint_label(method:str, url:str) -> str:
+    """
+    Returns "METHOD /path" with query string and ids stripped
+    """
+    return f"{method.upper()} {ID_PATTERN.sub('/{id}', urlsplit(url).path)}"
+
+
+class PooledSession(requests.Session):
+    def __init__(
+            self,
+            pool_size:int=4,
+            timeout:tuple[float, float]=(5, 30),
+            retries:int=2,
+            histogram:Histogram=None
+        ):
+        """
+        :pool_size: max connections kept open per host, should match
+            the number of threads making requests
+        :timeout: default (connect, read) timeout in seconds
+        :retries: attempts on connection errors and 502/503/504 responses.
+            Non-idempotent methods (i.e. POST) are only retried
+            if the connection couldn't be established
+        :histogram: if set, request durations are recorded in it
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.histogram = histogram
+        # Sessions are shared across users' requests, never keep cookies
+        self.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            return super().request(method, url, *args, **kwargs)
+        finally:
+            if self.histogram is not None:
+                self.histogram.observe(endpoint_label(method, url), time.perf_counter() - start)
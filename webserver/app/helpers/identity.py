@@ -0,0 +1,79 @@
+"""
+Request-scoped information about the caller.
+
+The auth wrapper resolves the user once and stores an Identity
+on flask.g, so that audit, models and endpoints don't need to go
+back to Keycloak to find out who is making the request.
+"""
+from functools import partial
+from typing import Callable
+from flask import g, has_app_context
+
+from app.helpers.keycloak import Keycloak
+
+
+class Identity:
+    def __init__(
+            self,
+            id:str,
+            email:str=None,
+            username:str=None,
+            roles:set[str]=None,
+            is_admin:bool=None,
+            admin_check:Callable[[], bool]=None
+        ):
+        """
+        :is_admin: if known already (i.e. from the token claims)
+        :admin_check: callable resolving the admin flag the first
+            time it's needed, if is_admin is not provided
+        """
+        self.id = id
+        self.email = email
+        self.username = username
+        self.roles = set(roles or [])
+        self._is_admin = is_admin
+        self._admin_check = admin_check
+
+    @property
+    def is_admin(self) -> bool:
+        if self._is_admin is None:
+            self._is_admin = bool(self._admin_check()) if self._admin_check else False
+        return self._is_admin
+
+    def __repr__(self):
+        return f'<Identity {self.id}>'
+
+
+def set_identity(identity:Identity):
+    g.identity = identity
+
+
+def get_identity() -> Identity | None:
+    """
+    Returns the caller's identity, if the auth wrapper
+    has run for the current request
+    """
+    if not has_app_context():
+        return None
+    return g.get("identity")
+
+
+def current_identity() -> Identity:
+    """
+    Returns the caller's identity. If the auth wrapper didn't
+    run, it's resolved from the Authorization header with Keycloak
+    """
+    identity = get_identity()
+    if identity is None:
+        kc_client = Keycloak()
+        token = Keycloak.get_token_from_headers()
+        token_info = kc_client.decode_token(token)
+        identity = Identity(
+            id=kc_client.get_user_by_email(token_info["email"])["id"],
+            email=token_info["email"],
+            username=token_info.get("username"),
+            admin_check=partial(kc_client.is_user_admin, token)
+        )
+        if has_app_context():
+            set_identity(identity)
+    return identity
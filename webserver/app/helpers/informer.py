@@ -0,0 +1,220 @@
+"""
+Watch-based informers for the task namespace.
+
+An informer lists a resource type once, then keeps an in-memory copy
+up to date by watching it from the last seen resourceVersion. Objects
+are indexed by a few labels (task_id, job-name, result_task_id) so that
+task endpoints can look pods up without calling the API server. When
+the watch expires (410 Gone) the resource is listed again.
+Only the task namespace pods are watched: jobs and pvcs are created
+and deleted by name, and never read back.
+
+Informers are opt-in (TASK_INFORMER=enabled). Callers should check
+`ready` and fall back to the API when it's False.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from kubernetes.client.exceptions import ApiException
+from kubernetes.watch import Watch
+from urllib3.exceptions import HTTPError
+
+from app.helpers.const import TASK_NAMESPACE
+from app.helpers.metrics import register_collector
+
+logger = logging.getLogger('informer')
+logger.setLevel(logging.INFO)
+
+INDEXED_LABELS = ("task_id", "job-name", "result_task_id")
+WATCH_TIMEOUT = 300
+RETRY_BACKOFF = 5
+
+
+class Informer:
+    def __init__(
+            self,
+            kind:str,
+            list_func:Callable=None,
+            namespace:str=TASK_NAMESPACE,
+            index_labels:tuple=INDEXED_LABELS
+        ):
+        self.kind = kind
+        self.list_func = list_func
+        self.namespace = namespace
+        self.index_labels = index_labels
+        self.resource_version = None
+        self._objects: dict[str, Any] = {}
+        self._indexes: dict[str, dict[str, set[str]]] = {label: {} for label in index_labels}
+        self._changed = threading.Condition()
+        self._synced = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._handlers: list[Callable[[str, Any], None]] = []
+        self.events = 0
+        self.relists = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._synced.is_set() and self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"informer-{self.kind}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._synced.clear()
+
+    def add_handler(self, handler:Callable[[str, Any], None]):
+        """
+        handler is called with (event type, object) for every
+        change. After a list, every object is passed as ADDED
+        """
+        self._handlers.append(handler)
+
+    def _notify(self, event_type:str, obj:Any):
+        for handler in self._handlers:
+            try:
+                handler(event_type, obj)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.error("%s informer handler failed: %s", self.kind, exc)
+
+    def wait_for_sync(self, timeout:float=None) -> bool:
+        return self._synced.wait(timeout)
+
+    def by_label(self, label:str, value:str) -> list:
+        """
+        Returns the objects with the given label value
+        """
+        with self._changed:
+            names = self._indexes[label].get(value, ())
+            return [self._objects[name] for name in names]
+
+    def wait_for(self, label:str, value:str, condition:Callable[[list], bool], timeout:float) -> bool:
+        """
+        Blocks until condition holds for the objects with the given
+        label value. Returns False if the timeout expired first
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while not condition(self.by_label(label, value)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
+
+    def stats(self) -> dict:
+        return {
+            "objects": len(self._objects),
+            "events": self.events,
+            "relists": self.relists,
+            "resource_version": self.resource_version,
+            "ready": self.ready
+        }
+
+    def _index(self, name:str, obj:Any, add:bool=True):
+        labels = obj.metadata.labels or {}
+        for label in self.index_labels:
+            value = labels.get(label)
+            if value is None:
+                continue
+            names = self._indexes[label].setdefault(value, set())
+            if add:
+                names.add(name)
+            else:
+                names.discard(name)
+                if not names:
+                    del self._indexes[label][value]
+
+    def replace(self, items:list, resource_version:str):
+        """
+        Replaces the whole store, i.e. after a list call
+        """
+        with self._changed:
+            self._objects = {}
+            self._indexes = {label: {} for label in self.index_labels}
+            for obj in items:
+                self._objects[obj.metadata.name] = obj
+                self._index(obj.metadata.name, obj)
+            self.resource_version = resource_version
+            self._changed.notify_all()
+        for obj in items:
+            self._notify("ADDED", obj)
+
+    def apply(self, event_type:str, obj:Any):
+        """
+        Applies a single watch event to the store
+        """
+        name = obj.metadata.name
+        with self._changed:
+            self.events += 1
+            if obj.metadata.resource_version:
+                self.resource_version = obj.metadata.resource_version
+            if event_type == "BOOKMARK":
+                return
+
+            previous = self._objects.pop(name, None)
+            if previous is not None:
+                self._index(name, previous, add=False)
+            if event_type in ("ADDED", "MODIFIED"):
+                self._objects[name] = obj
+                self._index(name, obj)
+            self._changed.notify_all()
+        self._notify(event_type, obj)
+
+    def _list(self):
+        response = self.list_func(self.namespace)
+        self.replace(response.items, response.metadata.resource_version)
+        self.relists += 1
+        self._synced.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.resource_version is None:
+                    self._list()
+                watcher = Watch()
+                for event in watcher.stream(
+                    self.list_func,
+                    self.namespace,
+                    resource_version=self.resource_version,
+                    allow_watch_bookmarks=True,
+                    timeout_seconds=WATCH_TIMEOUT
+                ):
+                    if self._stop.is_set():
+                        watcher.stop()
+                        break
+                    self.apply(event["type"], event["object"])
+            except ApiException as apie:
+                if apie.status == 410:
+                    # The resourceVersion is too old, start over with a list
+                    logger.info("%s watch expired, listing again", self.kind)
+                    self.resource_version = None
+                    continue
+                logger.error("%s informer failed: %s", self.kind, apie.reason)
+                self._stop.wait(RETRY_BACKOFF)
+            except (HTTPError, OSError) as exc:
+                logger.error("%s informer lost the connection: %s", self.kind, exc)
+                self._stop.wait(RETRY_BACKOFF)
+
+
+pod_informer = Informer("pods")
+register_collector("pods_informer", pod_informer.stats)
+
+
+def start_informers():
+    """
+    Starts the pod informer on the task namespace.
+    The client is only created here, as it loads the cluster config
+    """
+    # pylint: disable=import-outside-toplevel
+    from app.helpers.kubernetes import KubernetesClient
+
+    pod_informer.list_func = KubernetesClient().list_namespaced_pod
+    pod_informer.start()
@@ -3,12 +3,20 @@ import logging
 import os
 import random
 import re
+import threading
+import time
+import jwt
 import requests
 from base64 import b64encode
+from copy import deepcopy
+from functools import wraps
 from flask import request
 
+from app.helpers.cache import TTLCache
 from app.helpers.exceptions import AuthenticationError, UnauthorizedError, KeycloakError
 from app.helpers.const import PASS_GENERATOR_SET
+from app.helpers.http_session import PooledSession
+from app.helpers.metrics import Histogram, register_collector
 
 logger = logging.getLogger('keycloak_helper')
 logger.setLevel(logging.INFO)
@@ -20,10 +28,28 @@ KEYCLOAK_CLIENT = os.getenv("KEYCLOAK_CLIENT", "global")
 KEYCLOAK_SECRET = os.getenv("KEYCLOAK_SECRET")
 KEYCLOAK_ADMIN = os.getenv("KEYCLOAK_ADMIN")
 KEYCLOAK_ADMIN_PASSWORD = os.getenv("KEYCLOAK_ADMIN_PASSWORD")
+# "introspection" (default) asks Keycloak to validate every token,
+# "local" verifies signed access tokens against the realm's JWKS
+KEYCLOAK_TOKEN_VERIFICATION = os.getenv("KEYCLOAK_TOKEN_VERIFICATION", "introspection")
+KEYCLOAK_TOKEN_ISSUER = os.getenv("KEYCLOAK_TOKEN_ISSUER")
+KEYCLOAK_JWKS_TTL = int(os.getenv("KEYCLOAK_JWKS_TTL", "3600"))
+# Seconds before expiry the shared admin token is renewed
+KEYCLOAK_TOKEN_REFRESH_MARGIN = int(os.getenv("KEYCLOAK_TOKEN_REFRESH_MARGIN", "30"))
+# How long the global client id and secret are reused before being fetched again
+KEYCLOAK_CLIENT_CREDENTIALS_TTL = int(os.getenv("KEYCLOAK_CLIENT_CREDENTIALS_TTL", "3600"))
+# Client ids, secrets, roles, resources, scopes and policies lookups
+KEYCLOAK_METADATA_CACHE_TTL = int(os.getenv("KEYCLOAK_METADATA_CACHE_TTL", "300"))
+KEYCLOAK_METADATA_CACHE_SIZE = int(os.getenv("KEYCLOAK_METADATA_CACHE_SIZE", "1024"))
+# Connections kept open to Keycloak, defaults to waitress' default threads count
+KEYCLOAK_POOL_SIZE = int(os.getenv("KEYCLOAK_POOL_SIZE", "4"))
+KEYCLOAK_CONNECT_TIMEOUT = float(os.getenv("KEYCLOAK_CONNECT_TIMEOUT", "5"))
+KEYCLOAK_READ_TIMEOUT = float(os.getenv("KEYCLOAK_READ_TIMEOUT", "30"))
+KEYCLOAK_MAX_RETRIES = int(os.getenv("KEYCLOAK_MAX_RETRIES", "2"))
 URLS = {
     "health_check": f"{KEYCLOAK_URL}/realms/master",
     "get_token": f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/token",
     "validate": f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/token/introspect",
+    "certs": f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/certs",
     "client": f"{KEYCLOAK_URL}/admin/realms/{REALM}/clients",
     "client_secret": f"{KEYCLOAK_URL}/admin/realms/{REALM}/clients/%s/client-secret",
     "client_exchange": f"{KEYCLOAK_URL}/admin/realms/{REALM}/clients/%s/management/permissions",
@@ -39,12 +65,277 @@ URLS = {
     "user_reset": f"{KEYCLOAK_URL}/admin/realms/{REALM}/users/%s/reset-password"
 }
 
+
+class KeycloakSession(PooledSession):
+    """
+    Pooled session that reports Keycloak being unreachable as a
+    KeycloakError, rather than an unhandled exception.
+    Requests made with the shared admin token are retried once
+    with a new one if Keycloak rejects it
+    """
+    def _send(self, method, url, *args, **kwargs):
+        try:
+            return super().request(method, url, *args, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+            logger.error("%s %s failed: %s", method, url, exc)
+            raise KeycloakError("Keycloak is not reachable", 503) from exc
+
+    def request(self, method, url, *args, **kwargs):
+        response = self._send(method, url, *args, **kwargs)
+        headers = kwargs.get("headers") or {}
+        token = headers.get("Authorization", "").removeprefix("Bearer ")
+        if response.status_code != 401 or not token:
+            return response
+
+        # i.e. the admin session was revoked, or Keycloak restarted
+        new_token = token_manager.renew_admin_token(token)
+        if new_token is None:
+            return response
+        logger.info("Admin token rejected, retrying %s %s with a new one", method, url)
+        kwargs["headers"] = {**headers, "Authorization": f"Bearer {new_token}"}
+        return self._send(method, url, *args, **kwargs)
+
+
+keycloak_latency = Histogram()
+register_collector("keycloak_requests", keycloak_latency.collect)
+session = KeycloakSession(
+    pool_size=KEYCLOAK_POOL_SIZE,
+    timeout=(KEYCLOAK_CONNECT_TIMEOUT, KEYCLOAK_READ_TIMEOUT),
+    retries=KEYCLOAK_MAX_RETRIES,
+    histogram=keycloak_latency
+)
+
+# Asymmetric algorithms Keycloak signs access tokens with.
+# Refresh tokens are HS-signed with a realm secret and can't be verified locally
+LOCAL_VERIFICATION_ALGORITHMS = ["RS256", "RS384", "RS512", "PS256", "PS384", "PS512", "ES256", "ES384", "ES512"]
+# Minimum seconds between two JWKS refetches triggered by an unknown kid,
+# so a flood of forged tokens can't hammer Keycloak
+JWKS_MIN_REFRESH_INTERVAL = 10
+
+
+class JWKSCache:
+    """
+    Thread-safe in-memory copy of the realm's signing keys.
+    Keys are fetched once, kept for KEYCLOAK_JWKS_TTL seconds, and refetched
+    early when a token comes with a kid we haven't seen (key rotation).
+    """
+    def __init__(self, url:str=None, ttl:int=KEYCLOAK_JWKS_TTL):
+        self.url = url or URLS["certs"]
+        self.ttl = ttl
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        resp = session.get(self.url)
+        if not resp.ok:
+            logger.info(resp.content.decode())
+            raise KeycloakError("Failed to fetch the realm signing keys")
+
+        keys = {}
+        for jwk in resp.json().get("keys", []):
+            # Skip encryption keys and the ones pyjwt can't load
+            if jwk.get("use", "sig") != "sig" or not jwk.get("kid"):
+                continue
+            try:
+                keys[jwk["kid"]] = jwt.PyJWK.from_dict(jwk)
+            except jwt.PyJWTError as exc:
+                logger.info("Skipping JWK %s: %s", jwk.get("kid"), exc)
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    def get_key(self, kid:str) -> jwt.PyJWK:
+        """
+        Returns the signing key for the given kid, refreshing the
+        local copy if expired or if the kid is unknown
+        """
+        with self._lock:
+            age = time.monotonic() - self._fetched_at
+            if not self._keys or age > self.ttl:
+                self._fetch()
+            elif kid not in self._keys and age > JWKS_MIN_REFRESH_INTERVAL:
+                self._fetch()
+
+            if kid not in self._keys:
+                raise AuthenticationError("Token signed with an unknown key")
+            return self._keys[kid]
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = 0.0
+
+
+jwks_cache = JWKSCache()
+
+
+def verify_access_token(token:str) -> dict | None:
+    """
+    Validates the token signature, expiration and issuer against
+    the realm's public keys, without contacting Keycloak (besides the
+    occasional JWKS refresh).
+
+    Returns the token claims, or None if the token can't be verified
+    locally (i.e. a refresh token), in which case the caller should
+    fall back to the introspection flow.
+
+    Raises AuthenticationError if the token is invalid or expired
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError as exc:
+        raise AuthenticationError("Token is malformed") from exc
+
+    if header.get("alg") not in LOCAL_VERIFICATION_ALGORITHMS or not header.get("kid"):
+        return None
+
+    key = jwks_cache.get_key(header["kid"])
+    try:
+        claims = jwt.decode(
+            token,
+            key=key,
+            algorithms=LOCAL_VERIFICATION_ALGORITHMS,
+            issuer=KEYCLOAK_TOKEN_ISSUER,
+            options={
+                "verify_aud": False,
+                "verify_iss": bool(KEYCLOAK_TOKEN_ISSUER),
+                "require": ["exp", "iat", "sub"]
+            },
+            leeway=5
+        )
+    except jwt.ExpiredSignatureError as exc:
+        raise AuthenticationError("Token expired. Validation failed") from exc
+    except jwt.PyJWTError as exc:
+        raise AuthenticationError("Token is not valid") from exc
+
+    # ID tokens and other signed tokens are not accepted as credentials
+    if claims.get("typ", "Bearer") != "Bearer":
+        return None
+    return claims
+
+
+class TokenManager:
+    """
+    Process-wide, thread-safe holder of the admin-cli token and of
+    the global client's id and secret, so that instantiating a Keycloak
+    object doesn't need any request in the steady state.
+    Values are fetched through the callables passed by the Keycloak
+    instance, only when missing or about to expire. The lock is held
+    while fetching, so concurrent threads wait for a single refresh.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._admin_token = None
+        self._admin_expires_at = 0.0
+        self._admin_fetch = None
+        # Last admin token dropped after Keycloak rejected it
+        self._rejected_admin_token = None
+        self._clients: dict[str, tuple[str, str, float]] = {}
+
+    def get_admin_token(self, fetch=None) -> str:
+        """
+        :fetch: callable returning Keycloak's token response body,
+            the last one passed is used if omitted
+        """
+        with self._lock:
+            if fetch is not None:
+                self._admin_fetch = fetch
+            if self._admin_token is None or time.monotonic() >= self._admin_expires_at:
+                token_resp = self._admin_fetch()
+                # Keycloak always sends it, default to a short life otherwise
+                expires_in = token_resp.get("expires_in", 60)
+                self._admin_token = token_resp["access_token"]
+                self._admin_expires_at = time.monotonic() + max(expires_in - KEYCLOAK_TOKEN_REFRESH_MARGIN, 0)
+            return self._admin_token
+
+    def get_client_credentials(self, client_name:str, fetch) -> tuple[str, str]:
+        """
+        :fetch: callable returning the (client id, client secret) tuple
+        """
+        with self._lock:
+            cached = self._clients.get(client_name)
+            if cached is None or time.monotonic() >= cached[2]:
+                client_id, client_secret = fetch()
+                cached = (client_id, client_secret, time.monotonic() + KEYCLOAK_CLIENT_CREDENTIALS_TTL)
+                self._clients[client_name] = cached
+            return cached[0], cached[1]
+
+    def _drop(self):
+        self._admin_token = None
+        self._admin_expires_at = 0.0
+        self._clients = {}
+
+    def invalidate(self):
+        """
+        Drops everything, the next Keycloak instance will fetch
+        fresh values
+        """
+        with self._lock:
+            self._drop()
+
+    def renew_admin_token(self, rejected:str) -> str|None:
+        """
+        Called when Keycloak answered 401 to a request made with the
+        rejected token. If it's the shared admin token, everything is
+        invalidated, and the admin token to retry with is returned.
+        Returns None for any other token
+        """
+        with self._lock:
+            if self._admin_fetch is None:
+                return None
+            if rejected == self._admin_token:
+                self._drop()
+                self._rejected_admin_token = rejected
+            elif rejected != self._rejected_admin_token:
+                return None
+        # Renewed already if another thread got there first
+        return self.get_admin_token()
+
+
+token_manager = TokenManager()
+
+metadata_cache = TTLCache(maxsize=KEYCLOAK_METADATA_CACHE_SIZE, ttl=KEYCLOAK_METADATA_CACHE_TTL)
+register_collector("keycloak_metadata_cache", metadata_cache.stats)
+
+
+def cached_metadata(kind:str, client_attr:str=None, default_attr:str=None):
+    """
+    Caches the result of a Keycloak getter in metadata_cache.
+    The key is made of realm, client (the instance's client_attr value,
+    None for realm-wide entities), kind and the name passed to the getter,
+    or the instance's default_attr value if omitted.
+    Failures are not cached, and a copy is returned so callers
+    can modify it freely.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, name=None):
+            if name is None and default_attr:
+                name = getattr(self, default_attr)
+            client = getattr(self, client_attr) if client_attr else None
+            return deepcopy(metadata_cache.get_or_set(
+                (REALM, client, kind, name),
+                lambda: func(self, name)
+            ))
+        return wrapper
+    return decorator
+
+
 class Keycloak:
     def __init__(self, client='global') -> None:
         self.client_name = client
         self.admin_token = self.get_admin_token()
-        self.client_id = self.get_client_id()
-        self.client_secret = self._get_client_secret()
+        if client == KEYCLOAK_CLIENT:
+            self.client_id, self.client_secret = token_manager.get_client_credentials(
+                client, self._fetch_client_credentials
+            )
+        else:
+            self.client_id = self.get_client_id()
+            self.client_secret = self._get_client_secret()
+
+    def _fetch_client_credentials(self) -> tuple[str, str]:
+        client_id = self.get_client_id()
+        return client_id, self._get_client_secret(client_id)
 
     @classmethod
     def get_token_from_headers(cls) -> str:
@@ -62,17 +353,22 @@ class Keycloak:
             "Content-Type": "application/json"
         }
 
-    def exchange_global_token(self, token:str, type:str="access_token") -> str:
+    def exchange_global_token(self, token:str, type:str="access_token", token_type:str="refresh_token") -> str:
         """
         Token exchange across clients. From global to the instanced one
+        :token_type: the type of the token passed, if it's already an access
+            token, the refresh step is skipped
         """
+        if token_type == "access_token":
+            return self._exchange_access_token(token, type)
+
         acpayload = {
             'client_secret': KEYCLOAK_SECRET,
             'client_id': KEYCLOAK_CLIENT,
             'grant_type': 'refresh_token',
             'refresh_token': token
         }
-        ac_resp = requests.post(
+        ac_resp = session.post(
             URLS["get_token"],
             data=acpayload,
             headers={
@@ -82,8 +378,12 @@ class Keycloak:
         if not ac_resp.ok:
             logger.error(ac_resp.text)
             raise KeycloakError("Cannot get an access token")
-        access_token = ac_resp.json()["access_token"]
+        return self._exchange_access_token(ac_resp.json()["access_token"], type)
 
+    def _exchange_access_token(self, access_token:str, type:str="access_token") -> str:
+        """
+        Exchanges a global access token for one issued to the instanced client
+        """
         payload = {
             'client_secret': KEYCLOAK_SECRET,
             'client_id': KEYCLOAK_CLIENT,
@@ -92,7 +392,7 @@ class Keycloak:
             'subject_token': access_token,
             'audience': self.client_name
         }
-        exchange_resp = requests.post(
+        exchange_resp = session.post(
             URLS["get_token"],
             data=payload,
             headers={
@@ -118,7 +418,7 @@ class Keycloak:
             'requested_subject': user_id,
             'audience': KEYCLOAK_CLIENT
         }
-        exchange_resp = requests.post(
+        exchange_resp = session.post(
             URLS["get_token"],
             data=payload,
             headers={
@@ -139,6 +439,7 @@ class Keycloak:
         """
         return response.status_code == 409 or response.ok
 
+    @cached_metadata("client_secret", default_attr="client_id")
     def _get_client_secret(self, client_id:str=None) -> str:
         """
         Given the client id, fetches the client's secret if has one.
@@ -146,7 +447,7 @@ class Keycloak:
         if not client_id:
             client_id = self.client_id
 
-        secret_resp = requests.get(
+        secret_resp = session.get(
             URLS["client_secret"] % client_id,
             headers={
                 "Authorization": f"Bearer {self.admin_token}"
@@ -178,7 +479,7 @@ class Keycloak:
                 'password': password
             }
 
-        response_auth = requests.post(
+        response_auth = session.post(
             URLS["get_token"],
             data=payload,
             headers={
@@ -202,7 +503,7 @@ class Keycloak:
         """
         Given a token checks if the owner is an Admin or SuperAdmin
         """
-        response_auth = requests.post(
+        response_auth = session.post(
             URLS["validate"],
             data={
                 "client_secret": self.client_secret,
@@ -234,7 +535,15 @@ class Keycloak:
 
     def get_admin_token(self) -> str:
         """
-        Get administrative level token
+        Get administrative level token, shared across instances
+        until it's close to expire
+        """
+        return token_manager.get_admin_token(self._request_admin_token)
+
+    def _request_admin_token(self) -> dict:
+        """
+        Logs in with the admin-cli client, returning the whole
+        token response, so the expiration is known
         """
         payload = {
             'client_id': 'admin-cli',
@@ -242,7 +551,11 @@ class Keycloak:
             'username': KEYCLOAK_ADMIN,
             'password': KEYCLOAK_ADMIN_PASSWORD
         }
-        return self.get_token(token_type='access_token', payload=payload)
+        response_auth = self.get_token(payload=payload, raise_on_temp_pass=False)
+        if not response_auth.ok:
+            logger.info(response_auth.content.decode())
+            raise AuthenticationError("Failed to login")
+        return response_auth.json()
 
     def is_token_valid(self, token:str, scope:str, resource:str, tok_type='refresh_token', with_permissions:bool=True) -> bool:
         """
@@ -250,7 +563,7 @@ class Keycloak:
         """
         is_access_token = tok_type == 'access_token'
         if is_access_token:
-            response_auth = requests.post(
+            response_auth = session.post(
                 URLS["validate"],
                 data={
                     "client_secret": self.client_secret,
@@ -262,7 +575,7 @@ class Keycloak:
                 }
             )
         else:
-            response_auth = requests.post(
+            response_auth = session.post(
                 URLS["get_token"],
                 data={
                     "client_secret": self.client_secret,
@@ -285,7 +598,7 @@ class Keycloak:
         """
         b64_auth = b64encode(f"{self.client_name}:{self.client_secret}".encode()).decode()
         token = self._access_from_refresh(token)
-        response_validate = requests.post(
+        response_validate = session.post(
             URLS["validate"],
             data=f"token={token}",
             headers={
@@ -297,6 +610,7 @@ class Keycloak:
             return response_validate.json()
         raise AuthenticationError("Token expired. Validation failed")
 
+    @cached_metadata("client_id", default_attr="client_name")
     def get_client_id(self, client_name=None) -> str:
         """
         Get a give Keycloak client id, if not provided, the instanced
@@ -308,7 +622,7 @@ class Keycloak:
         if client_name is None:
             client_name = self.client_name
 
-        client_id_resp = requests.get(
+        client_id_resp = session.get(
             URLS["client"],
             params = {"clientId": client_name},
             headers=headers
@@ -344,7 +658,7 @@ class Keycloak:
             'Content-Type': 'application/x-www-form-urlencoded',
         }
 
-        request_perm = requests.post(
+        request_perm = session.post(
             URLS["get_token"],
             data={
                 "grant_type": "urn:ietf:params:oauth:grant-type:uma-ticket",
@@ -359,6 +673,7 @@ class Keycloak:
             raise UnauthorizedError("User is not authorized")
         return True
 
+    @cached_metadata("role")
     def get_role(self, role_name:str) -> dict[str, str]:
         """
         Get the realm roles.
@@ -367,7 +682,7 @@ class Keycloak:
 
         Raises a specific exception if not found
         """
-        realm_resp = requests.get(
+        realm_resp = session.get(
             URLS["roles"] + f"/{role_name}",
             headers={
                 'Authorization': f'Bearer {self.admin_token}',
@@ -383,11 +698,12 @@ class Keycloak:
                 logger.info(realm_resp.content.decode())
                 raise KeycloakError("Failed to fetch roles")
 
+    @cached_metadata("resource", client_attr="client_id")
     def get_resource(self, resource_name:str) -> dict:
         headers={
             'Authorization': f'Bearer {self.admin_token}'
         }
-        response_res = requests.get(
+        response_res = session.get(
             URLS["resource"] % self.client_id,
             params={
                 "name": resource_name
@@ -418,15 +734,17 @@ class Keycloak:
         headers={
             'Authorization': f'Bearer {self.admin_token}'
         }
-        response_res = requests.put(
+        response_res = session.put(
             (URLS["resource"] % self.client_id) + f"/{resource["_id"]}",
             json=resource,
             headers=headers
         )
+        self._invalidate_metadata("resource", resource_name, kwargs.get("name"))
         if not response_res.ok:
             logger.info(response_res.content.decode())
             raise KeycloakError("Failed to patch the resource")
 
+    @cached_metadata("policy", client_attr="client_id")
     def get_policy(self, name:str) -> dict:
         """
         Given a name and (optional) reosource (global or dataset specific)
@@ -435,7 +753,7 @@ class Keycloak:
         headers={
             'Authorization': f'Bearer {self.admin_token}'
         }
-        policy_response = requests.get(
+        policy_response = session.get(
             URLS["policies"] % self.client_id,
             params={"name": name, "permission": False},
             headers=headers
@@ -446,6 +764,7 @@ class Keycloak:
 
         return policy_response.json()[0]
 
+    @cached_metadata("scope", client_attr="client_id")
     def get_scope(self, name:str) -> dict:
         """
         Given a name and (optional) reosource (global or dataset specific)
@@ -454,7 +773,7 @@ class Keycloak:
         headers={
             'Authorization': f'Bearer {self.admin_token}'
         }
-        scope_response = requests.get(
+        scope_response = session.get(
             URLS["scopes"] % self.client_id,
             params={
                 "permission": False,
@@ -468,13 +787,61 @@ class Keycloak:
 
         return scope_response.json()[0]
 
+    def get_scopes(self, names:list[str]) -> list[dict]:
+        """
+        Batch version of get_scope. Whatever is not cached already
+        is fetched with a single request listing all the client's scopes.
+        Returns the scopes in the same order as names
+        """
+        scopes = {}
+        for name in names:
+            cached = metadata_cache.get((REALM, self.client_id, "scope", name))
+            if cached is not None:
+                scopes[name] = cached
+
+        missing = [name for name in names if name not in scopes]
+        if missing:
+            scope_response = session.get(
+                URLS["scopes"] % self.client_id,
+                params={
+                    "permission": False,
+                    "max": -1
+                },
+                headers={
+                    'Authorization': f'Bearer {self.admin_token}'
+                }
+            )
+            if not scope_response.ok:
+                logger.info(scope_response.content.decode())
+                raise KeycloakError("Error when fetching the scopes from Keycloak")
+
+            for scope in scope_response.json():
+                metadata_cache.set((REALM, self.client_id, "scope", scope["name"]), scope)
+                if scope["name"] in missing:
+                    scopes[scope["name"]] = scope
+
+            not_found = [name for name in missing if name not in scopes]
+            if not_found:
+                raise KeycloakError(f"Scopes {", ".join(not_found)} not found")
+
+        return [deepcopy(scopes[name]) for name in names]
+
+    def _invalidate_metadata(self, kind:str, *names:str):
+        """
+        Drops cached entries for the instanced client, used after
+        this module changes them on Keycloak
+        """
+        for name in names:
+            if name:
+                metadata_cache.invalidate((REALM, self.client_id, kind, name))
+
     def create_client(self, client_name:str, token_lifetime:int) -> dict:
         """
         Create a new client for a given project. If it exist already,
             return that one
         : token_lifetime : time in seconds for the
         """
-        client_post_rest = requests.post(
+        client_post_rest = session.post(
             URLS['client'],
             json={
                 "clientId": client_name,
@@ -495,7 +862,7 @@ class Keycloak:
             logger.info(client_post_rest.content.decode())
             raise KeycloakError("Failed to create a project")
 
-        update_req = requests.put(
+        update_req = session.put(
             URLS["client_auth"] % self.get_client_id(client_name),
             json={
                 "decisionStrategy": "AFFIRMATIVE",
@@ -512,7 +879,7 @@ class Keycloak:
         """
         Create a custom scope for the instanced client
         """
-        scope_post_rest = requests.post(
+        scope_post_rest = session.post(
             URLS["scopes"] % self.client_id,
             json={"name": scope_name},
             headers=self._post_json_headers()
@@ -529,7 +896,7 @@ class Keycloak:
         """
         Creates a custom policy for a resource
         """
-        policy_response = requests.post(
+        policy_response = session.post(
             (URLS["policies"] % self.client_id) + policy_type,
             json=payload,
             headers=self._post_json_headers()
@@ -554,11 +921,12 @@ class Keycloak:
         if current_policy.get("config"):
             current_policy["config"]["noa"] = payload['notOnOrAfter']
             current_policy["config"]["nbf"] = payload['notBefore']
-            policy_response = requests.put(
+            policy_response = session.put(
                 (URLS["policies"] % self.client_id) + "/" + current_policy["id"],
                 json=current_policy,
                 headers=self._post_json_headers()
             )
+            self._invalidate_metadata("policy", payload["name"])
             if not policy_response.ok:
                 logger.info(policy_response.content.decode())
                 raise KeycloakError("Failed to create a project's policy")
@@ -569,11 +937,12 @@ class Keycloak:
         payload["owner"] = {
             "id": self.client_id, "name": client_name
         }
-        resource_response = requests.post(
+        resource_response = session.post(
             URLS["resource"] % self.client_id,
             json=payload,
             headers=self._post_json_headers()
         )
+        self._invalidate_metadata("resource", payload["name"])
         if resource_response.status_code == 409:
             return self.get_resource(payload["name"])
         elif not resource_response.ok:
@@ -583,7 +952,7 @@ class Keycloak:
         return resource_response.json()
 
     def create_permission(self, payload:dict) -> dict:
-        permission_response = requests.post(
+        permission_response = session.post(
             URLS["permission"] % self.client_id,
             json=payload,
             headers=self._post_json_headers()
@@ -608,7 +977,7 @@ class Keycloak:
         # Make sure the role exists before creating the user
         role = self.get_role(kwargs.get("role", "Users"))
 
-        user_response = requests.post(
+        user_response = session.post(
             URLS["user"],
             json={
                 "firstName": kwargs.get("firstName", ""),
@@ -649,7 +1018,7 @@ class Keycloak:
         """
         if isinstance(role, str):
             role = self.get_role(role)
-        user_role_response = requests.post(
+        user_role_response = session.post(
             URLS["user_role"] % user_id,
             json=[role],
             headers=self._post_json_headers()
@@ -662,7 +1031,7 @@ class Keycloak:
         """
         Method to return a dictionary representing a Keycloak user
         """
-        user_response = requests.get(
+        user_response = session.get(
             URLS["user"],
             headers={"Authorization": f"Bearer {self.admin_token}"}
         )
@@ -690,7 +1059,7 @@ class Keycloak:
         """
         Method to return a dictionary representing a Keycloak user
         """
-        user_response = requests.get(
+        user_response = session.get(
             URLS["user"],
             params= {
                 "username": username,
@@ -708,7 +1077,7 @@ class Keycloak:
         Method to return a dictionary representing a Keycloak user,
         using their email
         """
-        user_response = requests.get(
+        user_response = session.get(
             URLS["user"],
             params= {
                 "email": email,
@@ -726,7 +1095,7 @@ class Keycloak:
         Method to return a dictionary representing a Keycloak user,
         using their id
         """
-        user_response = requests.get(
+        user_response = session.get(
             f"{URLS["user"]}/{user_id}",
             headers={"Authorization": f"Bearer {self.admin_token}"}
         )
@@ -739,7 +1108,7 @@ class Keycloak:
         """
         From a user id, get all of their realm roles
         """
-        role_response = requests.get(
+        role_response = session.get(
             URLS["user_role"] % user_id,
             headers={"Authorization": f"Bearer {self.admin_token}"}
         )
@@ -765,7 +1134,7 @@ class Keycloak:
         if not re.match("Account is not fully set up", auth_user.json().get("error_description", "")):
             raise AuthenticationError("Incorrect credentials")
 
-        res_pass_resp = requests.put(
+        res_pass_resp = session.put(
             URLS["user_reset"] % user_id,
             json={
                 "type": "password",
@@ -783,7 +1152,7 @@ class Keycloak:
         Method to automate the setup for this client to
         allow token exchange on behalf of a user for admin-level
         """
-        client_permission_resp = requests.put(
+        client_permission_resp = session.put(
             URLS["client_exchange"] % self.client_id,
             json={"enabled": True},
             headers = self._post_json_headers()
@@ -795,7 +1164,7 @@ class Keycloak:
         global_client_id = self.get_client_id('global')
 
         # Fetching the token exchange scope
-        client_te_scope_resp = requests.get(
+        client_te_scope_resp = session.get(
             URLS["scopes"] % rm_client_id,
             params = {
                 "permission": False,
@@ -809,7 +1178,7 @@ class Keycloak:
             raise KeycloakError("Error on keycloak")
 
         token_exch_scope = client_te_scope_resp.json()[0]["id"]
-        resource_scope_resp = requests.get(
+        resource_scope_resp = session.get(
             URLS["resource"] % rm_client_id,
             params = {
                 "name": f"client.resource.{self.client_id}"
@@ -821,7 +1190,7 @@ class Keycloak:
         resource_id = resource_scope_resp.json()[0]["_id"]
 
         # Create a custom client exchange policy
-        global_client_policy_resp = requests.post(
+        global_client_policy_resp = session.post(
             (URLS["policies"] % rm_client_id) + "/client",
             json={
                 "name": f"token-exchange-{self.client_name}",
@@ -831,7 +1200,7 @@ class Keycloak:
             headers = self._post_json_headers()
         )
         if global_client_policy_resp.status_code == 409:
-            global_policy_id = requests.get(
+            global_policy_id = session.get(
                 (URLS["policies"] % rm_client_id) + "/client",
                 params = {
                     "name": f"token-exchange-{self.client_name}"
@@ -845,7 +1214,7 @@ class Keycloak:
             global_policy_id = global_client_policy_resp.json()["id"]
 
         token_exch_name = f"token-exchange.permission.client.{self.client_id}"
-        token_exch_permission_resp = requests.get(
+        token_exch_permission_resp = session.get(
             URLS["permission"] % rm_client_id,
             params = {
                 "name": token_exch_name
@@ -856,7 +1225,7 @@ class Keycloak:
         )
         token_exch_permission_id = token_exch_permission_resp.json()[0]["id"]
         # Updating the permission
-        client_permission_resp = requests.put(
+        client_permission_resp = session.put(
             (URLS["permission"] % rm_client_id) + f"/{token_exch_permission_id}",
             json={
                 "name": token_exch_name,
@@ -3,27 +3,63 @@ import os
 import logging
 import shutil
 import tarfile
+import threading
 from tempfile import TemporaryFile
+from typing import Iterator
 from kubernetes import client, config
 from kubernetes.stream import stream
 from kubernetes.client.exceptions import ApiException
 from kubernetes.watch import Watch
 from app.helpers.exceptions import InvalidRequest, KubernetesException
-from app.helpers.const import ALPINE_IMAGE, TASK_NAMESPACE
+from app.helpers.const import ALPINE_IMAGE, KUBERNETES_POOL_SIZE, TASK_NAMESPACE
+from app.helpers.informer import pod_informer
 
 logger = logging.getLogger('kubernetes_helper')
 logger.setLevel(logging.INFO)
 
 
+_api_client: client.ApiClient | None = None
+_api_client_lock = threading.Lock()
+
+
+def get_api_client() -> client.ApiClient:
+    """
+    Process-wide ApiClient, so the cluster config is loaded once and
+    all the API classes share the same connection pool.
+    ApiClient is thread safe as long as its default headers are not changed,
+    use the _content_type argument on the single calls instead
+    """
+    global _api_client  # pylint: disable=global-statement
+    if _api_client is None:
+        with _api_client_lock:
+            if _api_client is None:
+                configuration = client.Configuration()
+                if os.getenv('KUBERNETES_SERVICE_HOST'):
+                    # Get configuration for an in-cluster setup
+                    config.load_incluster_config(client_configuration=configuration)
+                else:
+                    # Get config from outside the cluster. Mostly DEV
+                    config.load_kube_config(client_configuration=configuration)
+                # One connection per concurrent request thread at least
+                configuration.connection_pool_maxsize = KUBERNETES_POOL_SIZE
+                _api_client = client.ApiClient(configuration)
+    return _api_client
+
+
+def reset_api_client():
+    """
+    Drops the shared client, the next one will reload the config
+    """
+    global _api_client  # pylint: disable=global-statement
+    with _api_client_lock:
+        if _api_client is not None:
+            _api_client.close()
+        _api_client = None
+
+
 class KubernetesBase:
     def __init__(self) -> None:
-        if os.getenv('KUBERNETES_SERVICE_HOST'):
-            # Get configuration for an in-cluster setup
-            config.load_incluster_config()
-        else:
-            # Get config from outside the cluster. Mostly DEV
-            config.load_kube_config()
-        super().__init__()
+        super().__init__(api_client=get_api_client())
 
     @classmethod
     def encode_secret_value(cls, value:str) -> str:
@@ -146,34 +182,48 @@ class KubernetesBase:
             if kexc.status != 409:
                 raise KubernetesException(kexc.body) from kexc
 
+    def stream_from_pod(self, pod_name:str, source_path:str, namespace=TASK_NAMESPACE) -> Iterator[bytes]:
+        """
+        Streams the content of source_path as an uncompressed tar,
+        chunk by chunk as the exec websocket receives it.
+        The stream is read in binary mode, so files are not decoded,
+        and member names are relative to source_path
+        """
+        # stream() swaps the request method of the ApiClient while
+        # connecting, so it gets its own instead of the shared one
+        exec_client = client.ApiClient(get_api_client().configuration)
+        resp = stream(
+            client.CoreV1Api(exec_client).connect_get_namespaced_pod_exec,
+            pod_name, namespace,
+            command=['tar', 'cf', '-', '-C', source_path, '.'],
+            stderr=True, stdin=False,
+            stdout=True, tty=False,
+            binary=True,
+            _preload_content=False
+        )
+        try:
+            while resp.is_open():
+                resp.update(timeout=1)
+                if resp.peek_stdout():
+                    yield resp.read_stdout()
+                if resp.peek_stderr():
+                    logger.error("STDERR: %s", resp.read_stderr())
+        finally:
+            resp.close()
+            exec_client.close()
+
     def cp_from_pod(self, pod_name:str, source_path:str, dest_path:str, out_name:str, namespace=TASK_NAMESPACE):
         """
         Method that emulates the `kubectl cp` command
         """
-        # cmd to archive the content of source_path to stdout
-        exec_command = ['tar', 'cf', '-', source_path]
         # Make sure the tmp/data folder exists so that the zip files is not in the same folder
         # as the actual results
         os.makedirs("/tmp/data", exist_ok=True)
         try:
             with TemporaryFile() as tar_buffer:
-                resp = stream(
-                    self.connect_get_namespaced_pod_exec,
-                    pod_name, namespace,
-                    command=exec_command,
-                    stderr=True, stdin=True,
-                    stdout=True, tty=False,
-                    _preload_content=False
-                )
                 # Read the stdout from the pod aka the source_path contents
-                while resp.is_open():
-                    resp.update(timeout=1)
-                    if resp.peek_stdout():
-                        out = resp.read_stdout()
-                        tar_buffer.write(out.encode('utf-8'))
-                    if resp.peek_stderr():
-                        logger.error("STDERR: %s" % resp.read_stderr())
-                resp.close()
+                for chunk in self.stream_from_pod(pod_name, source_path, namespace):
+                    tar_buffer.write(chunk)
 
                 tar_buffer.flush()
                 tar_buffer.seek(0)
@@ -185,12 +235,12 @@ class KubernetesBase:
                 # Loop through the contents of the pod's folder
                 with tarfile.open(fileobj=tar_buffer, mode='r:') as tar:
                     for member in tar.getmembers():
-                        fname = member.name.replace(source_path[1:], "")
-                        if fname:
+                        fname = member.name.removeprefix("./")
+                        if fname and fname != ".":
                             if member.isdir():
-                                tar.makedir(member, dest_path + '/' + fname[1:])
+                                tar.makedir(member, dest_path + '/' + fname)
                             else:
-                                tar.makefile(member, dest_path + '/' + fname[1:])
+                                tar.makefile(member, dest_path + '/' + fname)
 
             # Create an archive on the Flask's pod PVC
             results_file_archive = f'/tmp/data/{out_name}'
@@ -204,11 +254,32 @@ class KubernetesBase:
         return f"{results_file_archive}.zip"
 
 class KubernetesClient(KubernetesBase, client.CoreV1Api):
+    def list_pods_by_label(self, label:str, value:str) -> list[client.V1Pod]:
+        """
+        Pods in the task namespace with the given label value.
+        Served from the informer's cache when it's running
+        """
+        if pod_informer.ready:
+            return pod_informer.by_label(label, value)
+        return self.list_namespaced_pod(
+            TASK_NAMESPACE,
+            label_selector=f"{label}={value}"
+        ).items
+
     def is_pod_ready(self, label):
         """
         By getting a label, checks if the pod is in ready state.
         Once this happens the method will return
         """
+        if pod_informer.ready:
+            key, value = label.split("=", 1)
+            pod_informer.wait_for(
+                key, value,
+                lambda pods: any(pod.status.phase == "Running" for pod in pods),
+                timeout=60
+            )
+            return
+
         watcher = Watch()
         for event in watcher.stream(
             func=self.list_namespaced_pod,
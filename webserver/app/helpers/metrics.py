@@ -0,0 +1,85 @@
+"""
+Minimal in-process metrics registry.
+
+Helpers register a callable returning a json-serializable dict,
+GET /metrics returns all of them under their registered name.
+Values are per process (i.e. per backend replica).
+"""
+import logging
+import threading
+from typing import Callable, Iterable
+
+logger = logging.getLogger('metrics')
+logger.setLevel(logging.INFO)
+
+_collectors: dict[str, Callable[[], dict]] = {}
+_lock = threading.Lock()
+
+
+def register_collector(name:str, collector:Callable[[], dict]):
+    """
+    Registers (or replaces) the collector for name
+    """
+    with _lock:
+        _collectors[name] = collector
+
+
+def collect() -> dict:
+    """
+    Returns a snapshot from all registered collectors. A failing
+    collector is logged and skipped, so it won't break the others
+    """
+    with _lock:
+        collectors = dict(_collectors)
+
+    snapshot = {}
+    for name, collector in collectors.items():
+        try:
+            snapshot[name] = collector()
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.error("Failed to collect %s metrics: %s", name, exc)
+    return snapshot
+
+
+class Histogram:
+    """
+    Cumulative latency histogram, Prometheus-style, with one
+    series per label
+    """
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets:Iterable[float]=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label:str, value:float):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)}
+                self._series[label] = series
+            series["count"] += 1
+            series["sum"] += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+
+    def collect(self) -> dict:
+        with self._lock:
+            return {
+                label: {
+                    "count": series["count"],
+                    "sum": round(series["sum"], 6),
+                    "avg": round(series["sum"] / series["count"], 6),
+                    "buckets": {
+                        **{str(bound): n for bound, n in zip(self.buckets, series["buckets"])},
+                        "+Inf": series["count"]
+                    }
+                }
+                for label, series in self._series.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._series = {}
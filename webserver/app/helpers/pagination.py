@@ -0,0 +1,153 @@
+"""
+Pagination helpers shared by all list endpoints.
+
+Two modes are supported:
+    - offset (default): ?page=&per_page= uses Query.paginate,
+        which also counts the whole result set
+    - cursor (opt-in): ?cursor=&limit= uses keyset pagination on
+        (created_at/event_time, id), newest first. The response carries
+        an opaque next_cursor, and the total only if ?count=true.
+        An empty cursor requests the first page. Rows without a
+        time value come last, ordered by id.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask_sqlalchemy.pagination import QueryPagination
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.orm import Query
+
+from app.helpers.exceptions import InvalidRequest
+
+DEFAULT_PER_PAGE = 25
+MAX_CURSOR_LIMIT = 1000
+# Columns, in order of preference, used as the first keyset column
+CURSOR_TIME_COLUMNS = ["created_at", "event_time"]
+
+
+class CursorPage:
+    def __init__(self, items:list, limit:int, next_cursor:str|None, total:int|None=None):
+        self.items = items
+        self.limit = limit
+        self.next_cursor = next_cursor
+        self.total = total
+
+
+def encode_cursor(values:list) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor:str, size:int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError) as exc:
+        raise InvalidRequest("Invalid cursor") from exc
+
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidRequest("Invalid cursor")
+    if size == 2 and values[0] is not None:
+        try:
+            values[0] = datetime.fromisoformat(values[0])
+        except (TypeError, ValueError) as exc:
+            raise InvalidRequest("Invalid cursor") from exc
+    return values
+
+
+def keyset_columns(model) -> list:
+    """
+    The columns identifying a row position: a time column if
+    the model has one, and the id as tie breaker
+    """
+    for name in CURSOR_TIME_COLUMNS:
+        column = getattr(model, name, None)
+        if column is not None:
+            return [column, model.id]
+    return [model.id]
+
+
+def keyset_condition(columns:list, values:list):
+    """
+    Rows after the cursor position. A NULL time value sorts
+    last, so it never compares with the tuple and is matched
+    on its own instead
+    """
+    if len(columns) == 1:
+        return columns[0] < values[0]
+
+    time_col, id_col = columns
+    if values[0] is None:
+        return and_(time_col.is_(None), id_col < values[1])
+    return or_(tuple_(*columns) < tuple_(*values), time_col.is_(None))
+
+
+class Pagination:
+    def __init__(
+            self,
+            page:int=1,
+            per_page:int=DEFAULT_PER_PAGE,
+            cursor:str=None,
+            limit:int=DEFAULT_PER_PAGE,
+            count:bool=False
+        ):
+        self.page = page
+        self.per_page = per_page
+        self.cursor = cursor
+        self.limit = limit
+        self.count = count
+
+    @property
+    def is_cursor(self) -> bool:
+        return self.cursor is not None
+
+    @classmethod
+    def from_args(cls, args:dict) -> "Pagination":
+        """
+        Pops the pagination arguments from args, so that
+        the remaining ones can be used as filters
+        """
+        try:
+            page = int(args.pop("page", '1'))
+            per_page = int(args.pop("per_page", str(DEFAULT_PER_PAGE)))
+        except ValueError as ve:
+            raise InvalidRequest("page and per_page parameters should be integers") from ve
+
+        cursor = args.pop("cursor", None)
+        limit = args.pop("limit", None)
+        count = args.pop("count", "false").lower() == "true"
+        if limit is not None and cursor is None:
+            # limit alone is enough to opt in, starting from the first page
+            cursor = ""
+
+        try:
+            limit = int(limit or DEFAULT_PER_PAGE)
+        except ValueError as ve:
+            raise InvalidRequest("limit parameter should be an integer") from ve
+        if not 0 < limit <= MAX_CURSOR_LIMIT:
+            raise InvalidRequest(f"limit should be between 1 and {MAX_CURSOR_LIMIT}")
+
+        return cls(page=page, per_page=per_page, cursor=cursor, limit=limit, count=count)
+
+    def apply(self, query:Query, model) -> QueryPagination|CursorPage:
+        if not self.is_cursor:
+            return query.paginate(page=self.page, per_page=self.per_page)
+
+        columns = keyset_columns(model)
+        total = query.order_by(None).count() if self.count else None
+        if self.cursor:
+            values = decode_cursor(self.cursor, len(columns))
+            query = query.filter(keyset_condition(columns, values))
+
+        # Drop any ordering already on the query, the keyset order has to come first
+        ordering = [col.desc() for col in columns]
+        if len(columns) == 2:
+            ordering[0] = ordering[0].nulls_last()
+        rows = query.order_by(None).order_by(*ordering).limit(self.limit + 1).all()
+        next_cursor = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            next_cursor = encode_cursor([getattr(rows[-1], col.key) for col in columns])
+        return CursorPage(rows, self.limit, next_cursor, total)
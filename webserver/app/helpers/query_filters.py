@@ -1,6 +1,7 @@
 import re
 from app.helpers.base_model import Base
 from app.helpers.exceptions import InvalidRequest
+from app.helpers.pagination import Pagination
 
 
 FILTERS = [
@@ -29,12 +30,9 @@ def parse_query_params(model: Base, query_params: dict): # type: ignore
     ----------
     :param model: The Table model to look against the query args
     :param query_params: the request args => request.args.copy()
+    Pagination arguments are handled by app.helpers.pagination
     """
-    try:
-        page = int(query_params.pop("page", '1'))
-        per_page = int(query_params.pop("per_page", '25'))
-    except ValueError as ve:
-        raise InvalidRequest("page and per_page parameters should be integers") from ve
+    pagination = Pagination.from_args(query_params)
 
     current_query = model.query
     for qp_f, qp_v in query_params.items():
@@ -64,5 +62,5 @@ def parse_query_params(model: Base, query_params: dict): # type: ignore
             # We are in the = case
             current_query = current_query.filter(getattr(model, field) == qp_v)
 
-    return current_query.paginate(page=page, per_page=per_page)
+    return pagination.apply(current_query, model)
 
@@ -1,65 +1,231 @@
 """
 Handler for different db engines queries.
-At the current state we support:
-    - postgresql
-    - MS SQL
+At the current state we support every engine in
+app.models.dataset.SUPPORTED_ENGINES, through
+pooled connections (app.helpers.dataset_engines)
+
+Queries are validated without being run: each dialect asks the
+database to plan, or describe, the query (EXPLAIN,
+sp_describe_first_result_set) or wraps it so it returns no rows,
+within DATASET_QUERY_TIMEOUT_SECONDS. The cost doesn't depend on
+the amount of data the query would return.
+
+In count mode, valid queries are counted with SELECT COUNT(*), with
+the same timeout. Counts under BEACON_MIN_COUNT are suppressed, and
+results are cached per dataset and normalised query.
 """
+import hashlib
+import json
 import logging
 import re
-import pymssql
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import ProgrammingError, OperationalError, InternalError
+from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.exc import ProgrammingError, OperationalError, InternalError, ResourceClosedError
 
-from app.helpers.const import build_sql_uri
+from app.helpers.cache import TTLCache
+from app.helpers.const import (
+    BEACON_COUNT_CACHE_SIZE, BEACON_COUNT_CACHE_TTL, BEACON_MIN_COUNT,
+    DATASET_QUERY_TIMEOUT_SECONDS
+)
+from app.helpers.dataset_engines import dataset_engines
+from app.helpers.metrics import register_collector
 from app.models.dataset import Dataset
 from app.helpers.exceptions import DBError
 
 logger = logging.getLogger('query_validator')
 logger.setLevel(logging.INFO)
 
-def connect_to_dataset(dataset:Dataset) -> sessionmaker:
-    """
-    Given a datasets object, create a connection string
-    and return a session that can be used to send queries
-    """
-    user, passw = dataset.get_credentials()
-    if dataset.type == "postgres":
-        engine = create_engine(build_sql_uri(
-            host=re.sub('http(s)*://', '', dataset.host),
-            port=dataset.port,
-            username=user,
-            password=passw,
-            database=dataset.name
-        ))
-        session = sessionmaker(
-            autocommit=False,
-            autoflush=False,
-            bind=engine
-        )
-        return session()
-    elif dataset.type == "mssql":
-        conn = pymssql.connect(host=dataset.host, user=user, password=passw, database=dataset.name, port=dataset.port)
-        return conn.cursor(as_dict=True)
+# (dataset id, normalised query hash) -> beacon count result.
+# Invalidated when the dataset is changed
+count_cache = TTLCache(maxsize=BEACON_COUNT_CACHE_SIZE, ttl=BEACON_COUNT_CACHE_TTL)
+register_collector("beacon_count_cache", count_cache.stats)
 
-def validate(query:str, dataset:Dataset) -> bool:
+# Quoted literals and identifiers, left untouched by the normalisation
+QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+
+class BaseValidator:
     """
-    Simple method to validate SQL syntax, and against
-    the actual dataset.
+    Runs the query wrapped so that no row is returned.
+    Being a subquery, only SELECTs are valid
+    """
+    def __init__(self, timeout:int=DATASET_QUERY_TIMEOUT_SECONDS):
+        self.timeout = timeout
+
+    @staticmethod
+    def clean(query:str) -> str:
+        return query.strip().rstrip(";")
+
+    def prepare(self, session:Session):
+        """
+        Per-session settings, i.e. the statement timeout
+        """
+
+    def check(self, session:Session, query:str) -> bool:
+        session.execute(text(f"SELECT * FROM ({self.clean(query)}) fn_beacon WHERE 1 = 0")).all()
+        return True
+
+    def validate(self, session:Session, query:str) -> bool:
+        self.prepare(session)
+        return self.check(session, query)
+
+    def count(self, session:Session, query:str) -> int:
+        """
+        Rows returned by the query, within the session prepared by validate
+        """
+        return session.execute(text(f"SELECT COUNT(*) FROM ({self.clean(query)}) fn_beacon")).scalar()
+
+
+class PostgresValidator(BaseValidator):
+    """
+    EXPLAIN plans the query without running it. Data
+    changes are rejected, and blocked by the read only
+    transaction anyway
+    """
+    def prepare(self, session:Session):
+        # Read only query, so things like UPDATE, DELETE or DROP won't be executed
+        session.execute(text('SET TRANSACTION READ ONLY'))
+        session.execute(text(f'SET LOCAL statement_timeout = {self.timeout * 1000}'))
+
+    def check(self, session:Session, query:str) -> bool:
+        plan = session.execute(text(f"EXPLAIN (FORMAT JSON) {self.clean(query)}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        if isinstance(plan, list) and plan and plan[0]["Plan"]["Node Type"] == "ModifyTable":
+            return False
+        return True
+
+
+class MssqlValidator(BaseValidator):
+    """
+    sp_describe_first_result_set compiles the query and describes
+    its result, without running it. No result means it's not a query.
+    The timeout is set on the connection (dataset_engines.CONNECT_ARGS)
+    """
+    def check(self, session:Session, query:str) -> bool:
+        columns = session.execute(
+            text("EXEC sp_describe_first_result_set @tsql = :tsql"),
+            {"tsql": self.clean(query)}
+        ).all()
+        return bool(columns)
+
+
+class MysqlValidator(BaseValidator):
+    """
+    EXPLAIN plans the query, data changes are rejected
+    """
+    timeout_setting = "SET SESSION max_execution_time = %(ms)s"
+    modifying = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+    def prepare(self, session:Session):
+        session.execute(text(self.timeout_setting % {"ms": self.timeout * 1000, "s": self.timeout}))
+
+    def check(self, session:Session, query:str) -> bool:
+        rows = session.execute(text(f"EXPLAIN {self.clean(query)}")).mappings().all()
+        return not any(str(row.get("select_type", "")).upper() in self.modifying for row in rows)
+
+
+class MariaDBValidator(MysqlValidator):
+    timeout_setting = "SET SESSION max_statement_time = %(s)s"
+
+
+VALIDATORS = {
+    "postgres": PostgresValidator,
+    "mssql": MssqlValidator,
+    "mysql": MysqlValidator,
+    "mariadb": MariaDBValidator,
+    # Oracle skips the wrapped query execution
+    "oracle": BaseValidator
+}
+
+def connect_to_dataset(dataset:Dataset) -> Session:
+    """
+    Given a datasets object, return a session on its
+    pooled engine that can be used to send queries.
+    The caller has to close it
+    """
+    session = sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=dataset_engines.get_engine(dataset)
+    )
+    return session()
+
+def normalise_query(query:str) -> str:
+    """
+    Collapses whitespace outside quotes and drops
+    the trailing semicolon, so trivially different
+    queries share the same cache entry
+    """
+    parts = QUOTED.split(query.strip().rstrip(";").strip())
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part)
+        for i, part in enumerate(parts)
+    )
+
+def _run(query:str, dataset:Dataset, counting:bool=False) -> tuple[bool, int|None]:
+    """
+    Validates the query and optionally counts its rows.
+    Returns whether it's valid, and the count
     """
     try:
         session = connect_to_dataset(dataset)
-        if dataset.type == "postgres":
-            # Read only query, so things like UPDATE, DELETE or DROP won't be executed
-            session.execute(text('SET TRANSACTION READ ONLY'))
-            session.execute(text(query)).all()
-        if dataset.type == "mssql":
-            session.execute(query)
-            session.fetchall()
-        return True
+        # Checks out a connection, so that errors past this
+        # point are about the query
+        session.connection()
     except OperationalError as exc:
         logger.info(f"Connection to the DB failed: \n{str(exc)}")
+        # i.e. the credentials changed, they'll be read again
+        dataset_engines.dispose(dataset.id)
         raise DBError("Could not connect to the database", 500) from exc
     except (ProgrammingError, InternalError) as exc:
         logger.info(f"Query validation failed\n{str(exc)}")
-        return False
+        return False, None
+
+    try:
+        validator = VALIDATORS.get(dataset.type, BaseValidator)()
+        try:
+            if not validator.validate(session, query):
+                return False, None
+        # OperationalError: i.e. the statement timed out, or MSSQL errors.
+        # ResourceClosedError: the statement doesn't return rows, not a query
+        except (ProgrammingError, InternalError, OperationalError, ResourceClosedError) as exc:
+            logger.info(f"Query validation failed\n{str(exc)}")
+            return False, None
+        if not counting:
+            return True, None
+
+        try:
+            return True, validator.count(session, query)
+        except (ProgrammingError, InternalError) as exc:
+            logger.info(f"Query count failed\n{str(exc)}")
+            return False, None
+        except OperationalError as exc:
+            logger.info(f"Query count failed\n{str(exc)}")
+            raise DBError("Could not count the query results in time", 500) from exc
+    finally:
+        # Rolls back and returns the connection to the pool
+        session.close()
+
+def validate(query:str, dataset:Dataset) -> bool:
+    """
+    Simple method to validate SQL syntax, and against
+    the actual dataset.
+    """
+    return _run(query, dataset)[0]
+
+def count(query:str, dataset:Dataset) -> dict|None:
+    """
+    Number of rows the query returns, None if not valid.
+    Counts between 0 and BEACON_MIN_COUNT are suppressed
+    """
+    key = (dataset.id, hashlib.sha256(normalise_query(query).encode()).hexdigest())
+    result = count_cache.get(key)
+    if result is None:
+        valid, rows = _run(query, dataset, counting=True)
+        if not valid:
+            return None
+        suppressed = 0 < rows < BEACON_MIN_COUNT
+        result = {"count": None if suppressed else rows, "suppressed": suppressed}
+        count_cache.set(key, result)
+    return result
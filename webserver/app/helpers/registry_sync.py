@@ -0,0 +1,193 @@
+"""
+Incremental sync of the containers from the active registries,
+behind POST /containers/sync.
+
+Registries and their repositories are listed concurrently, with up to
+REGISTRY_SYNC_WORKERS registry requests in flight, following the
+listings pagination. The tags listing of each repository is a
+conditional request with the ETag/Last-Modified it had on the previous
+sync (registry_repositories table), repositories not modified since
+are skipped altogether.
+The containers already tracked are loaded with a single query, and
+only the missing ones are inserted, in bulk.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app.helpers.base_model import db
+from app.helpers.const import REGISTRY_SYNC_WORKERS
+from app.helpers.container_registries import BaseRegistry, image_cache
+from app.helpers.exceptions import ContainerRegistryException, InvalidRequest
+from app.helpers.metrics import register_collector
+from app.models.container import Container
+from app.models.registry import Registry
+from app.models.registry_repository import RegistryRepository
+
+logger = logging.getLogger('registry_sync')
+logger.setLevel(logging.INFO)
+
+
+class RegistrySync:
+    def __init__(self, workers:int=REGISTRY_SYNC_WORKERS):
+        self.workers = workers
+        self.runs = 0
+        self.repositories = 0
+        self.unchanged = 0
+        self.inserted = 0
+
+    @staticmethod
+    def _list_tags(client:BaseRegistry, image:str, validators:dict|None):
+        return client.get_image_tags_if_changed(image, validators)
+
+    @staticmethod
+    def _resolve(client:BaseRegistry, row:dict) -> dict:
+        try:
+            row["digest"] = client.get_tag_digest(row["name"], row["tag"])
+            row["digest_resolved_at"] = datetime.now()
+        except ContainerRegistryException as cre:
+            # Resolved again by the digest refresher
+            logger.warning("Could not resolve the digest of %s:%s: %s", row["name"], row["tag"], cre.description)
+        return row
+
+    @staticmethod
+    def _new_row(registry_id:int, name:str, key:str, value:str) -> dict|None:
+        try:
+            if key == "tag":
+                Container.validate_image_format(f"{name}:{value}", "")
+            else:
+                Container.validate_image_format("", f"{name}@{value}")
+        except InvalidRequest:
+            logger.warning("Skipping %s %s of %s, malformed", key, value, name)
+            return None
+
+        return {
+            "registry_id": registry_id,
+            "name": name,
+            "tag": value if key == "tag" else None,
+            "sha": value if key == "sha" else None,
+            "digest": None,
+            "digest_resolved_at": None,
+            "ml": False,
+            "dashboard": False
+        }
+
+    def sync(self, registries:list[Registry]) -> list[str]:
+        """
+        Adds the containers missing from the registries, not usable
+        until flagged as ml or dashboard. Any registry error aborts the
+        whole sync. Returns the full names of the added images
+        """
+        if not registries:
+            return []
+
+        session = db.session
+        clients = {registry.id: registry.get_registry_class() for registry in registries}
+        # A fresh login, invalid credentials fail
+        # the sync before any listing
+        for client in clients.values():
+            client.get_token(refresh=True)
+        urls = {registry.id: registry.url for registry in registries}
+        repositories = {
+            (repo.registry_id, repo.name): repo
+            for repo in RegistryRepository.query.filter(RegistryRepository.registry_id.in_(clients)).all()
+        }
+        validators = {key: repo.validators for key, repo in repositories.items()}
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                names = pool.map(lambda client: client.list_repo_names(), clients.values())
+                pairs = [
+                    (registry_id, name)
+                    for registry_id, repo_names in zip(clients, names)
+                    for name in repo_names
+                ]
+                listings = list(pool.map(
+                    lambda pair: self._list_tags(clients[pair[0]], pair[1], validators.get(pair)),
+                    pairs
+                ))
+
+                existing = set()
+                for registry_id, name, tag, sha in session.query(
+                    Container.registry_id, Container.name, Container.tag, Container.sha
+                ).filter(Container.registry_id.in_(clients)):
+                    existing.add((registry_id, name, "tag", tag))
+                    existing.add((registry_id, name, "sha", sha))
+
+                now = datetime.now()
+                rows = []
+                unresolved = []
+                for (registry_id, name), (tags, digests, new_validators) in zip(pairs, listings):
+                    repo = repositories.get((registry_id, name))
+                    if repo is None:
+                        repo = RegistryRepository(registry_id, name)
+                        repo.add(commit=False)
+                        repositories[(registry_id, name)] = repo
+                    repo.etag = new_validators.get("etag")
+                    repo.last_modified = new_validators.get("last_modified")
+                    repo.synced_at = now
+
+                    if tags is None:
+                        self.unchanged += 1
+                        continue
+
+                    for key in ["tag", "sha"]:
+                        for tag_or_sha in tags[key]:
+                            if (registry_id, name, key, tag_or_sha) in existing:
+                                continue
+                            existing.add((registry_id, name, key, tag_or_sha))
+                            row = self._new_row(registry_id, name, key, tag_or_sha)
+                            if row is None:
+                                continue
+                            if key == "sha":
+                                # Just listed by the registry
+                                row["digest"] = tag_or_sha
+                                row["digest_resolved_at"] = now
+                            elif tag_or_sha in digests:
+                                row["digest"] = digests[tag_or_sha]
+                                row["digest_resolved_at"] = now
+                            else:
+                                unresolved.append(row)
+                            rows.append(row)
+
+                list(pool.map(lambda row: self._resolve(clients[row["registry_id"]], row), unresolved))
+
+            # Repositories removed from the registries
+            listed = set(pairs)
+            for key, repo in repositories.items():
+                if key not in listed and repo.id is not None:
+                    session.delete(repo)
+
+            if rows:
+                session.execute(insert(Container), rows)
+            session.commit()
+        except:
+            session.rollback()
+            raise
+
+        # Images might have been pushed or removed since the last checks
+        for url in urls.values():
+            image_cache.invalidate_prefix((url,))
+
+        self.runs += 1
+        self.repositories += len(pairs)
+        self.inserted += len(rows)
+        return [
+            f"{urls[row["registry_id"]]}/{row["name"]}@{row["sha"]}" if row["sha"]
+            else f"{urls[row["registry_id"]]}/{row["name"]}:{row["tag"]}"
+            for row in rows
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "repositories": self.repositories,
+            "unchanged": self.unchanged,
+            "inserted": self.inserted
+        }
+
+
+registry_sync = RegistrySync()
+register_collector("registry_sync", registry_sync.stats)
@@ -0,0 +1,244 @@
+"""
+Task results cache on the backend volume.
+
+Results of a finished task can't change anymore, so the first download
+is written to {RESULTS_PATH}/<task id>/cache while it's being streamed,
+named after its sha256 digest, together with a manifest listing the
+archived files and their sizes. Following downloads are served from
+there, with the digest as ETag, so conditional and range requests work.
+
+Entries are evicted once the task is older than CLEANUP_AFTER_DAYS
+(the result-cleaner cronjob removes the whole task folder as well),
+and the least recently downloaded ones once the cache is over
+RESULTS_CACHE_MAX_MB. Setting it to 0 disables the cache.
+"""
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import threading
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Iterable, Iterator
+
+from app.helpers.const import CLEANUP_AFTER_DAYS, RESULTS_CACHE_MAX_MB, RESULTS_PATH
+from app.helpers.metrics import register_collector
+
+logger = logging.getLogger('results_cache')
+logger.setLevel(logging.INFO)
+
+
+class CachedResults:
+    def __init__(self, path:Path, manifest:dict):
+        self.path = path
+        self.digest = manifest["digest"]
+        self.size = manifest["size"]
+        self.files = manifest["files"]
+
+
+class ResultsCache:
+    def __init__(
+            self,
+            root:str|None=RESULTS_PATH,
+            max_size:int=RESULTS_CACHE_MAX_MB * 2**20,
+            max_age_days:int=CLEANUP_AFTER_DAYS
+        ):
+        self.root = Path(root) if root else None
+        self.max_size = max_size
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.root is not None and self.max_size > 0
+
+    def _folder(self, task_id:int) -> Path:
+        return self.root / str(task_id) / "cache"
+
+    def _manifest_path(self, task_id:int, archive_format:str) -> Path:
+        return self._folder(task_id) / f"manifest.{archive_format}.json"
+
+    def _is_expired(self, manifest:dict) -> bool:
+        created_at = datetime.fromisoformat(manifest["task_created_at"])
+        return created_at.date() + timedelta(days=self.max_age_days) <= datetime.now().date()
+
+    def _read_manifest(self, manifest_path:Path) -> dict|None:
+        try:
+            return json.loads(manifest_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _remove(self, manifest_path:Path, manifest:dict|None):
+        if manifest is not None:
+            archive = manifest_path.parent / f"{manifest['digest']}.{manifest['format']}"
+            archive.unlink(missing_ok=True)
+        manifest_path.unlink(missing_ok=True)
+        self.evictions += 1
+
+    def get(self, task_id:int, archive_format:str) -> CachedResults|None:
+        """
+        Returns the cached archive for the task, if any.
+        A hit refreshes the entry's last access time
+        """
+        if not self.enabled:
+            return None
+
+        manifest_path = self._manifest_path(task_id, archive_format)
+        manifest = self._read_manifest(manifest_path)
+        archive = manifest_path.parent / f"{manifest['digest']}.{archive_format}" if manifest else None
+        if manifest is None or not archive.is_file():
+            self.misses += 1
+            return None
+        if self._is_expired(manifest):
+            with self._lock:
+                self._remove(manifest_path, manifest)
+            self.misses += 1
+            return None
+
+        # The manifest mtime tracks the last access for the size eviction
+        os.utime(manifest_path)
+        self.hits += 1
+        return CachedResults(archive, manifest)
+
+    def store(
+            self,
+            task_id:int,
+            task_created_at:datetime,
+            archive_format:str,
+            chunks:Iterable[bytes]
+        ) -> Iterator[bytes]:
+        """
+        Passes the archive chunks through, writing them to the cache
+        as well. The entry is only added if the whole archive
+        went through, an interrupted download leaves nothing behind
+        """
+        if not self.enabled:
+            yield from chunks
+            return
+
+        folder = self._folder(task_id)
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            partial = NamedTemporaryFile(dir=folder, prefix=".partial-", delete=False)
+        except OSError as ose:
+            logger.error("Results of task %s won't be cached: %s", task_id, ose)
+            yield from chunks
+            return
+
+        digest = hashlib.sha256()
+        size = 0
+        completed = False
+        try:
+            with partial:
+                for chunk in chunks:
+                    partial.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                self._add(task_id, task_created_at, archive_format, Path(partial.name), digest.hexdigest(), size)
+            else:
+                Path(partial.name).unlink(missing_ok=True)
+
+    def _add(
+            self,
+            task_id:int,
+            task_created_at:datetime,
+            archive_format:str,
+            partial:Path,
+            digest:str,
+            size:int
+        ):
+        manifest_path = self._manifest_path(task_id, archive_format)
+        archive = manifest_path.parent / f"{digest}.{archive_format}"
+        try:
+            manifest = {
+                "task_id": task_id,
+                "task_created_at": task_created_at.isoformat(),
+                "format": archive_format,
+                "digest": digest,
+                "size": size,
+                "files": self._list_files(partial, archive_format),
+                "cached_at": datetime.now().isoformat()
+            }
+            with self._lock:
+                previous = self._read_manifest(manifest_path)
+                os.replace(partial, archive)
+                with NamedTemporaryFile("w", dir=manifest_path.parent, delete=False) as tmp_manifest:
+                    json.dump(manifest, tmp_manifest)
+                os.replace(tmp_manifest.name, manifest_path)
+                if previous and previous["digest"] != digest:
+                    (manifest_path.parent / f"{previous['digest']}.{archive_format}").unlink(missing_ok=True)
+            self.stored += 1
+        except (OSError, tarfile.TarError, zipfile.BadZipFile) as exc:
+            logger.error("Failed to cache the results of task %s: %s", task_id, exc)
+            partial.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    @staticmethod
+    def _list_files(archive:Path, archive_format:str) -> list[dict]:
+        if archive_format == "zip":
+            with zipfile.ZipFile(archive) as zip_file:
+                return [
+                    {"name": info.filename, "size": info.file_size}
+                    for info in zip_file.infolist() if not info.is_dir()
+                ]
+        with tarfile.open(archive) as tar:
+            return [
+                {"name": member.name.removeprefix("./"), "size": member.size}
+                for member in tar if member.isfile()
+            ]
+
+    def _entries(self) -> list[tuple[Path, dict]]:
+        entries = []
+        for manifest_path in self.root.glob("*/cache/manifest.*.json"):
+            entries.append((manifest_path, self._read_manifest(manifest_path)))
+        return entries
+
+    def evict(self):
+        """
+        Removes expired entries, then the least recently
+        used ones until the cache fits in max_size
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            live = []
+            for manifest_path, manifest in self._entries():
+                if manifest is None or self._is_expired(manifest):
+                    self._remove(manifest_path, manifest)
+                    continue
+                try:
+                    live.append((manifest_path.stat().st_mtime, manifest_path, manifest))
+                except FileNotFoundError:
+                    continue
+
+            total = sum(manifest["size"] for _, _, manifest in live)
+            for _, manifest_path, manifest in sorted(live, key=lambda entry: entry[0]):
+                if total <= self.max_size:
+                    break
+                self._remove(manifest_path, manifest)
+                total -= manifest["size"]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "evictions": self.evictions
+        }
+
+
+results_cache = ResultsCache()
+register_collector("results_cache", results_cache.stats)
@@ -231,7 +231,8 @@ class TaskPod:
             image=self.image,
             env=self.env,
             volume_mounts=vol_mounts,
-            image_pull_policy="Always",
+            # An image by digest can't change, the node copy is as good
+            image_pull_policy="IfNotPresent" if "@sha256:" in self.image else "Always",
             resources=self.resources
         )
 
@@ -0,0 +1,292 @@
+"""
+Queue mode for task submissions.
+
+With TASK_QUEUE enabled, POST /tasks only validates the task and stores
+it as `queued`, together with its run spec in the task_queue table,
+answering 202 straight away.
+A pool of TASK_QUEUE_WORKERS threads, in every backend replica, claims
+due entries with SELECT ... FOR UPDATE SKIP LOCKED, so each one is
+picked by a single worker, and creates the task pod, PV, PVC and CRD.
+Which task can start is decided by the scheduler
+(app.helpers.task_scheduler), enforcing the concurrency caps.
+Failures are retried with an exponential backoff starting at
+TASK_QUEUE_RETRY_SECONDS, after TASK_QUEUE_MAX_ATTEMPTS the task is
+marked as failed.
+A task cancelled while a worker starts it stays cancelled: the worker
+only moves it out of `starting` if it's still in that status, and
+removes the pod it just created otherwise.
+"""
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import Flask, has_app_context
+from kubernetes.client.exceptions import ApiException
+from sqlalchemy import func, select, update
+
+from app.helpers.base_model import db
+from app.helpers.const import (
+    TASK_NAMESPACE, TASK_QUEUE_CLAIM_TIMEOUT, TASK_QUEUE_MAX_ATTEMPTS,
+    TASK_QUEUE_POLL_SECONDS, TASK_QUEUE_RETRY_SECONDS, TASK_QUEUE_WORKERS
+)
+from app.helpers.exceptions import TaskExecutionException
+from app.helpers.kubernetes import KubernetesClient
+from app.helpers.metrics import register_collector
+from app.helpers.task_scheduler import TaskScheduler, task_scheduler
+from app.models.queued_task import QueuedTask
+from app.models.task import Task
+
+logger = logging.getLogger('task_queue')
+logger.setLevel(logging.INFO)
+
+# Longest wait between two attempts
+MAX_RETRY_SECONDS = 300
+# Arbitrary key of the advisory lock serializing admissions
+ADMISSION_LOCK_ID = 727361
+# Due entries considered at every admission
+CANDIDATES_WINDOW = 100
+
+
+class TaskQueue:
+    def __init__(
+            self,
+            workers:int=TASK_QUEUE_WORKERS,
+            max_attempts:int=TASK_QUEUE_MAX_ATTEMPTS,
+            retry_seconds:float=TASK_QUEUE_RETRY_SECONDS,
+            poll_interval:float=TASK_QUEUE_POLL_SECONDS,
+            claim_timeout:int=TASK_QUEUE_CLAIM_TIMEOUT,
+            scheduler:TaskScheduler=task_scheduler
+        ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.scheduler = scheduler
+        self.app = None
+        self._threads: list[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self.admitted = 0
+        self.started = 0
+        self.retried = 0
+        self.failed = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def enqueue(self, task:Task):
+        """
+        Adds the task to the queue in the current
+        transaction, the caller has to commit it
+        """
+        task.status = 'queued'
+        task.add(commit=False)
+        QueuedTask(task).add(commit=False)
+
+    def notify(self):
+        """
+        Wakes the local workers up, instead of waiting for the next poll
+        """
+        self._wakeup.set()
+
+    def retry_delay(self, attempts:int) -> timedelta:
+        return timedelta(seconds=min(self.retry_seconds * 2 ** (attempts - 1), MAX_RETRY_SECONDS))
+
+    def _claim(self) -> int|None:
+        """
+        Picks the next task allowed to start and marks it as starting,
+        so it counts towards the scheduler caps from now on.
+        Admission decisions are serialized across workers and replicas
+        with a transaction level advisory lock. Returns the entry id
+        """
+        session = db.session
+        session.execute(select(func.pg_advisory_xact_lock(ADMISSION_LOCK_ID)))
+        now = datetime.now()
+        candidates: list[QueuedTask] = session.query(QueuedTask).filter(
+            QueuedTask.next_attempt_at <= now
+        ).order_by(QueuedTask.id).with_for_update(
+            skip_locked=True, of=QueuedTask
+        ).limit(CANDIDATES_WINDOW).all()
+
+        runnable = []
+        for item in candidates:
+            # 'starting' here means the claim of a worker that's gone timed out
+            if item.task.status in ('queued', 'starting'):
+                runnable.append(item)
+            else:
+                # i.e. cancelled while waiting
+                session.delete(item)
+
+        item = self.scheduler.pick(session, runnable)
+        if item is None:
+            session.commit()
+            return None
+
+        claimed = session.execute(
+            update(Task).where(
+                Task.id == item.task_id, Task.status.in_(('queued', 'starting'))
+            ).values(status='starting'),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        if not claimed:
+            # Cancelled since the candidates were read
+            session.delete(item)
+            session.commit()
+            return None
+
+        item.next_attempt_at = now + timedelta(seconds=self.claim_timeout)
+        self.admitted += 1
+        wait = (now - item.created_at).total_seconds()
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        session.commit()
+        return item.id
+
+    def process_next(self) -> bool:
+        """
+        Claims the next task and runs it.
+        Must be called within an app context.
+        Returns False if there was nothing to do
+        """
+        item_id = self._claim()
+        if item_id is None:
+            return False
+
+        session = db.session
+        item: QueuedTask = session.query(QueuedTask).filter(
+            QueuedTask.id == item_id
+        ).with_for_update(skip_locked=True).one_or_none()
+        if item is None or item.task.status != 'starting':
+            # Cancelled, or claimed again by someone else
+            if item is not None:
+                session.delete(item)
+            session.commit()
+            return True
+
+        task = item.task
+        task.load_run_spec(item.run_spec)
+        item.attempts += 1
+        try:
+            # A savepoint, so that a db error while running
+            # doesn't release the lock on the entry
+            with session.begin_nested():
+                task.run()
+        except TaskExecutionException as tee:
+            if tee.code != 409:
+                self._retry_or_fail(item, tee.description)
+                return True
+            # The pod was created by a previous attempt
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self._retry_or_fail(item, getattr(exc, "description", None) or str(exc))
+            return True
+
+        started = self._transition(task, status='scheduled')
+        session.delete(item)
+        session.commit()
+        if not started:
+            logger.info("Task %s was cancelled while starting", task.id)
+            self._remove_pod(task)
+            return True
+        self.started += 1
+        return True
+
+    @staticmethod
+    def _transition(task:Task, **values) -> bool:
+        """
+        Updates the task only if it's still starting, as it might have
+        been cancelled meanwhile. Waits for a cancel in progress, which
+        locks the task row. Returns whether it was updated
+        """
+        result = db.session.execute(
+            update(Task).where(Task.id == task.id, Task.status == 'starting').values(**values),
+            execution_options={"synchronize_session": False}
+        )
+        return result.rowcount > 0
+
+    @staticmethod
+    def _remove_pod(task:Task):
+        try:
+            KubernetesClient().delete_namespaced_pod(task.pod_name(), namespace=TASK_NAMESPACE)
+        except ApiException as kexc:
+            # i.e. the pod was not created by this attempt
+            logger.warning("Could not delete the pod of cancelled task %s: %s", task.id, kexc.reason)
+
+    def _retry_or_fail(self, item:QueuedTask, error:str):
+        item.last_error = str(error)[:4096]
+        if item.attempts >= self.max_attempts:
+            logger.error("Task %s failed after %s attempts: %s", item.task_id, item.attempts, error)
+            self._transition(item.task, status='failed', status_reason=item.last_error[:256])
+            db.session.delete(item)
+            self.failed += 1
+        elif self._transition(item.task, status='queued'):
+            logger.warning("Task %s attempt %s failed: %s", item.task_id, item.attempts, error)
+            item.next_attempt_at = datetime.now() + self.retry_delay(item.attempts)
+            self.retried += 1
+        else:
+            # Cancelled while starting, nothing left to retry
+            db.session.delete(item)
+        db.session.commit()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    processed = self.process_next()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.error("Task queue worker error: %s", exc)
+                processed = False
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def start(self, app:Flask):
+        self.app = app
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"task-queue-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout:float=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        """
+        Worker counters, and the current queue depth and
+        age of the oldest entry, when called in an app context
+        """
+        stats = {
+            "workers": sum(thread.is_alive() for thread in self._threads),
+            "admitted": self.admitted,
+            "started": self.started,
+            "retried": self.retried,
+            "failed": self.failed,
+            "wait_seconds_avg": self.wait_seconds_total / self.admitted if self.admitted else 0,
+            "wait_seconds_max": self.wait_seconds_max
+        }
+        if has_app_context():
+            depth, oldest = db.session.query(
+                func.count(QueuedTask.id), func.min(QueuedTask.created_at)
+            ).one()
+            stats["depth"] = depth
+            stats["oldest_wait_seconds"] = (datetime.now() - oldest).total_seconds() if oldest else 0
+        return stats
+
+
+task_queue = TaskQueue()
+register_collector("task_queue", task_queue.stats)
+
+
+def start_task_queue(app:Flask):
+    """
+    Starts the workers. In-flight tasks are left queued on exit,
+    their transaction is rolled back and another worker will pick them up
+    """
+    task_queue.start(app)
+    atexit.register(task_queue.stop, 5)
@@ -0,0 +1,128 @@
+"""
+Admission control for task execution.
+
+Caps the number of active tasks (starting, scheduled, or with a
+running or waiting pod) globally and per user, project and dataset,
+through the TASK_MAX_ACTIVE* settings. Tasks over any cap stay in the
+queue (app.helpers.task_queue) until a slot is released.
+
+Slots are released when task pods terminate. The status reconciler
+keeps the task statuses up to date, if it's not deployed, the active
+tasks statuses are refreshed from their pods, with a single list call,
+before every admission decision.
+
+Among the tasks that can start, users with fewer active tasks
+go first, then the oldest submission (fair share, then FIFO).
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.helpers.const import (
+    TASK_MAX_ACTIVE, TASK_MAX_ACTIVE_PER_DATASET, TASK_MAX_ACTIVE_PER_PROJECT,
+    TASK_MAX_ACTIVE_PER_USER, TASK_RECONCILER
+)
+from app.models.queued_task import QueuedTask
+from app.models.task import Task
+
+ACTIVE_STATUSES = ('starting', 'scheduled', 'running', 'waiting')
+# A task without a pod for this long after being scheduled is gone
+MISSING_POD_GRACE = timedelta(seconds=60)
+
+
+class ActiveCounts:
+    def __init__(self):
+        self.total = 0
+        self.by_user = Counter()
+        self.by_project = Counter()
+        self.by_dataset = Counter()
+
+    def add(self, requested_by:str, project_name:str|None, dataset_id:int, count:int=1):
+        self.total += count
+        self.by_user[requested_by] += count
+        if project_name:
+            self.by_project[project_name] += count
+        self.by_dataset[dataset_id] += count
+
+
+class TaskScheduler:
+    def __init__(
+            self,
+            max_active:int=TASK_MAX_ACTIVE,
+            max_per_user:int=TASK_MAX_ACTIVE_PER_USER,
+            max_per_project:int=TASK_MAX_ACTIVE_PER_PROJECT,
+            max_per_dataset:int=TASK_MAX_ACTIVE_PER_DATASET
+        ):
+        self.max_active = max_active
+        self.max_per_user = max_per_user
+        self.max_per_project = max_per_project
+        self.max_per_dataset = max_per_dataset
+
+    @property
+    def enabled(self) -> bool:
+        return any((self.max_active, self.max_per_user, self.max_per_project, self.max_per_dataset))
+
+    def refresh_statuses(self, session:Session):
+        """
+        Updates the statuses of the active tasks from their pods,
+        so that terminated ones release their slot
+        """
+        if TASK_RECONCILER:
+            return
+
+        tasks = session.query(Task).filter(Task.status.in_(ACTIVE_STATUSES[1:])).all()
+        if not tasks:
+            return
+        Task.prepare_page(tasks)
+        for task in tasks:
+            if task.prefetched_pods:
+                task.get_status()
+            elif (task.updated_at or task.created_at) < datetime.now() - MISSING_POD_GRACE:
+                task.status = 'deleted'
+
+    def active_counts(self, session:Session) -> ActiveCounts:
+        counts = ActiveCounts()
+        rows = session.query(
+            Task.requested_by, Task.project_name, Task.dataset_id, func.count(Task.id)
+        ).filter(
+            Task.status.in_(ACTIVE_STATUSES)
+        ).group_by(
+            Task.requested_by, Task.project_name, Task.dataset_id
+        ).all()
+        for requested_by, project_name, dataset_id, count in rows:
+            counts.add(requested_by, project_name, dataset_id, count)
+        return counts
+
+    def admits(self, counts:ActiveCounts, task:Task) -> bool:
+        """
+        Whether one more task would stay within all caps
+        """
+        checks = (
+            (self.max_active, counts.total),
+            (self.max_per_user, counts.by_user[task.requested_by]),
+            (self.max_per_dataset, counts.by_dataset[task.dataset_id]),
+            (self.max_per_project if task.project_name else 0, counts.by_project[task.project_name])
+        )
+        return all(not cap or active < cap for cap, active in checks)
+
+    def pick(self, session:Session, candidates:list[QueuedTask]) -> QueuedTask|None:
+        """
+        Returns the candidate to start next, if any can start now.
+        candidates are expected in submission order
+        """
+        if not candidates:
+            return None
+        if not self.enabled:
+            return candidates[0]
+
+        self.refresh_statuses(session)
+        counts = self.active_counts(session)
+        for item in sorted(candidates, key=lambda item: counts.by_user[item.task.requested_by]):
+            if self.admits(counts, item.task):
+                return item
+        return None
+
+
+task_scheduler = TaskScheduler()
@@ -1,11 +1,15 @@
 from http.client import HTTPException
 import logging
-from functools import wraps
+from functools import partial, wraps
 from flask import request
 from sqlalchemy.exc import IntegrityError
 
+from app.helpers.audit_writer import audit_writer
+from app.helpers.base_model import db
+from app.helpers.const import AUDIT_ASYNC
 from app.helpers.exceptions import AuthenticationError, UnauthorizedError
-from app.helpers.keycloak import Keycloak
+from app.helpers.identity import Identity, get_identity, set_identity
+from app.helpers.keycloak import Keycloak, KEYCLOAK_TOKEN_VERIFICATION, verify_access_token
 from app.models.audit import Audit
 from app.models.dataset import Dataset
 from app.models.request import Request
@@ -15,6 +19,11 @@ logger = logging.getLogger('wrappers')
 logger.setLevel(logging.INFO)
 
 def auth(scope:str, check_dataset=True):
+    """
+    check_dataset can also be a function returning the datasets
+    the request refers to (i.e. a batch of tasks), the permission
+    is then checked on each of them
+    """
     def auth_wrapper(func):
         @wraps(func)
         def _auth(*args, **kwargs):
@@ -22,21 +31,54 @@ def auth(scope:str, check_dataset=True):
             if scope and not token:
                 raise AuthenticationError("Token not provided")
 
-            resource = 'endpoints'
+            resources = ['endpoints']
             ds_id = None
             requested_project = request.headers.get("project-name")
             client = 'global'
             token_type = 'refresh_token'
 
-            kc_client = Keycloak()
-            token_info = kc_client.decode_token(token)
-            user = kc_client.get_user_by_username(token_info['username'])
+            # Signed access tokens are verified against the realm keys,
+            # refresh tokens still go through Keycloak
+            claims = None
+            if KEYCLOAK_TOKEN_VERIFICATION == "local":
+                claims = verify_access_token(token)
 
-            if requested_project and not kc_client.is_user_admin(token):
-                dar = Request.get_active_project(requested_project, user["id"])
+            kc_client = Keycloak()
+            if claims is not None:
+                token_type = 'access_token'
+                username = claims.get('preferred_username')
+                roles = set(claims.get("realm_access", {}).get("roles", []))
+                identity = Identity(
+                    id=claims["sub"],
+                    email=claims.get("email"),
+                    username=username,
+                    roles=roles,
+                    is_admin="Administrator" in roles
+                )
+                is_privileged = bool(roles.intersection({"Super Administrator", "Administrator", "System"}))
+            else:
+                token_info = kc_client.decode_token(token)
+                username = token_info['username']
+                user = kc_client.get_user_by_username(username)
+                identity = Identity(
+                    id=user["id"],
+                    email=token_info.get("email"),
+                    username=username,
+                    roles=token_info.get("realm_access", {}).get("roles", []),
+                    admin_check=partial(kc_client.is_user_admin, token)
+                )
+                is_privileged = None
+            # Available to the endpoint, and to audit
+            set_identity(identity)
+
+            if requested_project and not identity.is_admin:
+                dar = Request.get_active_project(requested_project, identity.id)
                 if dar.dataset_id:
                     ds = Dataset.get_dataset_by_name_or_id(id=dar.dataset_id)
-                    resource = f"{ds.id}-{ds.name}"
+                    resources = [f"{ds.id}-{ds.name}"]
+
+            elif callable(check_dataset):
+                resources = [f"{ds.id}-{ds.name}" for ds in check_dataset()] or resources
 
             elif check_dataset:
                 ds_id = kwargs.get("dataset_id")
@@ -49,17 +91,32 @@ def auth(scope:str, check_dataset=True):
 
                 if ds_id or ds_name:
                     ds = Dataset.get_dataset_by_name_or_id(name=ds_name, id=ds_id)
-                    resource = f"{ds.id}-{ds.name}"
+                    resources = [f"{ds.id}-{ds.name}"]
 
             # If the user is an admin or system, ignore the project
-            if not kc_client.has_user_roles(user["id"], {"Super Administrator", "Administrator", "System"}):
+            if is_privileged is None:
+                is_privileged = kc_client.has_user_roles(identity.id, {"Super Administrator", "Administrator", "System"})
+            if not is_privileged:
                 if requested_project:
-                    client = f"Request {token_info['username']} - {requested_project}"
+                    client = f"Request {username} - {requested_project}"
                     kc_client = Keycloak(client)
-                    token = kc_client.exchange_global_token(token)
+                    token = kc_client.exchange_global_token(token, token_type=token_type)
                     token_type = 'access_token'
 
-            if kc_client.is_token_valid(token, scope, resource, token_type):
+            if claims is not None:
+                # Signature and expiry are already checked, the UMA decision
+                # also fails for revoked sessions
+                is_valid = all(
+                    kc_client.check_permissions(token, scope, resource, is_access_token=True)
+                    for resource in resources
+                )
+            else:
+                is_valid = all(
+                    kc_client.is_token_valid(token, scope, resource, token_type)
+                    for resource in resources
+                )
+
+            if is_valid:
                 return func(*args, **kwargs)
             else:
                 raise UnauthorizedError("Token is not valid, or the user has not enough permissions.")
@@ -101,16 +158,42 @@ def audit(func):
                 details = str(details)
 
         requested_by = ""
-        if "Authorization" in request.headers:
-            kc_client = Keycloak()
-            token = kc_client.decode_token(Keycloak.get_token_from_headers())
-            requested_by = kc_client.get_user_by_email(token["email"])["id"]
+        identity = get_identity()
+        if identity is not None:
+            requested_by = identity.id
+        elif "Authorization" in request.headers:
+            token = Keycloak.get_token_from_headers()
+            claims = None
+            if KEYCLOAK_TOKEN_VERIFICATION == "local":
+                claims = verify_access_token(token)
+
+            if claims is not None:
+                requested_by = claims["sub"]
+            else:
+                kc_client = Keycloak()
+                token_info = kc_client.decode_token(token)
+                requested_by = kc_client.get_user_by_email(token_info["email"])["id"]
 
         http_method = request.method
         http_endpoint = request.path
         api_function = func.__name__
-        to_save = Audit(source_ip, http_method, http_endpoint, requested_by, http_status, api_function, details)
-        to_save.add()
+        if AUDIT_ASYNC:
+            audit_writer.submit({
+                "ip_address": source_ip,
+                "http_method": http_method,
+                "endpoint": http_endpoint,
+                "requested_by": requested_by,
+                "status_code": http_status,
+                "api_function": api_function,
+                "details": details
+            })
+            # The synchronous entry used to commit whatever the endpoint
+            # left pending, keep doing so without a round-trip on reads
+            if db.session.new or db.session.dirty or db.session.deleted:
+                db.session.commit()
+        else:
+            to_save = Audit(source_ip, http_method, http_endpoint, requested_by, http_status, api_function, details)
+            to_save.add()
         if raised_exception:
             raise raised_exception
 
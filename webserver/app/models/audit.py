@@ -4,16 +4,20 @@ from sqlalchemy.sql import func
 from app.helpers.base_model import BaseModel, db
 
 class Audit(db.Model, BaseModel):
+    """
+    The table is range partitioned by month on event_time
+    (see the 58bc4ca83fb1 migration), hence the composite primary key
+    """
     __tablename__ = 'audit'
     id = Column(Integer, primary_key=True, autoincrement=True)
     ip_address = Column(String(256), nullable=False)
     http_method = Column(String(256), nullable=False)
-    endpoint = Column(String(256), nullable=False)
-    requested_by = Column(String(256), nullable=False)
-    status_code = Column(Integer)
+    endpoint = Column(String(256), nullable=False, index=True)
+    requested_by = Column(String(256), nullable=False, index=True)
+    status_code = Column(Integer, index=True)
     api_function = Column(String(256))
     details = Column(String(4096))
-    event_time = Column(DateTime(timezone=False), server_default=func.now())
+    event_time = Column(DateTime(timezone=False), primary_key=True, server_default=func.now(), index=True)
 
     def __init__(self,
                  ip_address:str,
@@ -1,10 +1,16 @@
+import logging
 import re
-from sqlalchemy import Column, Integer, Boolean, String, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, Boolean, String, ForeignKey
 from sqlalchemy.orm import relationship
 from app.helpers.base_model import BaseModel, db
+from app.helpers.container_registries import BaseRegistry
 from app.models.registry import Registry
 from app.helpers.exceptions import ContainerRegistryException, InvalidRequest
 
+logger = logging.getLogger('container_model')
+logger.setLevel(logging.INFO)
+
 
 class Container(db.Model, BaseModel):
     __tablename__ = 'containers'
@@ -13,6 +19,9 @@ class Container(db.Model, BaseModel):
     name = Column(String(256), nullable=False)
     tag = Column(String(256), nullable=True)
     sha = Column(String(256), nullable=True)
+    # Immutable digest the image was last resolved to, tasks run by digest
+    digest = Column(String(256), nullable=True)
+    digest_resolved_at = Column(DateTime(timezone=False), nullable=True)
     ml = Column(Boolean(), default=False)
     dashboard = Column(Boolean(), default=False)
 
@@ -62,3 +71,27 @@ class Container(db.Model, BaseModel):
             return f"{self.registry.url}/{self.name}@{self.sha}"
 
         return f"{self.registry.url}/{self.name}:{self.tag}"
+
+    def pinned_image_name(self) -> str:
+        """
+        The image name pods should use, by digest if it's been resolved
+        """
+        if self.digest:
+            return f"{self.registry.url}/{self.name}@{self.digest}"
+        return self.full_image_name()
+
+    def resolve_digest(self, registry_client:BaseRegistry|None=None) -> str|None:
+        """
+        Fetches the digest the tag (or sha) points to from the registry.
+        Registry errors are logged, and leave the previous value, as
+        the digest will be resolved again later.
+        registry_client can be passed in to reuse it across containers
+        """
+        try:
+            if registry_client is None:
+                registry_client = self.registry.get_registry_class()
+            self.digest = registry_client.resolve_digest(self.name, self.tag, self.sha)
+            self.digest_resolved_at = datetime.now()
+        except ContainerRegistryException as cre:
+            logger.warning("Could not resolve the digest of %s: %s", self.full_image_name(), cre.description)
+        return self.digest
@@ -4,6 +4,7 @@ import requests
 from sqlalchemy import Column, Integer, String
 from app.helpers.base_model import BaseModel, db
 from app.helpers.const import DEFAULT_NAMESPACE, TASK_NAMESPACE, PUBLIC_URL
+from app.helpers.dataset_engines import dataset_engines
 from app.helpers.exceptions import DBRecordNotFoundError, InvalidRequest, KubernetesException
 from app.helpers.keycloak import Keycloak
 from app.helpers.kubernetes import KubernetesClient
@@ -148,13 +149,14 @@ class Dataset(db.Model, BaseModel):
         admin_policy = kc_client.get_policy('admin-policy')
         sys_policy = kc_client.get_policy('system-policy')
 
-        admin_ds_scope = []
-        admin_ds_scope.append(kc_client.get_scope('can_admin_dataset'))
-        admin_ds_scope.append(kc_client.get_scope('can_access_dataset'))
-        admin_ds_scope.append(kc_client.get_scope('can_exec_task'))
-        admin_ds_scope.append(kc_client.get_scope('can_admin_task'))
-        admin_ds_scope.append(kc_client.get_scope('can_send_request'))
-        admin_ds_scope.append(kc_client.get_scope('can_admin_request'))
+        admin_ds_scope = kc_client.get_scopes([
+            'can_admin_dataset',
+            'can_access_dataset',
+            'can_exec_task',
+            'can_admin_task',
+            'can_send_request',
+            'can_admin_request'
+        ])
         policy = kc_client.create_policy({
             "name": f"{self.id} - {self.name} Admin Policy",
             "description": f"List of users allowed to administrate the {self.name} dataset",
@@ -243,6 +245,12 @@ class Dataset(db.Model, BaseModel):
         # Update table
         if kwargs:
             self.query.filter(Dataset.id == self.id).update(kwargs, synchronize_session='evaluate')
+        # Connections are opened again with the new details
+        dataset_engines.dispose(self.id)
+
+    def delete(self, commit=True):
+        super().delete(commit)
+        dataset_engines.dispose(self.id)
 
     @classmethod
     def get_dataset_by_name_or_id(cls, id:int=None, name:str="") -> "Dataset":
@@ -0,0 +1,31 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, DateTime, String, ForeignKey, JSON
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.helpers.base_model import BaseModel, db
+from app.models.task import Task
+
+class QueuedTask(db.Model, BaseModel):
+    """
+    Tasks submitted in queue mode, waiting for a worker
+    (app.helpers.task_queue) to create their pod.
+    run_spec holds the request fields Task.run needs,
+    which are not stored on the tasks table
+    """
+    __tablename__ = 'task_queue'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_spec = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=False), server_default=func.now(), index=True)
+    last_error = Column(String(4096))
+    created_at = Column(DateTime(timezone=False), server_default=func.now())
+
+    task_id = Column(Integer, ForeignKey(Task.id, ondelete='CASCADE'), unique=True, nullable=False)
+    task = relationship("Task")
+
+    def __init__(self, task:Task):
+        self.task = task
+        self.run_spec = task.get_run_spec()
+        self.attempts = 0
+        self.next_attempt_at = datetime.now()
+        self.created_at = datetime.now()
@@ -6,7 +6,9 @@ from kubernetes.client.exceptions import ApiException
 from sqlalchemy import Column, Integer, String, Boolean
 
 from app.helpers.const import TASK_NAMESPACE
-from app.helpers.container_registries import AzureRegistry, BaseRegistry, DockerRegistry, GitHubRegistry
+from app.helpers.container_registries import (
+    AzureRegistry, BaseRegistry, DockerRegistry, GitHubRegistry, credentials_cache
+)
 from app.helpers.base_model import BaseModel, db
 from app.helpers.exceptions import ContainerRegistryException, InvalidRequest
 from app.helpers.kubernetes import KubernetesClient
@@ -99,6 +101,7 @@ class Registry(db.Model, BaseModel):
         }
         secret.data['.dockerconfigjson'] = v1.encode_secret_value(json.dumps(dockerjson))
         v1.patch_namespaced_secret(namespace=TASK_NAMESPACE, name=secret_name, body=secret)
+        credentials_cache.invalidate(secret_name)
 
     def _get_creds(self):
         if hasattr(self, "username") and hasattr(self, "password"):
@@ -115,25 +118,36 @@ class Registry(db.Model, BaseModel):
         """
         We have interface classes with dedicated login, and
         image tag parsers. Based on the registry name
-        infers the appropriate class
+        infers the appropriate class.
+        Credentials read from the pull secret are cached
         """
         args = {
             "registry": self._get_name(),
             "creds": self._get_creds()
         }
+        secret_name = None
         if self.id:
-            args["secret_name"]= self.slugify_name()
+            secret_name = self.slugify_name()
+            creds = credentials_cache.get(secret_name)
+            if creds is None:
+                args["secret_name"] = secret_name
+            else:
+                args["creds"] = creds
         matches = re.search(r'azurecr\.io|ghcr\.io', self.url)
 
         matches = '' if matches is None else matches.group()
 
         match matches:
             case 'azurecr.io':
-                return AzureRegistry(**args)
+                _class = AzureRegistry(**args)
             case 'ghcr.io':
-                return GitHubRegistry(**args)
+                _class = GitHubRegistry(**args)
             case _:
-                return DockerRegistry(**args)
+                _class = DockerRegistry(**args)
+
+        if "secret_name" in args:
+            credentials_cache.set(secret_name, _class.creds)
+        return _class
 
     def fetch_image_list(self) -> list[str]:
         """
@@ -146,6 +160,7 @@ class Registry(db.Model, BaseModel):
     def delete(self, commit:bool=False):
         session = db.session
         super().delete(commit)
+        credentials_cache.invalidate(self.slugify_name())
         v1 = KubernetesClient()
         try:
             v1.delete_namespaced_secret(namespace=TASK_NAMESPACE, name=self.slugify_name())
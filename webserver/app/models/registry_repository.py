@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, DateTime, String, ForeignKey, UniqueConstraint
+from app.helpers.base_model import BaseModel, db
+from app.models.registry import Registry
+
+class RegistryRepository(db.Model, BaseModel):
+    """
+    A repository as seen by the last /containers/sync.
+    etag and last_modified are the validators of its tags
+    listing, so unchanged repositories are skipped next time
+    """
+    __tablename__ = 'registry_repositories'
+    __table_args__ = (
+        UniqueConstraint('registry_id', 'name'),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(256), nullable=False)
+    etag = Column(String(256))
+    last_modified = Column(String(64))
+    synced_at = Column(DateTime(timezone=False))
+
+    registry_id = Column(Integer, ForeignKey(Registry.id, ondelete='CASCADE'), nullable=False)
+
+    def __init__(self, registry_id:int, name:str):
+        self.registry_id = registry_id
+        self.name = name
+
+    @property
+    def validators(self) -> dict[str, str|None]:
+        return {"etag": self.etag, "last_modified": self.last_modified}
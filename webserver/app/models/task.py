@@ -2,6 +2,8 @@ import logging
 import json
 import re
 from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator
 from kubernetes.client import V1CustomResourceDefinition
 from kubernetes.client.exceptions import ApiException
 from sqlalchemy import Column, Integer, DateTime, String, ForeignKey, Boolean
@@ -12,9 +14,13 @@ from uuid import uuid4
 import urllib3
 from app.helpers.const import (
     AUTO_DELIVERY_RESULTS, CLEANUP_AFTER_DAYS, CRD_DOMAIN, MEMORY_RESOURCE_REGEX, MEMORY_UNITS, CPU_RESOURCE_REGEX, PUBLIC_URL, TASK_CONTROLLER,
-    TASK_NAMESPACE, TASK_POD_RESULTS_PATH, TASK_POD_INPUTS_PATH, RESULTS_PATH, TASK_REVIEW
+    SHARED_RESULTS_PATH, TASK_NAMESPACE, TASK_POD_RESULTS_PATH, TASK_POD_INPUTS_PATH, TASK_RECONCILER, TASK_REVIEW
 )
+from app.helpers.archive import directory_to_tar
+from app.helpers.container_registries import cached_image_check
 from app.helpers.base_model import BaseModel, db
+from app.helpers.identity import current_identity
+from app.helpers.informer import pod_informer
 from app.helpers.keycloak import Keycloak
 from app.helpers.kubernetes import KubernetesBatchClient, KubernetesCRDClient, KubernetesClient
 from app.helpers.exceptions import DBError, InvalidRequest, TaskCRDExecutionException, TaskImageException, TaskExecutionException
@@ -28,6 +34,9 @@ logger = logging.getLogger('task_model')
 logger.setLevel(logging.INFO)
 
 
+# Max task ids in a single label selector when listing pods for a page
+POD_PREFETCH_CHUNK = 100
+
 REVIEW_STATUS = {
     True: "Approved Release",
     False: "Blocked Release",
@@ -35,17 +44,36 @@ REVIEW_STATUS = {
 }
 
 
+def _lookup(lookups:dict|None, key:tuple, resolve):
+    """
+    Memoizes resolve() in lookups, if given
+    """
+    if lookups is None:
+        return resolve()
+    if key not in lookups:
+        lookups[key] = resolve()
+    return lookups[key]
+
+
 class Task(db.Model, BaseModel):
     __tablename__ = 'tasks'
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(256), nullable=False)
     docker_image = Column(String(256), nullable=False)
+    # The digest docker_image was resolved to when the task pod was created
+    image_digest = Column(String(256), nullable=True)
     description = Column(String(4096))
-    status = Column(String(256), default='scheduled')
+    status = Column(String(256), default='scheduled', index=True)
     created_at = Column(DateTime(timezone=False), server_default=func.now())
     updated_at = Column(DateTime(timezone=False), onupdate=func.now())
     requested_by = Column(String(256), nullable=False)
+    project_name = Column(String(256), nullable=True, index=True)
     review_status = Column(Boolean, nullable=True)
+    # Kept up to date by the status reconciler (app.reconciler)
+    started_at = Column(DateTime(timezone=False), nullable=True)
+    finished_at = Column(DateTime(timezone=False), nullable=True)
+    exit_code = Column(Integer, nullable=True)
+    status_reason = Column(String(256), nullable=True)
     dataset_id = Column(Integer, ForeignKey(Dataset.id, ondelete='CASCADE'))
     dataset = relationship("Dataset")
 
@@ -66,6 +94,7 @@ class Task(db.Model, BaseModel):
         self.status = 'scheduled'
         self.docker_image = docker_image
         self.requested_by = requested_by
+        self.project_name = kwargs.get("project_name")
         self.dataset = dataset
         self.description = description
         self.created_at = datetime.now()
@@ -78,18 +107,44 @@ class Task(db.Model, BaseModel):
         self.is_from_controller = kwargs.get("from_controller", False)
         self.db_query = kwargs.get("db_query", {})
 
+    def get_run_spec(self) -> dict:
+        """
+        The request fields run needs that are not stored
+        in the tasks table, to run the task at a later stage
+        """
+        return {
+            "executors": self.executors,
+            "tags": self.tags,
+            "resources": self.resources,
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "db_query": self.db_query,
+            "from_controller": self.is_from_controller
+        }
+
+    def load_run_spec(self, run_spec:dict):
+        self.executors = run_spec.get("executors", [])
+        self.tags = run_spec.get("tags", {})
+        self.resources = run_spec.get("resources", {})
+        self.inputs = run_spec.get("inputs", {})
+        self.outputs = run_spec.get("outputs", {})
+        self.db_query = run_spec.get("db_query", {})
+        self.is_from_controller = run_spec.get("from_controller", False)
+
     @classmethod
-    def validate(cls, data:dict):
+    def validate(cls, data:dict, lookups:dict|None=None):
+        """
+        Validates a task definition, resolving its dataset and image.
+            lookups is an optional dictionary shared across the validation
+            of several tasks (i.e. a batch), so that datasets and images
+            are resolved only once. The resolved image is set as `image`
+        """
         data["name"] = (data.get("name") or "").replace(" ", "")
         if not data["name"]:
             raise InvalidRequest("name is a mandatory field")
 
-        kc_client = Keycloak()
-        user_token = Keycloak.get_token_from_headers()
-
-        decoded_token = kc_client.decode_token(user_token)
-        data["requested_by"] = kc_client.get_user_by_email(decoded_token["email"])["id"]
-        user = kc_client.get_user_by_id(data["requested_by"])
+        identity = current_identity()
+        data["requested_by"] = identity.id
         # Support only for one image at a time, the standard is executors == list
         executors = data["executors"][0]
         data["docker_image"] = executors["image"]
@@ -101,28 +156,35 @@ class Task(db.Model, BaseModel):
         data["from_controller"] = is_from_controller
         # Dataset validation
         if repository:
-            data["dataset"] = Dataset.query.filter(
+            data["dataset"] = _lookup(lookups, ("repository", repository.lower()), lambda: Dataset.query.filter(
                 Dataset.repository.ilike(repository)
-            ).one_or_none()
+            ).one_or_none())
             if data["dataset"] is None:
                 raise InvalidRequest(f"No datasets linked with the repository {repository}")
 
-        elif kc_client.is_user_admin(user_token):
+        elif identity.is_admin:
             ds_id = data.get("tags", {}).get("dataset_id")
             ds_name = data.get("tags", {}).get("dataset_name")
             if ds_name or ds_id:
-                data["dataset"] = Dataset.get_dataset_by_name_or_id(name=ds_name, id=ds_id)
+                data["dataset"] = _lookup(
+                    lookups, ("dataset", ds_id, ds_name),
+                    lambda: Dataset.get_dataset_by_name_or_id(name=ds_name, id=ds_id)
+                )
             else:
                 raise InvalidRequest("Administrators need to provide `tags.dataset_id` or `tags.dataset_name`")
         else:
-            data["dataset"] = Request.get_active_project(
+            data["dataset"] = _lookup(lookups, ("project", data["project_name"]), lambda: Request.get_active_project(
                 data["project_name"],
-                user["id"]
-            ).dataset
+                identity.id
+            ).dataset)
 
         # Docker image validation
         Container.validate_image_format(data["docker_image"], data["docker_image"])
-        data["docker_image"] = cls.get_image_with_repo(data["docker_image"])
+        data["image"] = _lookup(
+            lookups, ("image", data["docker_image"]),
+            lambda: cls.get_image_with_repo(data["docker_image"], False)
+        )
+        data["docker_image"] = data["image"].full_image_name()
 
         # Output volumes validation
         if not isinstance(data.get("outputs", {}), dict):
@@ -239,6 +301,8 @@ class Task(db.Model, BaseModel):
         """
         Looks through the CRs for the image and if exists,
         returns the full image name with the repo prefixing the image.
+        The registry check is skipped if the image digest has been
+        resolved, and cached otherwise, see cached_image_check
         """
         registry, image = cls.split_registry_from_image(docker_image)
 
@@ -257,8 +321,12 @@ class Task(db.Model, BaseModel):
         if image is None:
             raise TaskExecutionException(f"Image {docker_image} could not be found")
 
-        registry_client = image.registry.get_registry_class()
-        if not registry_client.has_image_tag_or_sha(image.name, image.tag, image.sha):
+        # A resolved digest was found on the registry, and
+        # is kept up to date by the digest refresher
+        if image.digest is None and not cached_image_check(
+            registry, image.name, image.tag, image.sha,
+            lambda: image.registry.get_registry_class().has_image_tag_or_sha(image.name, image.tag, image.sha)
+        ):
             raise TaskImageException(f"Image {docker_image} not found on our repository")
         if string_only:
             return image.full_image_name()
@@ -289,11 +357,13 @@ class Task(db.Model, BaseModel):
     def needs_crd(self):
         return ((not self.is_from_controller) and TASK_CONTROLLER is not None and AUTO_DELIVERY_RESULTS is not None )
 
-    def run(self, validate=False):
+    def run(self, validate=False, image:Container|None=None):
         """
         Method to spawn a new pod with the requested image
         : param validate : An optional parameter to basically run in dry_run mode
             Defaults to False
+        : param image : The image already resolved and checked against its
+            registry, if None it's looked up again
         """
         v1 = KubernetesClient()
         secret_name = self.dataset.get_creds_secret_name()
@@ -303,11 +373,14 @@ class Task(db.Model, BaseModel):
         if len(self.executors):
             command=self.executors[0].get("command", '')
 
-        image: Container = self.get_image_with_repo(self.docker_image, False)
+        if image is None:
+            image = self.get_image_with_repo(self.docker_image, False)
+        # Run by digest, so all pods of the task (and retries) get the same image
+        self.image_digest = image.digest
 
         body = TaskPod(**{
             "name": self.pod_name(),
-            "image": self.docker_image,
+            "image": image.pinned_image_name(),
             "dataset": self.dataset,
             "db_query": self.db_query,
             "labels": {
@@ -343,24 +416,63 @@ class Task(db.Model, BaseModel):
             # create CRD
             self.create_controller_crd()
 
+    @classmethod
+    def prepare_page(cls, tasks:list["Task"]):
+        """
+        Lists the pods for a whole page of tasks with a single
+        label selector query (or from the informer, if running),
+        so that get_status won't need a k8s API call per task
+        """
+        if not tasks or TASK_RECONCILER:
+            return
+
+        if pod_informer.ready:
+            for task in tasks:
+                task.prefetched_pods = pod_informer.by_label("task_id", str(task.id))
+            return
+
+        pods_by_task = {str(task.id): [] for task in tasks}
+        task_ids = list(pods_by_task)
+        v1 = KubernetesClient()
+        for i in range(0, len(task_ids), POD_PREFETCH_CHUNK):
+            pods = v1.list_namespaced_pod(
+                TASK_NAMESPACE,
+                label_selector=f"task_id in ({",".join(task_ids[i:i + POD_PREFETCH_CHUNK])})"
+            )
+            for pod in pods.items:
+                task_id = (pod.metadata.labels or {}).get("task_id")
+                if task_id in pods_by_task:
+                    pods_by_task[task_id].append(pod)
+
+        for task in tasks:
+            task.prefetched_pods = pods_by_task[str(task.id)]
+
+    def runs_task_image(self, images:list[str]) -> bool:
+        """
+        Whether a pod with these container images is running this
+        task image, either by name or by the digest it was pinned to
+        """
+        if self.docker_image in images:
+            return True
+        return self.image_digest is not None and any(im.endswith(f"@{self.image_digest}") for im in images)
+
     def get_current_pod(self, is_running:bool=True):
         """
-        Fetches the pod object from k8s API.
+        Fetches the pod object from k8s API, unless they have
+        been already listed by prepare_page.
             is_running will only consider running pods only
         """
-        v1 = KubernetesClient()
-        running_pods = v1.list_namespaced_pod(
-            TASK_NAMESPACE,
-            label_selector=f"task_id={self.id}"
-        )
+        pods = getattr(self, "prefetched_pods", None)
+        if pods is None:
+            pods = KubernetesClient().list_pods_by_label("task_id", str(self.id))
         try:
-            running_pods.items.sort(key=lambda x: x.metadata.creation_timestamp, reverse=True)
-            for pod in running_pods.items:
+            pods = sorted(pods, key=lambda x: x.metadata.creation_timestamp, reverse=True)
+            for pod in pods:
                 images = [im.image for im in pod.spec.containers]
                 statuses = []
                 if pod.status.container_statuses and is_running:
                     statuses = [st.state.terminated for st in pod.status.container_statuses]
-                if self.docker_image in images and not statuses:
+                if self.runs_task_image(images) and not statuses:
                     return pod
         except IndexError:
             return
@@ -374,6 +486,9 @@ class Task(db.Model, BaseModel):
             :dict: if the pod exists
             :str: if the pod is not found or deleted
         """
+        if TASK_RECONCILER:
+            return self.get_persisted_status()
+
         try:
             status_obj = self.get_current_pod(is_running=False).status.container_statuses
             if status_obj is None:
@@ -402,6 +517,33 @@ class Task(db.Model, BaseModel):
         except AttributeError:
             return self.status if self.status != 'running' else 'deleted'
 
+    def get_persisted_status(self) -> dict | str:
+        """
+        Same format as get_status, but from the columns the
+        status reconciler keeps up to date, without any k8s call
+        """
+        match self.status:
+            case 'running':
+                return {"running": {"started_at": self.started_at}}
+            case 'terminated':
+                return {
+                    "terminated": {
+                        "started_at": self.started_at,
+                        "finished_at": self.finished_at,
+                        "exit_code": self.exit_code,
+                        "reason": self.status_reason
+                    }
+                }
+            case _:
+                return self.status
+
+    def has_finished(self) -> bool:
+        """
+        Once the task pod terminated, its results won't change anymore
+        """
+        status = self.get_status()
+        return isinstance(status, dict) and "terminated" in status
+
     def terminate_pod(self):
         """
         Terminate a pod, checking if during the process
@@ -409,14 +551,21 @@ class Task(db.Model, BaseModel):
         """
         v1 = KubernetesClient()
         has_error = False
-        try:
-            v1.delete_namespaced_pod(self.pod_name(), namespace=TASK_NAMESPACE)
-        except ApiException as kexc:
-            logger.error(kexc.reason)
-            has_error = True
+        # Waits for a queue worker moving the task out of 'starting',
+        # and reads its current status
+        db.session.refresh(self, with_for_update=True)
+        # Queued tasks have no pod yet. The queue workers skip cancelled
+        # tasks, and remove the pod of a task cancelled while starting
+        if self.status not in ('queued', 'starting'):
+            try:
+                v1.delete_namespaced_pod(self.pod_name(), namespace=TASK_NAMESPACE)
+            except ApiException as kexc:
+                logger.error(kexc.reason)
+                has_error = True
 
         try:
             self.status = 'cancelled'
+            db.session.commit()
         except Exception as exc:
             raise DBError("An error occurred while updating") from exc
 
@@ -424,11 +573,29 @@ class Task(db.Model, BaseModel):
             raise TaskExecutionException("Task already cancelled")
         return self.sanitized_dict()
 
-    def get_results(self):
+    def shared_results_path(self) -> Path | None:
+        """
+        The task results folder on the backend read-only mount,
+        if the backend shares the tasks storage
+        """
+        if not SHARED_RESULTS_PATH:
+            return None
+        path = Path(SHARED_RESULTS_PATH) / str(self.id) / "results"
+        return path if path.is_dir() else None
+
+    def get_results(self) -> Iterator[bytes]:
         """
-        The idea is to create a job that holds indefinitely
-        so that the backend can copy the results
+        Returns the results as a tar stream.
+        If the backend shares the tasks storage, the results
+        folder is read directly. Otherwise a job that holds
+        indefinitely is created, so that the backend can
+        stream the results out of it. The job is removed
+        once the stream is consumed or closed
         """
+        shared_path = self.shared_results_path()
+        if shared_path is not None:
+            return directory_to_tar(shared_path)
+
         v1_batch = KubernetesBatchClient()
         job_name = f"result-job-{uuid4()}"
         job = v1_batch.create_job_spec({
@@ -456,16 +623,7 @@ class Task(db.Model, BaseModel):
             v1 = KubernetesClient()
             v1.is_pod_ready(label=f"job-name={job_name}")
 
-            job_pod = v1.list_namespaced_pod(namespace=TASK_NAMESPACE, label_selector=f"job-name={job_name}").items[0]
-
-            res_file = v1.cp_from_pod(
-                pod_name=job_pod.metadata.name,
-                source_path=TASK_POD_RESULTS_PATH,
-                dest_path=f"{RESULTS_PATH}/{self.id}/results",
-                out_name=f"{PUBLIC_URL}-results-{self.id}"
-            )
-            v1.delete_pod(job_pod.metadata.name)
-            v1_batch.delete_job(job_name)
+            job_pod = v1.list_pods_by_label("job-name", job_name)[0]
         except ApiException as e:
             if 'job_pod' in locals() and self.get_current_pod(job_pod.metadata.name):
                 v1_batch.delete_job(job_name)
@@ -473,7 +631,25 @@ class Task(db.Model, BaseModel):
             raise InvalidRequest(f"Failed to run pod: {e.reason}") from e
         except urllib3.exceptions.MaxRetryError as mre:
             raise InvalidRequest("The cluster could not create the job") from mre
-        return res_file
+        return self._stream_results(v1, v1_batch, job_pod.metadata.name, job_name)
+
+    def _stream_results(
+            self,
+            v1:KubernetesClient,
+            v1_batch:KubernetesBatchClient,
+            pod_name:str,
+            job_name:str
+        ) -> Iterator[bytes]:
+        try:
+            yield from v1.stream_from_pod(pod_name, TASK_POD_RESULTS_PATH)
+        finally:
+            # The response is already being sent, a failed
+            # cleanup can only be logged
+            try:
+                v1.delete_pod(pod_name)
+                v1_batch.delete_job(job_name)
+            except InvalidRequest as ir:
+                logger.error("Task %s results job cleanup failed: %s", self.id, ir.description)
 
     def create_controller_crd(self):
         """
@@ -576,7 +752,6 @@ class Task(db.Model, BaseModel):
         annotation with the appropriate approved value
         """
         crd_client = KubernetesCRDClient()
-        crd_client.api_client.set_default_header('Content-Type', 'application/json-patch+json')
         try:
             task_crd: V1CustomResourceDefinition | None = self.get_task_crd()
             if not task_crd:
@@ -586,7 +761,9 @@ class Task(db.Model, BaseModel):
             annotations[f"{CRD_DOMAIN}/approved"] = str(approval)
             crd_client.patch_cluster_custom_object(
                 CRD_DOMAIN, "v1", "analytics", self.crd_name(),
-                [{"op": "add", "path": "/metadata/annotations", "value": annotations}]
+                [{"op": "add", "path": "/metadata/annotations", "value": annotations}],
+                # The api client is shared, so don't change its default headers
+                _content_type='application/json-patch+json'
             )
         except ApiException as apie:
             raise TaskCRDExecutionException(apie.body, apie.status) from apie
@@ -0,0 +1,197 @@
+"""
+Task status reconciler.
+
+Watches the task pods through an informer and writes their status,
+start/finish times, exit code and reason into the tasks table, in
+batched transactions. Runs as its own process:
+
+    python -m app.reconciler
+
+With TASK_RECONCILER set, the API reads the task status from the
+database instead of asking Kubernetes.
+"""
+import logging
+import signal
+import threading
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+
+from app.helpers.base_model import engine
+from app.helpers.const import TASK_NAMESPACE
+from app.helpers.informer import Informer
+from app.helpers.kubernetes import KubernetesClient
+from app.models.task import Task
+
+logger = logging.getLogger('reconciler')
+logger.setLevel(logging.INFO)
+
+# Statuses set by the API that pod events should not overwrite
+FINAL_STATUSES = ("cancelled",)
+
+
+def to_db_time(value:datetime|None) -> datetime|None:
+    """
+    k8s timestamps are timezone aware, the tasks columns are not
+    and hold local times like created_at
+    """
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def pod_status_columns(pod) -> dict|None:
+    """
+    Same interpretation of the first container state as
+    Task.get_status, returned as tasks column values
+    """
+    statuses = pod.status.container_statuses if pod.status else None
+    if not statuses:
+        return None
+
+    state = statuses[0].state
+    for status in ['running', 'waiting', 'terminated']:
+        st = getattr(state, status, None)
+        if st is not None:
+            break
+    else:
+        return None
+
+    exit_code = getattr(st, "exit_code", None)
+    return {
+        "status": status,
+        "started_at": to_db_time(getattr(st, "started_at", None)),
+        "finished_at": to_db_time(getattr(st, "finished_at", None)),
+        "exit_code": int(exit_code) if exit_code is not None else None,
+        "status_reason": getattr(st, "reason", None)
+    }
+
+
+class StatusReconciler:  # pylint: disable=too-many-instance-attributes
+    """
+    Queues the pod changes reported by the informer, and writes
+    them to the tasks table every flush_interval seconds
+    """
+    def __init__(self, informer:Informer, bind=engine, batch_size:int=100, flush_interval:float=1):
+        self.informer = informer
+        self.bind = bind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: dict[int, dict] = {}
+        self._deleted: set[int] = set()
+        self._last_written: dict[int, dict] = {}
+        self._stop = threading.Event()
+        self.updates = 0
+
+    def handle(self, event_type:str, pod):
+        """
+        Informer handler, only queues the change
+        """
+        task_id = (pod.metadata.labels or {}).get("task_id")
+        if not task_id or not task_id.isdigit():
+            return
+        task_id = int(task_id)
+
+        with self._lock:
+            if event_type == "DELETED":
+                self._pending.pop(task_id, None)
+                self._deleted.add(task_id)
+                self._last_written.pop(task_id, None)
+                return
+
+            columns = pod_status_columns(pod)
+            if columns is None or self._last_written.get(task_id) == columns:
+                return
+            self._deleted.discard(task_id)
+            self._pending[task_id] = columns
+
+    def flush(self):
+        """
+        Writes all queued changes in a single transaction
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            deleted, self._deleted = self._deleted, set()
+        if not (pending or deleted):
+            return
+
+        tasks = Task.__table__
+        rows = [
+            {"task_id": task_id, **{f"new_{k}": v for k, v in cols.items()}}
+            for task_id, cols in pending.items()
+        ]
+        try:
+            with self.bind.begin() as conn:
+                for i in range(0, len(rows), self.batch_size):
+                    conn.execute(
+                        update(tasks)
+                        .where(
+                            tasks.c.id == bindparam("task_id"),
+                            tasks.c.status.not_in(FINAL_STATUSES)
+                        )
+                        .values(
+                            status=bindparam("new_status"),
+                            started_at=bindparam("new_started_at"),
+                            finished_at=bindparam("new_finished_at"),
+                            exit_code=bindparam("new_exit_code"),
+                            status_reason=bindparam("new_status_reason"),
+                            updated_at=datetime.now()
+                        ),
+                        rows[i:i + self.batch_size]
+                    )
+                if deleted:
+                    # Same as get_status: a running task without a pod was deleted
+                    conn.execute(
+                        update(tasks)
+                        .where(tasks.c.id.in_(deleted), tasks.c.status == 'running')
+                        .values(status='deleted', updated_at=datetime.now())
+                    )
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.error("Failed to persist %s task statuses: %s", len(rows) + len(deleted), exc)
+            # Retry on the next flush, unless newer events came in
+            with self._lock:
+                for task_id, cols in pending.items():
+                    self._pending.setdefault(task_id, cols)
+                self._deleted |= deleted
+            return
+
+        with self._lock:
+            self._last_written.update(pending)
+        self.updates += len(rows) + len(deleted)
+
+    def run(self):
+        """
+        Starts the informer and flushes the queued changes
+        until stopped
+        """
+        self.informer.add_handler(self.handle)
+        self.informer.start()
+        logger.info("Reconciling task pods in %s", self.informer.namespace)
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.informer.stop()
+        self.flush()
+
+    # pylint: disable=unused-argument
+    def stop(self, *args):
+        """
+        Also the SIGTERM/SIGINT handler
+        """
+        self._stop.set()
+
+
+def main():
+    """
+    Entrypoint of the reconciler process
+    """
+    logging.basicConfig(level=logging.INFO)
+    informer = Informer("pods", KubernetesClient().list_namespaced_pod, TASK_NAMESPACE)
+    reconciler = StatusReconciler(informer)
+    signal.signal(signal.SIGTERM, reconciler.stop)
+    signal.signal(signal.SIGINT, reconciler.stop)
+    reconciler.run()
+
+
+if __name__ == "__main__":
+    main()
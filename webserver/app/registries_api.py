@@ -9,12 +9,15 @@ containers endpoints:
 from http import HTTPStatus
 from flask import Blueprint, request
 
+from app.helpers.base_model import db
+from app.helpers.container_registries import image_cache
 from app.helpers.exceptions import DBRecordNotFoundError, InvalidRequest
 from app.helpers.wrappers import audit, auth
 from app.models.registry import Registry
 
 
 bp = Blueprint('registries', __name__, url_prefix='/registries')
+session = db.session
 
 
 @bp.route('/', methods=['GET'])
@@ -53,6 +56,7 @@ def delete_registry_by_id(registry_id:int):
         raise DBRecordNotFoundError("Registry not found")
 
     registry.delete(commit=True)
+    image_cache.invalidate_prefix((registry.url,))
     return "", 204
 
 
@@ -84,6 +88,10 @@ def patch_registry(registry_id:int):
     if registry is None:
         raise InvalidRequest(f"Registry {registry_id} not found")
 
+    previous_url = registry.url
     registry.update(**request.json)
+    session.commit()
+    # i.e. the credentials changed
+    image_cache.invalidate_prefix((previous_url,))
 
     return {}, 204
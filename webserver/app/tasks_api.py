@@ -3,6 +3,7 @@ tasks-related endpoints:
 - GET /tasks/service-info
 - GET /tasks
 - POST /tasks
+- POST /tasks/batch
 - POST /tasks/validate
 - GET /tasks/id
 - POST /tasks/id/cancel
@@ -10,24 +11,39 @@ tasks-related endpoints:
 - POST /tasks/id/results/approve
 - POST /tasks/id/results/block
 """
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from http import HTTPStatus
-from flask import Blueprint, request, send_file
+from flask import Blueprint, Flask, Response, current_app, request, send_file, stream_with_context
 
-from app.helpers.const import CLEANUP_AFTER_DAYS, PUBLIC_URL, TASK_REVIEW
+from app.helpers.archive import tar_to_zip
+from app.helpers.const import (
+    CLEANUP_AFTER_DAYS, PUBLIC_URL, TASK_BATCH_MAX_SIZE,
+    TASK_BATCH_WORKERS, TASK_QUEUE, TASK_REVIEW
+)
 from app.helpers.exceptions import (
     DBRecordNotFoundError, FeatureNotAvailableException,
-    UnauthorizedError, InvalidRequest
+    LogAndException, UnauthorizedError, InvalidRequest
 )
-from app.helpers.keycloak import Keycloak
+from app.helpers.identity import current_identity
 from app.helpers.wrappers import audit, auth
 from app.helpers.base_model import db
 from app.helpers.query_filters import parse_query_params
+from app.helpers.results_cache import results_cache
+from app.helpers.task_queue import task_queue
+from app.helpers.task_scheduler import task_scheduler
+from app.models.container import Container
+from app.models.dataset import Dataset
 from app.models.task import Task
 
 bp = Blueprint('tasks', __name__, url_prefix='/tasks')
 session = db.session
 
+RESULTS_MIMETYPES = {
+    "zip": "application/zip",
+    "tar": "application/x-tar"
+}
+
 
 def does_user_own_task(task:Task):
     """
@@ -36,12 +52,8 @@ def does_user_own_task(task:Task):
 
     If they don't, an exception is raised with 403 status code
     """
-    kc_client = Keycloak()
-    token = kc_client.get_token_from_headers()
-    dec_token = kc_client.decode_token(token)
-    user_id = kc_client.get_user_by_email(dec_token["email"])["id"]
-
-    if task.requested_by != user_id and not kc_client.is_user_admin(token):
+    identity = current_identity()
+    if task.requested_by != identity.id and not identity.is_admin:
         raise UnauthorizedError("User does not have enough permissions")
 
 @bp.route('/service-info', methods=['GET'])
@@ -99,21 +111,164 @@ def cancel_tasks(task_id):
 @auth(scope='can_exec_task')
 def post_tasks():
     """
-    POST /tasks/ endpoint. Creates a new task
+    POST /tasks/ endpoint. Creates a new task.
+        In queue mode, or with concurrency caps, the task
+        is only stored, and a worker will start it
     """
     try:
         req_body = request.json
         req_body["project_name"] = request.headers.get("project-name")
         body = Task.validate(req_body)
         task = Task(**body)
+        if TASK_QUEUE or task_scheduler.enabled:
+            task_queue.enqueue(task)
+            session.commit()
+            task_queue.notify()
+            return {"task_id": task.id, "status": task.status}, HTTPStatus.ACCEPTED
+
         task.add()
         # Create pod/start ML pipeline
-        task.run()
+        task.run(image=body["image"])
         return {"task_id": task.id}, HTTPStatus.CREATED
     except:
         session.rollback()
         raise
 
+def start_batch_task(app:Flask, task_id:int, image_id:int, run_spec:dict) -> dict:
+    """
+    Creates the pod for a task of a batch. Runs in a worker
+    thread, with its own app context and db session
+    """
+    with app.app_context():
+        task = db.session.get(Task, task_id)
+        task.load_run_spec(run_spec)
+        try:
+            task.run(image=db.session.get(Container, image_id))
+            db.session.commit()
+            return {"task_id": task_id, "status": task.status}
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            error = getattr(exc, "description", None) or str(exc)
+            db.session.rollback()
+            task.status = 'failed'
+            task.status_reason = str(error)[:256]
+            db.session.commit()
+            return {
+                "task_id": task_id,
+                "status": task.status,
+                "status_code": getattr(exc, "code", HTTPStatus.INTERNAL_SERVER_ERROR),
+                "error": error
+            }
+
+def batch_datasets() -> list[Dataset]:
+    """
+    Distinct datasets referenced by the tasks of a batch, so that
+    access to each is checked once, before any task is created.
+    Unknown datasets are reported at their task position instead
+    """
+    references = set()
+    tasks_body = (request.json or {}).get("tasks")
+    for task_body in tasks_body if isinstance(tasks_body, list) else []:
+        tags = task_body.get("tags") if isinstance(task_body, dict) else None
+        if not isinstance(tags, dict):
+            continue
+        ds_id = tags.get("dataset_id")
+        ds_name = tags.get("dataset_name") or ""
+        # Malformed references fail the task validation
+        if not isinstance(ds_id, (int, str, type(None))) or not isinstance(ds_name, str):
+            continue
+        if ds_id or ds_name:
+            references.add((ds_id, ds_name))
+
+    datasets = {}
+    for ds_id, ds_name in references:
+        try:
+            ds = Dataset.get_dataset_by_name_or_id(name=ds_name, id=ds_id)
+        except DBRecordNotFoundError:
+            continue
+        datasets[ds.id] = ds
+    return [datasets[ds_id] for ds_id in sorted(datasets)]
+
+def prepare_batch_tasks(tasks_body:list, queue_mode:bool) -> tuple[list, list]:
+    """
+    Validates each task of a batch, adding the valid ones to the
+    session. Returns a result per task, None for the valid ones,
+    and the (position, task, image) of the tasks to start
+    """
+    project_name = request.headers.get("project-name")
+    lookups = {}
+    results: list[dict|None] = []
+    to_start: list[tuple[int, Task, Container]] = []
+    for index, task_body in enumerate(tasks_body):
+        try:
+            if not isinstance(task_body, dict):
+                raise InvalidRequest("Task definitions should be json objects")
+            task_body["project_name"] = project_name
+            body = Task.validate(task_body, lookups)
+        except LogAndException as exc:
+            results.append({"status_code": exc.code, "error": exc.description})
+            continue
+        except (KeyError, IndexError, TypeError):
+            results.append({
+                "status_code": HTTPStatus.BAD_REQUEST,
+                "error": "executors should be a list including an image"
+            })
+            continue
+
+        task = Task(**body)
+        if queue_mode:
+            task_queue.enqueue(task)
+        else:
+            task.add(commit=False)
+        to_start.append((index, task, body["image"]))
+        results.append(None)
+    return results, to_start
+
+@bp.route('/batch', methods=['POST'])
+@audit
+@auth(scope='can_exec_task', check_dataset=batch_datasets)
+def post_tasks_batch():
+    """
+    POST /tasks/batch endpoint. Creates several tasks at once.
+        Datasets and images are resolved once for the whole batch,
+        the valid tasks are stored in a single transaction, then their
+        pods are created concurrently (or queued, in queue mode).
+        Returns a result per task, in the same order
+    """
+    tasks_body = (request.json or {}).get("tasks")
+    if not isinstance(tasks_body, list) or not tasks_body:
+        raise InvalidRequest("tasks should be a non-empty list")
+    if len(tasks_body) > TASK_BATCH_MAX_SIZE:
+        raise InvalidRequest(f"A batch can't have more than {TASK_BATCH_MAX_SIZE} tasks")
+
+    queue_mode = TASK_QUEUE or task_scheduler.enabled
+    try:
+        results, to_start = prepare_batch_tasks(tasks_body, queue_mode)
+        session.commit()
+    except:
+        session.rollback()
+        raise
+
+    if queue_mode:
+        task_queue.notify()
+        for index, task, _ in to_start:
+            results[index] = {"task_id": task.id, "status": task.status}
+    elif to_start:
+        # The workers need the app itself, not the context local proxy
+        app = current_app._get_current_object()  # pylint: disable=protected-access
+        with ThreadPoolExecutor(max_workers=min(TASK_BATCH_WORKERS, len(to_start))) as pool:
+            futures = {
+                index: pool.submit(start_batch_task, app, task.id, image.id, task.get_run_spec())
+                for index, task, image in to_start
+            }
+        for index, future in futures.items():
+            results[index] = future.result()
+        # Statuses were updated by the workers
+        session.expire_all()
+
+    if any("error" in res for res in results):
+        return {"tasks": results}, HTTPStatus.MULTI_STATUS
+    return {"tasks": results}, HTTPStatus.ACCEPTED if queue_mode else HTTPStatus.CREATED
+
 @bp.route('/validate', methods=['POST'])
 @audit
 @auth(scope='can_exec_task', check_dataset=False)
@@ -134,25 +289,55 @@ def get_task_results(task_id):
     """
     GET /tasks/id/results endpoint.
         Allows to get tasks results if approved to be released
-        or, if an admin is trying to view them
+        or, if an admin is trying to view them.
+        Results are streamed as a zip, or as a tar with ?format=tar.
+        Once a task finished, its results archive is cached, and
+        served with its digest as ETag, supporting range requests
     """
+    archive_format = request.args.get("format", "zip")
+    if archive_format not in RESULTS_MIMETYPES:
+        raise InvalidRequest(f"format should be one of {', '.join(RESULTS_MIMETYPES)}")
+
     task: Task = Task.query.filter(Task.id == task_id).one_or_none()
     if task is None:
         raise DBRecordNotFoundError(f"Task with id {task_id} does not exist")
 
     does_user_own_task(task)
 
-    kc_client = Keycloak()
-    token = kc_client.get_token_from_headers()
     # admin should be able to fetch them regardless
-    if TASK_REVIEW and not task.review_status and not kc_client.is_user_admin(token):
+    if TASK_REVIEW and not task.review_status and not current_identity().is_admin:
         return {"status": task.get_review_status()}, 400
 
     if task.created_at.date() + timedelta(days=CLEANUP_AFTER_DAYS) <= datetime.now().date():
         return {"error": "Tasks results are not available anymore. Please, run the task again"}, 500
 
-    results_file = task.get_results()
-    return send_file(results_file, download_name=f"{PUBLIC_URL}-{task_id}-results.zip"), 200
+    download_name = f"{PUBLIC_URL}-{task_id}-results.{archive_format}"
+    cached = results_cache.get(task.id, archive_format)
+    if cached is not None:
+        response = send_file(
+            cached.path,
+            mimetype=RESULTS_MIMETYPES[archive_format],
+            as_attachment=True,
+            download_name=download_name,
+            etag=cached.digest,
+            conditional=True
+        )
+        # conditional requests can be answered with 304 or 206
+        return response, response.status_code
+
+    cacheable = task.has_finished()
+    results = task.get_results()
+    if archive_format == "zip":
+        results = tar_to_zip(results)
+    if cacheable:
+        results = results_cache.store(task.id, task.created_at, archive_format, results)
+    return Response(
+        stream_with_context(results),
+        mimetype=RESULTS_MIMETYPES[archive_format],
+        headers={
+            "Content-Disposition": f"attachment; filename={download_name}"
+        }
+    ), 200
 
 @bp.route('/<task_id>/logs', methods=['GET'])
 @audit
@@ -217,6 +402,7 @@ def block_results(task_id):
         task.update_task_crd(False)
 
     task.review_status = False
+    session.commit()
 
     return {
         "status": task.get_review_status()
@@ -0,0 +1,116 @@
+"""
+Measures the overhead the auth wrapper adds to a request, with
+Keycloak introspection and with local JWT verification.
+
+Keycloak is simulated with `responses`, every call sleeps for
+--latency milliseconds to mimic the in-cluster round-trip.
+
+Usage (from the webserver folder, with the dev dependencies installed):
+    python -m benchmarks.auth_overhead --requests 200 --latency 5
+"""
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("KEYCLOAK_URL", "http://keycloak.local")
+os.environ.setdefault("KEYCLOAK_ADMIN", "admin")
+os.environ.setdefault("KEYCLOAK_ADMIN_PASSWORD", "password1")
+os.environ.setdefault("KEYCLOAK_SECRET", "clientsecret")
+
+# pylint: disable=wrong-import-position
+import jwt
+import responses
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask
+
+from app.helpers import wrappers
+from app.helpers.keycloak import URLS, jwks_cache
+
+USER_ID = "af3301a1-8b02-47b3-8fae-a36b16a6ca32"
+
+
+def keycloak_mock(latency:float, jwk:dict) -> responses.RequestsMock:
+    """
+    Registers the Keycloak endpoints the auth flow touches
+    """
+    def reply(body):
+        def _callback(_request):
+            time.sleep(latency)
+            return 200, {}, json.dumps(body)
+        return _callback
+
+    user = {"id": USER_ID, "username": "user", "email": "user@example.com"}
+    rsps = responses.RequestsMock(assert_all_requests_are_fired=False)
+    rsps.add_callback(responses.POST, URLS["get_token"], callback=reply(
+        {"access_token": "access", "refresh_token": "refresh"}
+    ))
+    rsps.add_callback(responses.POST, URLS["validate"], callback=reply(
+        {"active": True, "username": "user", "email": "user@example.com", "realm_access": {"roles": []}}
+    ))
+    rsps.add_callback(responses.GET, URLS["certs"], callback=reply({"keys": [jwk]}))
+    rsps.add_callback(responses.GET, re.compile(URLS["client_secret"].replace("%s", ".+")), callback=reply(
+        {"value": "clientsecret"}
+    ))
+    rsps.add_callback(responses.GET, re.compile(URLS["resource"].replace("%s", ".+")), callback=reply(
+        [{"_id": "resource_id", "name": "endpoints"}]
+    ))
+    rsps.add_callback(responses.GET, re.compile(URLS["user_role"].replace("%s", ".+")), callback=reply(
+        [{"name": "Users"}]
+    ))
+    rsps.add_callback(responses.GET, URLS["client"], callback=reply([{"id": "client_id"}]))
+    rsps.add_callback(responses.GET, URLS["user"], callback=reply([user]))
+    return rsps
+
+
+def run(mode:str, token:str, n_requests:int, rsps:responses.RequestsMock) -> tuple[float, float]:
+    """
+    Returns the average time in ms and Keycloak calls per request
+    """
+    wrappers.KEYCLOAK_TOKEN_VERIFICATION = mode
+    jwks_cache.clear()
+
+    @wrappers.auth(scope="can_access_dataset", check_dataset=False)
+    def endpoint():
+        return {}, 200
+
+    app = Flask(__name__)
+    rsps.calls.reset()
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        with app.test_request_context("/datasets", headers={"Authorization": f"Bearer {token}"}):
+            endpoint()
+    elapsed = time.perf_counter() - start
+    return elapsed / n_requests * 1000, len(rsps.calls) / n_requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=5, help="Simulated Keycloak latency in ms")
+    args = parser.parse_args()
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+    jwk.update({"kid": "bench", "use": "sig", "alg": "RS256"})
+    now = datetime.now(tz=timezone.utc)
+    token = jwt.encode({
+        "sub": USER_ID,
+        "typ": "Bearer",
+        "preferred_username": "user",
+        "realm_access": {"roles": ["Users"]},
+        "iat": now,
+        "exp": now + timedelta(hours=1)
+    }, key, algorithm="RS256", headers={"kid": "bench"})
+
+    with keycloak_mock(args.latency / 1000, jwk) as rsps:
+        print(f"{'mode':<15}{'ms/request':>12}{'keycloak calls/request':>25}")
+        for mode in ["introspection", "local"]:
+            avg_ms, calls = run(mode, token, args.requests, rsps)
+            print(f"{mode:<15}{avg_ms:>12.2f}{calls:>25.2f}")
+
+
+if __name__ == "__main__":
+    main()
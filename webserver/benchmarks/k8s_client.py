@@ -0,0 +1,112 @@
+"""
+Measures the cost of building the Kubernetes API classes, before
+and after sharing a single ApiClient, and how many connections
+are opened for a burst of API calls.
+
+The API server is simulated with a local HTTP server answering
+an empty pod list, and a fake kubeconfig pointing to it.
+
+Usage (from the webserver folder, with the dev dependencies installed):
+    python -m benchmarks.k8s_client --iterations 200
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.pop("KUBERNETES_SERVICE_HOST", None)
+
+# pylint: disable=wrong-import-position
+from kubernetes import client, config
+
+from app.helpers import kubernetes as k8s_helper
+
+KUBECONFIG = """
+apiVersion: v1
+kind: Config
+clusters:
+- name: bench
+  cluster:
+    server: http://127.0.0.1:{port}
+contexts:
+- name: bench
+  context:
+    cluster: bench
+    user: bench
+current-context: bench
+users:
+- name: bench
+  user:
+    token: bench
+"""
+
+
+class PodListHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        PodListHandler.connections.add(self.client_address)
+        body = b'{"kind": "PodList", "apiVersion": "v1", "metadata": {}, "items": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PerInstanceClient(client.CoreV1Api):
+    """
+    What KubernetesBase used to do: load the config on every instance
+    """
+    def __init__(self):
+        config.load_kube_config()
+        super().__init__()
+
+
+def timed(label:str, iterations:int, build, call:bool):
+    PodListHandler.connections = set()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        api = build()
+        if call:
+            api.list_namespaced_pod("tasks")
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<28} {elapsed / iterations * 1000:8.3f} ms/iteration"
+        + (f"  {len(PodListHandler.connections):5} connections" if call else "")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PodListHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as kubeconfig:
+        kubeconfig.write(KUBECONFIG.format(port=server.server_address[1]))
+    os.environ["KUBECONFIG"] = kubeconfig.name
+    config.kube_config.KUBE_CONFIG_DEFAULT_LOCATION = kubeconfig.name
+
+    try:
+        print(f"{args.iterations} iterations")
+        timed("construct, per instance", args.iterations, PerInstanceClient, call=False)
+        timed("construct, shared client", args.iterations, k8s_helper.KubernetesClient, call=False)
+        timed("construct+list, per instance", args.iterations, PerInstanceClient, call=True)
+        timed("construct+list, shared", args.iterations, k8s_helper.KubernetesClient, call=True)
+    finally:
+        server.shutdown()
+        k8s_helper.reset_api_client()
+        os.unlink(kubeconfig.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,9 @@ import app.models.catalogue
 import app.models.container
 import app.models.dictionary
 import app.models.dataset
+import app.models.queued_task
 import app.models.registry
+import app.models.registry_repository
 import app.models.request
 import app.models.task
 # target_metadata = mymodel.Base.metadata
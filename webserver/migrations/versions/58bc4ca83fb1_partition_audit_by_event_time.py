@@ -0,0 +1,157 @@
+"""Partition audit by event_time
+
+Revision ID: 58bc4ca83fb1
+Revises: 8faa556d4f76
+Create Date: 2026-10-17 10:12:41.518220
+
+The audit table is range partitioned by month on event_time, with
+a default partition catching anything outside the existing ranges.
+Two functions are used by the audit-retention cronjob:
+    - audit_create_partitions(months_ahead) creates the partitions
+        from the current month onwards
+    - audit_drop_partitions(retention_months) drops the partitions
+        older than the retention period
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '58bc4ca83fb1'
+down_revision: Union[str, None] = '8faa556d4f76'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, ip_address, http_method, endpoint, requested_by, status_code, api_function, details, event_time"
+INDEXED_COLUMNS = ["event_time", "requested_by", "endpoint", "status_code"]
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE audit RENAME TO audit_old")
+    op.execute("ALTER TABLE audit_old RENAME CONSTRAINT audit_pkey TO audit_old_pkey")
+    op.execute("ALTER SEQUENCE audit_id_seq OWNED BY NONE")
+
+    # The partition key has to be part of the primary key
+    op.execute("""
+        CREATE TABLE audit (
+            id INTEGER NOT NULL DEFAULT nextval('audit_id_seq'),
+            ip_address VARCHAR(256) NOT NULL,
+            http_method VARCHAR(256) NOT NULL,
+            endpoint VARCHAR(256) NOT NULL,
+            requested_by VARCHAR(256) NOT NULL,
+            status_code INTEGER,
+            api_function VARCHAR(256),
+            details VARCHAR(4096),
+            event_time TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT audit_pkey PRIMARY KEY (id, event_time)
+        ) PARTITION BY RANGE (event_time)
+    """)
+    op.execute("CREATE TABLE audit_default PARTITION OF audit DEFAULT")
+    for column in INDEXED_COLUMNS:
+        op.create_index(f"ix_audit_{column}", "audit", [column])
+
+    # Rows already in the default partition for the new range are
+    # moved over, otherwise attaching the partition would fail
+    op.execute("""
+        CREATE OR REPLACE FUNCTION audit_create_partition(month_start DATE) RETURNS VOID AS $$
+        DECLARE
+            month_end DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::DATE;
+            partition_name TEXT := 'audit_' || to_char(month_start, '"y"YYYY"m"MM');
+        BEGIN
+            month_start := date_trunc('month', month_start)::DATE;
+            IF to_regclass(partition_name) IS NOT NULL THEN
+                RETURN;
+            END IF;
+            EXECUTE format('CREATE TABLE %I (LIKE audit INCLUDING DEFAULTS)', partition_name);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM audit_default WHERE event_time >= %L AND event_time < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                month_start, month_end, partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE audit ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_end
+            );
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION audit_create_partitions(months_ahead INTEGER DEFAULT 2) RETURNS VOID AS $$
+        BEGIN
+            PERFORM audit_create_partition(month::DATE)
+            FROM generate_series(
+                date_trunc('month', now()),
+                date_trunc('month', now()) + make_interval(months => months_ahead),
+                INTERVAL '1 month'
+            ) AS month;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # Whole partitions are dropped, only stray rows in the
+    # default partition are deleted row by row
+    op.execute("""
+        CREATE OR REPLACE FUNCTION audit_drop_partitions(retention_months INTEGER) RETURNS SETOF TEXT AS $$
+        DECLARE
+            cutoff DATE := (date_trunc('month', now()) - make_interval(months => retention_months))::DATE;
+            partition_name TEXT;
+        BEGIN
+            FOR partition_name IN
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = 'audit'::regclass
+                AND child.relname ~ '^audit_y[0-9]{4}m[0-9]{2}$'
+                AND to_date(substring(child.relname FROM 8), 'YYYY"m"MM') < cutoff
+                ORDER BY child.relname
+            LOOP
+                EXECUTE format('DROP TABLE %I', partition_name);
+                RETURN NEXT partition_name;
+            END LOOP;
+            DELETE FROM audit_default WHERE event_time < cutoff;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    # One partition per month already in the table, up to two months ahead
+    op.execute("""
+        SELECT audit_create_partition(month::DATE)
+        FROM generate_series(
+            date_trunc('month', (SELECT coalesce(min(event_time), now()) FROM audit_old)),
+            date_trunc('month', now()) + INTERVAL '2 months',
+            INTERVAL '1 month'
+        ) AS month
+    """)
+    op.execute(f"""
+        INSERT INTO audit ({COLUMNS})
+        SELECT id, ip_address, http_method, endpoint, requested_by, status_code,
+            api_function, details, coalesce(event_time, now())
+        FROM audit_old
+    """)
+    op.execute("DROP TABLE audit_old")
+    op.execute("ALTER SEQUENCE audit_id_seq OWNED BY audit.id")
+
+
+def downgrade() -> None:
+    op.execute("ALTER SEQUENCE audit_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE audit RENAME TO audit_partitioned")
+    op.execute("ALTER TABLE audit_partitioned RENAME CONSTRAINT audit_pkey TO audit_partitioned_pkey")
+    op.execute("""
+        CREATE TABLE audit (
+            id INTEGER NOT NULL DEFAULT nextval('audit_id_seq'),
+            ip_address VARCHAR(256) NOT NULL,
+            http_method VARCHAR(256) NOT NULL,
+            endpoint VARCHAR(256) NOT NULL,
+            requested_by VARCHAR(256) NOT NULL,
+            status_code INTEGER,
+            api_function VARCHAR(256),
+            details VARCHAR(4096),
+            event_time TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            CONSTRAINT audit_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute(f"INSERT INTO audit ({COLUMNS}) SELECT {COLUMNS} FROM audit_partitioned")
+    op.execute("DROP TABLE audit_partitioned")
+    op.execute("DROP FUNCTION audit_drop_partitions(INTEGER)")
+    op.execute("DROP FUNCTION audit_create_partitions(INTEGER)")
+    op.execute("DROP FUNCTION audit_create_partition(DATE)")
+    op.execute("ALTER SEQUENCE audit_id_seq OWNED BY audit.id")
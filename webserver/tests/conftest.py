@@ -1,5 +1,7 @@
 import base64
+import tarfile
 from copy import deepcopy
+from io import BytesIO
 from typing import List
 from pytest import fixture
 from datetime import datetime as dt, timedelta
@@ -16,6 +18,12 @@ from app.models.request import Request
 from app.models.task import Task
 from app.helpers.exceptions import KeycloakError
 from app.helpers.const import CRD_DOMAIN
+from app.helpers.keycloak import jwks_cache, metadata_cache, token_manager
+from app.helpers.kubernetes import reset_api_client
+from app.helpers.container_registries import credentials_cache, image_cache, token_cache
+from app.helpers.dataset_engines import dataset_engines
+from app.helpers.query_validator import count_cache
+from app.helpers.results_cache import results_cache
 
 
 sample_ds_body = {
@@ -166,6 +174,10 @@ def v1_mock(mocker):
         "cp_from_pod_mock": mocker.patch(
             'app.helpers.kubernetes.KubernetesClient.cp_from_pod',
             return_value="../tests/files/results.zip"
+        ),
+        "stream_from_pod_mock": mocker.patch(
+            'app.helpers.kubernetes.KubernetesClient.stream_from_pod',
+            side_effect=lambda *args, **kwargs: iter([results_tar()])
         )
     }
 
@@ -322,6 +334,21 @@ def access_request(dataset, user_uuid, k8s_client):
     return request
 
 # Conditional url side_effects
+def results_tar(files:dict[str, bytes]=None) -> bytes:
+    """
+    Tar archive as the results job would stream it,
+    with binary content by default
+    """
+    if files is None:
+        files = {"results.csv": b"a,b\n1,2\n", "plots/plot.png": bytes(range(256)) * 4}
+    buffer = BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(f"./{name}")
+            info.size = len(content)
+            tar.addfile(info, BytesIO(content))
+    return buffer.getvalue()
+
 def side_effect(dict_mock:dict):
     """
     This tries to mock dynamically according to what urllib3.requests
@@ -413,6 +440,7 @@ def mock_keycloak_class(mocker):
             get_token=Mock(return_value="token"),
             get_policy=Mock(return_value={"id": "policy"}),
             get_scope=Mock(return_value={"id": "scope"}),
+            get_scopes=Mock(return_value=[{"id": "scope"}] * 6),
             create_policy=Mock(return_value={"id": "policy"}),
             create_resource=Mock(return_value={"_id": "resource"}),
             create_permission=Mock(return_value={"id": "permission"}),
@@ -421,6 +449,30 @@ def mock_keycloak_class(mocker):
     )
 
 
+@fixture(autouse=True)
+def reset_caches():
+    """
+    Process-wide caches would otherwise leak state across tests
+    """
+    yield
+    jwks_cache.clear()
+    token_manager.invalidate()
+    metadata_cache.clear()
+    image_cache.clear()
+    token_cache.clear()
+    credentials_cache.clear()
+    dataset_engines.dispose_all()
+    count_cache.clear()
+    reset_api_client()
+
+@fixture(autouse=True)
+def results_cache_root(mocker, tmp_path):
+    """
+    Task ids are reused across tests, so each one gets an empty results cache
+    """
+    mocker.patch.object(results_cache, "root", tmp_path)
+    return tmp_path
+
 @fixture(autouse=True)
 def mock_kc_client(mocker, basic_user, user_uuid, mock_keycloak_class):
     decode_token_return = deepcopy(basic_user)
@@ -464,16 +516,6 @@ def mock_kc_client(mocker, basic_user, user_uuid, mock_keycloak_class):
             list_users=Mock(return_value=[basic_user]),
             create_user=Mock(return_value=create_user_return),
             get_user_role=Mock(return_value="Users"),
-        )),
-        "tasks_api_kc": mocker.patch('app.tasks_api.Keycloak', return_value=Mock(
-            get_token=Mock(return_value={"access_token": "token"}),
-            get_admin_token=Mock(return_value={"access_token": "admin_token"}),
-            decode_token=Mock(return_value=decode_token_return),
-            get_user_by_email=Mock(return_value=basic_user),
-            get_user_by_id=Mock(return_value=basic_user),
-            list_users=Mock(return_value=[basic_user]),
-            create_user=Mock(return_value=create_user_return),
-            get_user_role=Mock(return_value="Users"),
         ))
     }
     return kc_mock
@@ -100,7 +100,8 @@ def cr_client_404(mocker):
 
 @pytest.fixture
 def cr_class(mocker, cr_name):
-    with responses.RequestsMock() as rsps:
+    # The catalog token might be cached already
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
         rsps.add(
             responses.GET,
             f"https://{cr_name}/oauth2/token?service={cr_name}&scope=registry:catalog:*",
@@ -3,7 +3,7 @@ from pytest import fixture
 import responses
 from responses import matchers
 from app.helpers.exceptions import KeycloakError
-from app.helpers.keycloak import URLS, Keycloak
+from app.helpers.keycloak import URLS, Keycloak, metadata_cache
 
 
 class TestKeycloakMixin:
@@ -244,6 +244,8 @@ class TestKeycloakResponseFailures(TestKeycloakMixin):
         keycloak API returns != 200 on fetching the client secret
         """
         kc_client = Keycloak()
+        # The secret fetched on init is cached
+        metadata_cache.clear()
         # Mocking self.get_admin_token_global() request to be successful
         keycloak_login_request_mock.add(
             responses.GET,
@@ -0,0 +1,197 @@
+import json
+from datetime import datetime, timedelta, timezone
+import jwt
+import pytest
+import responses
+from cryptography.hazmat.primitives.asymmetric import rsa
+from pytest import fixture
+
+from app.helpers.exceptions import AuthenticationError
+from app.helpers.keycloak import URLS, jwks_cache, verify_access_token
+
+
+def make_jwk(private_key, kid:str) -> dict:
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": kid, "use": "sig", "alg": "RS256"})
+    return jwk
+
+
+@fixture
+def signing_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+@fixture
+def jwks_mock(signing_key):
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            URLS["certs"],
+            json={"keys": [make_jwk(signing_key, "key1")]},
+            status=200
+        )
+        yield rsps
+
+@fixture
+def sign_token(signing_key, user_uuid):
+    def _sign(kid="key1", key=None, expires_in=300, **claims):
+        now = datetime.now(tz=timezone.utc)
+        payload = {
+            "sub": user_uuid,
+            "typ": "Bearer",
+            "preferred_username": "test@basicuser.com",
+            "email": "test@basicuser.com",
+            "realm_access": {"roles": ["Users"]},
+            "iat": now,
+            "exp": now + timedelta(seconds=expires_in)
+        }
+        payload.update(claims)
+        return jwt.encode(payload, key or signing_key, algorithm="RS256", headers={"kid": kid})
+    return _sign
+
+
+class TestLocalVerification:
+    def test_valid_token_is_decoded(self, jwks_mock, sign_token, user_uuid):
+        """
+        A correctly signed access token returns its claims
+        """
+        claims = verify_access_token(sign_token())
+        assert claims["sub"] == user_uuid
+        assert claims["preferred_username"] == "test@basicuser.com"
+
+    def test_keys_are_fetched_once(self, jwks_mock, sign_token):
+        """
+        Subsequent verifications reuse the cached JWKS
+        """
+        for _ in range(5):
+            verify_access_token(sign_token())
+        assert len(jwks_mock.calls) == 1
+
+    def test_expired_token_raises(self, jwks_mock, sign_token):
+        """
+        Expired tokens are rejected without contacting Keycloak
+        """
+        with pytest.raises(AuthenticationError):
+            verify_access_token(sign_token(expires_in=-60))
+
+    def test_wrong_signature_raises(self, jwks_mock, sign_token):
+        """
+        A token signed with a different key, but advertising a known kid
+        is rejected
+        """
+        other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with pytest.raises(AuthenticationError):
+            verify_access_token(sign_token(key=other_key))
+
+    def test_key_rotation_refetches_keys(self, jwks_mock, sign_token, mocker):
+        """
+        A new kid causes the keys to be refetched, once the minimum
+        refresh interval has passed
+        """
+        verify_access_token(sign_token())
+        new_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwks_mock.replace(
+            responses.GET,
+            URLS["certs"],
+            json={"keys": [make_jwk(new_key, "key2")]},
+            status=200
+        )
+        mocker.patch('app.helpers.keycloak.JWKS_MIN_REFRESH_INTERVAL', -1)
+
+        claims = verify_access_token(sign_token(kid="key2", key=new_key))
+        assert claims["typ"] == "Bearer"
+        assert len(jwks_mock.calls) == 2
+
+    def test_unknown_kid_is_rate_limited(self, jwks_mock, sign_token):
+        """
+        Tokens with unknown kids right after a refresh don't trigger
+        another JWKS request
+        """
+        verify_access_token(sign_token())
+        for _ in range(3):
+            with pytest.raises(AuthenticationError):
+                verify_access_token(sign_token(kid="forged"))
+        assert len(jwks_mock.calls) == 1
+
+    def test_refresh_tokens_fall_back(self):
+        """
+        HS-signed tokens (i.e. refresh tokens) can't be verified locally
+        and the caller is expected to introspect them
+        """
+        token = jwt.encode({"typ": "Refresh", "sub": "someone"}, "secret" * 6, algorithm="HS256")
+        assert verify_access_token(token) is None
+        assert jwks_cache._keys == {}
+
+    def test_non_bearer_tokens_fall_back(self, jwks_mock, sign_token):
+        """
+        ID tokens are signed with the same keys but are not valid credentials
+        """
+        assert verify_access_token(sign_token(typ="ID")) is None
+
+    def test_malformed_token_raises(self):
+        """
+        Random strings are rejected straight away
+        """
+        with pytest.raises(AuthenticationError):
+            verify_access_token("not-a-jwt")
+
+
+class TestLocalVerificationAuth:
+    @fixture
+    def local_mode(self, mocker):
+        mocker.patch('app.helpers.wrappers.KEYCLOAK_TOKEN_VERIFICATION', 'local')
+
+    def test_auth_skips_introspection(
+            self,
+            local_mode,
+            jwks_mock,
+            sign_token,
+            client,
+            mock_kc_client,
+            user_uuid
+        ):
+        """
+        With local verification enabled, the user info comes from
+        the token claims and only the permission check hits Keycloak
+        """
+        wrappers_kc = mock_kc_client["wrappers_kc"].return_value
+        token = sign_token()
+        response = client.get("/datasets/", headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 200, response.json
+        wrappers_kc.decode_token.assert_not_called()
+        wrappers_kc.get_user_by_username.assert_not_called()
+        wrappers_kc.is_token_valid.assert_not_called()
+        wrappers_kc.check_permissions.assert_called_with(token, "can_access_dataset", "endpoints", is_access_token=True)
+
+    def test_auth_expired_token(
+            self,
+            local_mode,
+            jwks_mock,
+            sign_token,
+            client
+        ):
+        """
+        Expired tokens get a 401
+        """
+        response = client.get(
+            "/datasets/",
+            headers={"Authorization": f"Bearer {sign_token(expires_in=-60)}"}
+        )
+        assert response.status_code == 401
+
+    def test_auth_refresh_token_uses_introspection(
+            self,
+            local_mode,
+            client,
+            mock_kc_client
+        ):
+        """
+        Non-JWT or HS-signed tokens keep going through Keycloak
+        """
+        wrappers_kc = mock_kc_client["wrappers_kc"].return_value
+        token = jwt.encode({"typ": "Refresh", "sub": "someone"}, "secret" * 6, algorithm="HS256")
+        response = client.get("/datasets/", headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 200
+        wrappers_kc.decode_token.assert_called()
+        wrappers_kc.is_token_valid.assert_called()
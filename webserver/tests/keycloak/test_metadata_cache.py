@@ -0,0 +1,128 @@
+import pytest
+import responses
+from responses import matchers
+
+from app.helpers.exceptions import KeycloakError
+from app.helpers.keycloak import REALM, URLS, Keycloak, metadata_cache
+from tests.keycloak.test_keycloak_helper import TestKeycloakMixin
+
+
+class TestKeycloakMetadataCache(TestKeycloakMixin):
+    """
+    Lookups for rarely changing Keycloak entities are cached
+    """
+    def test_resource_is_cached(self, keycloak_login_request_mock):
+        """
+        Two get_resource calls only cause one request
+        """
+        kc_client = Keycloak()
+        resource_mock = keycloak_login_request_mock.add(
+            responses.GET,
+            URLS["resource"] % "clientid",
+            json=[{"_id": "resource_id", "name": "cached"}],
+            match=[matchers.query_string_matcher("name=cached")]
+        )
+        assert kc_client.get_resource("cached")["_id"] == "resource_id"
+        assert Keycloak().get_resource("cached")["_id"] == "resource_id"
+        assert resource_mock.call_count == 1
+        assert metadata_cache.stats()["hits"] >= 1
+
+    def test_cached_values_are_copies(self, keycloak_login_request_mock):
+        """
+        Modifying a returned value doesn't change the cached one
+        """
+        kc_client = Keycloak()
+        keycloak_login_request_mock.add(
+            responses.GET,
+            URLS["resource"] % "clientid",
+            json=[{"_id": "resource_id", "name": "cached"}],
+            match=[matchers.query_string_matcher("name=cached")]
+        )
+        kc_client.get_resource("cached")["name"] = "changed"
+        assert kc_client.get_resource("cached")["name"] == "cached"
+
+    def test_errors_are_not_cached(self, keycloak_login_request_mock):
+        """
+        A failed lookup is retried on the next call
+        """
+        kc_client = Keycloak()
+        resource_mock = keycloak_login_request_mock.add(
+            responses.GET,
+            URLS["resource"] % "clientid",
+            json=[],
+            match=[matchers.query_string_matcher("name=missing")]
+        )
+        for _ in range(2):
+            with pytest.raises(KeycloakError):
+                kc_client.get_resource("missing")
+        assert resource_mock.call_count == 2
+
+    def test_patch_resource_invalidates(self, keycloak_login_request_mock):
+        """
+        Renaming a resource drops both old and new names from the cache
+        """
+        kc_client = Keycloak()
+        resource_mock = keycloak_login_request_mock.add(
+            responses.GET,
+            URLS["resource"] % "clientid",
+            json=[{"_id": "resource_id", "name": "1-old"}],
+            match=[matchers.query_string_matcher("name=1-old")]
+        )
+        keycloak_login_request_mock.add(
+            responses.PUT,
+            (URLS["resource"] % "clientid") + "/resource_id"
+        )
+        kc_client.get_resource("1-old")
+        # Served from the cache
+        kc_client.patch_resource("1-old", name="1-new")
+        kc_client.get_resource("1-old")
+        assert resource_mock.call_count == 2
+
+    def test_create_resource_invalidates(self, keycloak_login_request_mock):
+        """
+        Creating a resource drops its cached value
+        """
+        kc_client = Keycloak()
+        metadata_cache.set((REALM, "clientid", "resource", "new"), {"_id": "stale"})
+        keycloak_login_request_mock.add(
+            responses.POST,
+            URLS["resource"] % "clientid",
+            json={"_id": "fresh", "name": "new"},
+            status=201
+        )
+        kc_client.create_resource({"name": "new"})
+        assert metadata_cache.get((REALM, "clientid", "resource", "new")) is None
+
+    def test_get_scopes(self, keycloak_login_request_mock):
+        """
+        get_scopes fetches all missing scopes with one request
+        and keeps the requested order
+        """
+        kc_client = Keycloak()
+        scopes_mock = keycloak_login_request_mock.add(
+            responses.GET,
+            URLS["scopes"] % "clientid",
+            json=[
+                {"id": "1", "name": "can_access_dataset"},
+                {"id": "2", "name": "can_admin_dataset"},
+                {"id": "3", "name": "can_exec_task"}
+            ]
+        )
+        scopes = kc_client.get_scopes(["can_exec_task", "can_admin_dataset"])
+        assert [sc["id"] for sc in scopes] == ["3", "2"]
+        assert kc_client.get_scope("can_access_dataset")["id"] == "1"
+        assert scopes_mock.call_count == 1
+
+    def test_get_scopes_missing(self, keycloak_login_request_mock):
+        """
+        Requesting a scope that doesn't exist raises an exception
+        """
+        kc_client = Keycloak()
+        keycloak_login_request_mock.add(
+            responses.GET,
+            URLS["scopes"] % "clientid",
+            json=[{"id": "1", "name": "can_access_dataset"}]
+        )
+        with pytest.raises(KeycloakError) as exc:
+            kc_client.get_scopes(["can_access_dataset", "can_do_magic"])
+        assert exc.value.description == "Scopes can_do_magic not found"
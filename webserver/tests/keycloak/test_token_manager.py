@@ -0,0 +1,169 @@
+import pytest
+import responses
+from responses import matchers
+
+from app.helpers.exceptions import AuthenticationError
+from app.helpers.keycloak import URLS, Keycloak, session, token_manager
+
+
+class TestTokenManager:
+    """
+    The admin token and the global client credentials are
+    shared by all Keycloak instances
+    """
+    def mock_login(self, rsps:responses.RequestsMock, expires_in:int=300):
+        admin_login = rsps.add(
+            responses.POST,
+            URLS["get_token"],
+            json={"access_token": "admin_token", "expires_in": expires_in},
+            match=[matchers.urlencoded_params_matcher({
+                'client_id': 'admin-cli',
+                'grant_type': 'password',
+                'username': 'admin',
+                'password': 'password1'
+            })]
+        )
+        client_id = rsps.add(
+            responses.GET,
+            URLS["client"],
+            match=[matchers.query_string_matcher("clientId=global")],
+            json=[{"id": "12"}]
+        )
+        client_secret = rsps.add(
+            responses.GET,
+            URLS["client_secret"] % "12",
+            json={"value": "clientsecret"}
+        )
+        return admin_login, client_id, client_secret
+
+    def test_instances_reuse_credentials(self):
+        """
+        Only the first instance hits keycloak
+        """
+        with responses.RequestsMock() as rsps:
+            admin_login, client_id, client_secret = self.mock_login(rsps)
+            for _ in range(5):
+                kc_client = Keycloak()
+                assert kc_client.admin_token == "admin_token"
+                assert kc_client.client_id == "12"
+                assert kc_client.client_secret == "clientsecret"
+
+            assert admin_login.call_count == 1
+            assert client_id.call_count == 1
+            assert client_secret.call_count == 1
+
+    def test_token_refreshed_before_expiry(self):
+        """
+        A token expiring within the refresh margin is requested again
+        """
+        with responses.RequestsMock() as rsps:
+            admin_login, client_id, _ = self.mock_login(rsps, expires_in=10)
+            Keycloak()
+            Keycloak()
+
+            assert admin_login.call_count == 2
+            assert client_id.call_count == 1
+
+    def test_other_clients_are_not_shared(self):
+        """
+        Project clients fetch their own id and secret, not
+        the global ones, reuse the admin token, and the
+        cached client id on later instances
+        """
+        with responses.RequestsMock() as rsps:
+            admin_login, _, _ = self.mock_login(rsps)
+            project_client = rsps.add(
+                responses.GET,
+                URLS["client"],
+                match=[matchers.query_string_matcher("clientId=project")],
+                json=[{"id": "34"}]
+            )
+            rsps.add(
+                responses.GET,
+                URLS["client_secret"] % "34",
+                json={"value": "projectsecret"}
+            )
+            Keycloak()
+            kc_client = Keycloak("project")
+            Keycloak("project")
+
+            assert kc_client.client_secret == "projectsecret"
+            assert admin_login.call_count == 1
+            assert project_client.call_count == 1
+
+    def test_invalidate(self):
+        """
+        After invalidating, the next instance logs in again
+        """
+        with responses.RequestsMock() as rsps:
+            admin_login, _, _ = self.mock_login(rsps)
+            Keycloak()
+            token_manager.invalidate()
+            Keycloak()
+
+            assert admin_login.call_count == 2
+
+    def test_rejected_admin_token_is_renewed(self):
+        """
+        An admin call answered with 401 logs in again and is
+        retried once, later calls with the old token are
+        retried with the new one, without logging in again
+        """
+        with responses.RequestsMock() as rsps:
+            self.mock_login(rsps)
+            kc_client = Keycloak()
+
+            new_login = rsps.replace(
+                responses.POST,
+                URLS["get_token"],
+                json={"access_token": "new_admin_token", "expires_in": 300}
+            )
+            rejected = rsps.add(
+                responses.GET,
+                URLS["user"],
+                status=401,
+                match=[matchers.header_matcher({"Authorization": "Bearer admin_token"})]
+            )
+            accepted = rsps.add(
+                responses.GET,
+                URLS["user"],
+                json=[{"id": "1"}],
+                match=[matchers.header_matcher({"Authorization": "Bearer new_admin_token"})]
+            )
+
+            assert kc_client.list_users() == [{"id": "1"}]
+            assert kc_client.list_users() == [{"id": "1"}]
+            assert new_login.call_count == 1
+            assert rejected.call_count == 2
+            assert accepted.call_count == 2
+
+    def test_other_tokens_are_not_retried(self):
+        """
+        A 401 with a user token is returned as is
+        """
+        with responses.RequestsMock() as rsps:
+            admin_login, _, _ = self.mock_login(rsps)
+            Keycloak()
+            introspect = rsps.add(responses.POST, URLS["validate"], status=401)
+
+            response = session.post(URLS["validate"], headers={"Authorization": "Bearer user_token"})
+            assert response.status_code == 401
+            assert introspect.call_count == 1
+            assert admin_login.call_count == 1
+
+    def test_failed_login_is_not_cached(self):
+        """
+        A failed admin login raises, and is retried by the next instance
+        """
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.POST,
+                URLS["get_token"],
+                json={"error": "invalid_grant"},
+                status=401
+            )
+            with pytest.raises(AuthenticationError):
+                Keycloak()
+            with pytest.raises(AuthenticationError):
+                Keycloak()
+            assert len(rsps.calls) == 2
@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+from unittest.mock import Mock
+from kubernetes.client import (
+    V1ContainerState, V1ContainerStateRunning, V1ContainerStateTerminated,
+    V1ContainerStatus, V1ObjectMeta, V1Pod, V1PodStatus
+)
+
+from app.helpers.base_model import db
+from app.models.task import Task
+from app.reconciler import StatusReconciler, pod_status_columns
+from tests.fixtures.azure_cr_fixtures import *
+from tests.fixtures.tasks_fixtures import *
+
+
+STARTED = datetime(2026, 1, 1, 10, 0, tzinfo=timezone.utc)
+FINISHED = datetime(2026, 1, 1, 10, 5, tzinfo=timezone.utc)
+
+
+def task_pod(task_id:int, state:V1ContainerState) -> V1Pod:
+    return V1Pod(
+        metadata=V1ObjectMeta(name=f"task-{task_id}", labels={"task_id": str(task_id)}),
+        status=V1PodStatus(container_statuses=[
+            V1ContainerStatus(name="task", image="image", image_id="", ready=True, restart_count=0, state=state)
+        ])
+    )
+
+def running_state() -> V1ContainerState:
+    return V1ContainerState(running=V1ContainerStateRunning(started_at=STARTED))
+
+def terminated_state() -> V1ContainerState:
+    return V1ContainerState(terminated=V1ContainerStateTerminated(
+        started_at=STARTED, finished_at=FINISHED, exit_code=1, reason="Error"
+    ))
+
+def refreshed(task:Task) -> Task:
+    db.session.expire_all()
+    return Task.query.filter(Task.id == task.id).one()
+
+
+class TestStatusReconciler:
+    def test_pod_status_columns(self):
+        """
+        The first container state is mapped to the tasks columns
+        """
+        columns = pod_status_columns(task_pod(1, terminated_state()))
+
+        assert columns["status"] == "terminated"
+        assert columns["exit_code"] == 1
+        assert columns["status_reason"] == "Error"
+        assert columns["finished_at"].tzinfo is None
+        assert pod_status_columns(V1Pod(metadata=V1ObjectMeta(name="p"), status=V1PodStatus())) is None
+
+    def test_events_are_persisted(self, task_mock):
+        """
+        Pod events for the same task are collapsed and
+        written on flush
+        """
+        reconciler = StatusReconciler(Mock())
+        reconciler.handle("ADDED", task_pod(task_mock.id, running_state()))
+        reconciler.handle("MODIFIED", task_pod(task_mock.id, terminated_state()))
+        reconciler.flush()
+
+        task = refreshed(task_mock)
+        assert task.status == "terminated"
+        assert task.exit_code == 1
+        assert task.status_reason == "Error"
+        assert task.started_at is not None
+        assert reconciler.updates == 1
+
+    def test_unchanged_status_is_not_written_again(self, task_mock):
+        """
+        Repeated events with the same status don't cause
+        another update
+        """
+        reconciler = StatusReconciler(Mock())
+        reconciler.handle("ADDED", task_pod(task_mock.id, running_state()))
+        reconciler.flush()
+        reconciler.handle("MODIFIED", task_pod(task_mock.id, running_state()))
+        reconciler.flush()
+
+        assert reconciler.updates == 1
+
+    def test_cancelled_is_not_overwritten(self, task_mock):
+        """
+        A task cancelled through the API keeps its status
+        """
+        task_mock.status = "cancelled"
+        db.session.commit()
+
+        reconciler = StatusReconciler(Mock())
+        reconciler.handle("MODIFIED", task_pod(task_mock.id, terminated_state()))
+        reconciler.flush()
+
+        assert refreshed(task_mock).status == "cancelled"
+
+    def test_deleted_running_pod(self, task_mock):
+        """
+        A running task whose pod is deleted is marked as such
+        """
+        reconciler = StatusReconciler(Mock())
+        reconciler.handle("ADDED", task_pod(task_mock.id, running_state()))
+        reconciler.flush()
+        reconciler.handle("DELETED", task_pod(task_mock.id, running_state()))
+        reconciler.flush()
+
+        assert refreshed(task_mock).status == "deleted"
+
+    def test_status_read_from_db(
+            self,
+            mocker,
+            client,
+            task_mock,
+            k8s_client,
+            simple_admin_header
+        ):
+        """
+        With the reconciler enabled, the task status comes
+        from the db without listing pods
+        """
+        mocker.patch('app.models.task.TASK_RECONCILER', "enabled")
+        task_mock.status = "terminated"
+        task_mock.exit_code = 0
+        task_mock.status_reason = "Completed"
+        db.session.commit()
+        k8s_client["list_namespaced_pod_mock"].reset_mock()
+
+        response = client.get(f'/tasks/{task_mock.id}', headers=simple_admin_header)
+
+        assert response.status_code == 200
+        assert response.json["status"]["terminated"]["reason"] == "Completed"
+        k8s_client["list_namespaced_pod_mock"].assert_not_called()
@@ -1,4 +1,7 @@
+import tarfile
+import zipfile
 from datetime import timedelta
+from io import BytesIO
 from kubernetes.client.exceptions import ApiException
 from tests.fixtures.azure_cr_fixtures import *
 from tests.fixtures.tasks_fixtures import *
@@ -26,6 +29,159 @@ class TestTaskResults:
         )
         assert response.status_code == 200
         assert response.content_type == "application/zip"
+        with zipfile.ZipFile(BytesIO(response.data)) as results:
+            assert sorted(results.namelist()) == ["plots/plot.png", "results.csv"]
+            assert results.read("plots/plot.png") == bytes(range(256)) * 4
+
+    def test_get_results_as_tar(
+        self,
+        cr_client,
+        registry_client,
+        simple_admin_header,
+        client,
+        reg_k8s_client,
+        results_job_mock,
+        task_mock
+    ):
+        """
+        With format=tar the stream from the job's pod is sent as it is,
+        and the job is removed once it's been consumed
+        """
+        response = client.get(
+            f'/tasks/{task_mock.id}/results?format=tar',
+            headers=simple_admin_header
+        )
+        assert response.status_code == 200
+        assert response.content_type == "application/x-tar"
+        assert response.headers["Content-Disposition"].endswith(f"-{task_mock.id}-results.tar")
+        with tarfile.open(fileobj=BytesIO(response.data)) as results:
+            assert results.extractfile("./results.csv").read() == b"a,b\n1,2\n"
+        reg_k8s_client["delete_namespaced_pod_mock"].assert_called_once()
+        reg_k8s_client["delete_job_mock"].assert_called_once()
+
+    def test_get_results_cached_once_finished(
+        self,
+        mocker,
+        cr_client,
+        registry_client,
+        simple_admin_header,
+        client,
+        reg_k8s_client,
+        results_job_mock,
+        task_mock
+    ):
+        """
+        Results of a finished task are cached on the first download,
+        following ones don't create a results job and support
+        conditional and range requests
+        """
+        mocker.patch('app.models.task.Task.has_finished', return_value=True)
+        first = client.get(f'/tasks/{task_mock.id}/results', headers=simple_admin_header)
+        assert first.status_code == 200
+
+        response = client.get(f'/tasks/{task_mock.id}/results', headers=simple_admin_header)
+        assert response.status_code == 200
+        assert response.data == first.data
+        assert response.headers["Accept-Ranges"] == "bytes"
+        etag = response.headers["ETag"]
+        reg_k8s_client["create_namespaced_job_mock"].assert_called_once()
+
+        not_modified = client.get(
+            f'/tasks/{task_mock.id}/results',
+            headers=simple_admin_header | {"If-None-Match": etag}
+        )
+        assert not_modified.status_code == 304
+
+        partial = client.get(
+            f'/tasks/{task_mock.id}/results',
+            headers=simple_admin_header | {"Range": "bytes=0-9"}
+        )
+        assert partial.status_code == 206
+        assert partial.data == first.data[:10]
+
+    def test_get_results_running_not_cached(
+        self,
+        cr_client,
+        registry_client,
+        simple_admin_header,
+        client,
+        reg_k8s_client,
+        results_job_mock,
+        task_mock
+    ):
+        """
+        Results of a task still running can change, and are always fetched
+        """
+        for _ in range(2):
+            response = client.get(f'/tasks/{task_mock.id}/results', headers=simple_admin_header)
+            assert response.status_code == 200
+            assert "ETag" not in response.headers
+        assert reg_k8s_client["create_namespaced_job_mock"].call_count == 2
+
+    def test_get_results_from_shared_volume(
+        self,
+        mocker,
+        tmp_path,
+        simple_admin_header,
+        client,
+        reg_k8s_client,
+        task_mock
+    ):
+        """
+        When the backend shares the tasks storage, results
+        are read from the mount without a results job
+        """
+        mocker.patch('app.models.task.SHARED_RESULTS_PATH', str(tmp_path / "shared"))
+        results_folder = tmp_path / "shared" / str(task_mock.id) / "results"
+        results_folder.mkdir(parents=True)
+        (results_folder / "results.csv").write_bytes(b"a,b\n1,2\n")
+
+        response = client.get(f'/tasks/{task_mock.id}/results', headers=simple_admin_header)
+
+        assert response.status_code == 200
+        with zipfile.ZipFile(BytesIO(response.data)) as results:
+            assert results.namelist() == ["results.csv"]
+        reg_k8s_client["create_namespaced_job_mock"].assert_not_called()
+        reg_k8s_client["stream_from_pod_mock"].assert_not_called()
+
+    def test_get_results_shared_volume_fallback(
+        self,
+        mocker,
+        tmp_path,
+        cr_client,
+        registry_client,
+        simple_admin_header,
+        client,
+        reg_k8s_client,
+        results_job_mock,
+        task_mock
+    ):
+        """
+        Tasks whose results are not on the mount are
+        fetched with a results job
+        """
+        mocker.patch('app.models.task.SHARED_RESULTS_PATH', str(tmp_path / "shared"))
+
+        response = client.get(f'/tasks/{task_mock.id}/results', headers=simple_admin_header)
+
+        assert response.status_code == 200
+        reg_k8s_client["create_namespaced_job_mock"].assert_called_once()
+
+    def test_get_results_invalid_format(
+        self,
+        simple_admin_header,
+        client,
+        task_mock
+    ):
+        """
+        Only zip and tar archives are supported
+        """
+        response = client.get(
+            f'/tasks/{task_mock.id}/results?format=rar',
+            headers=simple_admin_header
+        )
+        assert response.status_code == 400
+        assert response.json["error"] == "format should be one of zip, tar"
 
     def test_get_results_job_creation_failure(
         self,
@@ -179,7 +335,7 @@ class TestResultsReview:
         Test to make sure the user can't fetch their results
         before the review took place
         """
-        mock_kc_client["tasks_api_kc"].return_value.is_user_admin.return_value = False
+        mock_kc_client["wrappers_kc"].return_value.is_user_admin.return_value = False
         k8s_client["list_namespaced_pod_mock"].return_value.items[0].metadata.name = task_mock.name
         response = client.get(
             f'/tasks/{task_mock.id}/results',
@@ -223,7 +379,7 @@ class TestResultsReview:
         )
         assert response.status_code == 201
 
-        mock_kc_client["tasks_api_kc"].return_value.is_user_admin.return_value = False
+        mock_kc_client["wrappers_kc"].return_value.is_user_admin.return_value = False
 
         response = client.get(
             f'/tasks/{task_mock.id}/results',
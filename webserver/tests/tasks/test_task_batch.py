@@ -0,0 +1,169 @@
+import json
+from copy import deepcopy
+from kubernetes.client.exceptions import ApiException
+from pytest import fixture
+from unittest.mock import Mock
+
+from app.helpers.base_model import db
+from app.models.queued_task import QueuedTask
+from app.models.task import Task
+from tests.fixtures.azure_cr_fixtures import *
+from tests.fixtures.tasks_fixtures import *
+
+
+@fixture
+def registry_mock(mocker):
+    return mocker.patch(
+        'app.models.registry.AzureRegistry',
+        return_value=Mock()
+    )
+
+@fixture
+def batch_body(task_body) -> dict:
+    return {"tasks": [deepcopy(task_body) for _ in range(3)]}
+
+
+class TestTasksBatch:
+    def test_create_batch(
+            self,
+            cr_client,
+            post_json_admin_header,
+            client,
+            reg_k8s_client,
+            registry_mock,
+            batch_body
+        ):
+        """
+        All tasks are stored and started, the image is
+        checked against its registry only once
+        """
+        response = client.post('/tasks/batch', json=batch_body, headers=post_json_admin_header)
+
+        assert response.status_code == 201
+        results = response.json["tasks"]
+        assert len(results) == 3
+        assert all(res["status"] == "scheduled" for res in results)
+        assert Task.query.filter(Task.id.in_([res["task_id"] for res in results])).count() == 3
+        assert reg_k8s_client["create_namespaced_pod_mock"].call_count == 3
+        registry_mock.return_value.has_image_tag_or_sha.assert_called_once()
+
+    def test_invalid_tasks_are_reported(
+            self,
+            cr_client,
+            post_json_admin_header,
+            client,
+            reg_k8s_client,
+            registry_mock,
+            batch_body
+        ):
+        """
+        Invalid definitions get an error at their position,
+        the valid ones are created anyway
+        """
+        batch_body["tasks"][1]["name"] = ""
+
+        response = client.post('/tasks/batch', json=batch_body, headers=post_json_admin_header)
+
+        assert response.status_code == 207
+        results = response.json["tasks"]
+        assert results[1] == {"status_code": 400, "error": "name is a mandatory field"}
+        assert results[0]["status"] == results[2]["status"] == "scheduled"
+        assert reg_k8s_client["create_namespaced_pod_mock"].call_count == 2
+
+    def test_failed_pod_creation(
+            self,
+            cr_client,
+            post_json_admin_header,
+            client,
+            reg_k8s_client,
+            registry_mock,
+            batch_body
+        ):
+        """
+        A task whose pod can't be created is marked as failed,
+        without affecting the others
+        """
+        reg_k8s_client["create_namespaced_pod_mock"].side_effect = [
+            None,
+            ApiException(http_resp=Mock(status=500, reason="Unavailable", data=json.dumps({"message": "Unavailable"}))),
+            None
+        ]
+
+        response = client.post('/tasks/batch', json=batch_body, headers=post_json_admin_header)
+
+        assert response.status_code == 207
+        results = response.json["tasks"]
+        failed = [res for res in results if res["status"] == "failed"]
+        assert len(failed) == 1
+        assert failed[0]["error"] == "Failed to run pod: Unavailable"
+        assert db.session.get(Task, failed[0]["task_id"]).status_reason == "Failed to run pod: Unavailable"
+
+    def test_queue_mode(
+            self,
+            mocker,
+            cr_client,
+            post_json_admin_header,
+            client,
+            reg_k8s_client,
+            registry_mock,
+            batch_body
+        ):
+        """
+        In queue mode the whole batch is queued
+        """
+        mocker.patch('app.tasks_api.TASK_QUEUE', "enabled")
+
+        response = client.post('/tasks/batch', json=batch_body, headers=post_json_admin_header)
+
+        assert response.status_code == 202
+        assert [res["status"] for res in response.json["tasks"]] == ["queued"] * 3
+        assert QueuedTask.query.count() == 3
+        reg_k8s_client["create_namespaced_pod_mock"].assert_not_called()
+
+    def test_dataset_access_checked_per_dataset(
+            self,
+            post_json_user_header,
+            client,
+            mock_kc_client,
+            batch_body,
+            dataset,
+            dataset_oracle
+        ):
+        """
+        Access to each distinct dataset of the batch is checked
+        once, and no task is created if any is denied
+        """
+        batch_body["tasks"][2]["tags"]["dataset_id"] = dataset_oracle.id
+        is_token_valid = mock_kc_client["wrappers_kc"].return_value.is_token_valid
+        is_token_valid.side_effect = lambda token, scope, resource, token_type: resource != (
+            f"{dataset_oracle.id}-{dataset_oracle.name}"
+        )
+
+        response = client.post('/tasks/batch', json=batch_body, headers=post_json_user_header)
+
+        assert response.status_code == 403
+        assert [call.args[2] for call in is_token_valid.call_args_list] == [
+            f"{dataset.id}-{dataset.name}",
+            f"{dataset_oracle.id}-{dataset_oracle.name}"
+        ]
+        assert Task.query.count() == 0
+
+    def test_batch_size_limit(
+            self,
+            mocker,
+            post_json_admin_header,
+            client,
+            batch_body
+        ):
+        """
+        Empty or oversized batches are rejected
+        """
+        mocker.patch('app.tasks_api.TASK_BATCH_MAX_SIZE', 2)
+
+        response = client.post('/tasks/batch', json=batch_body, headers=post_json_admin_header)
+        assert response.status_code == 400
+        assert response.json["error"] == "A batch can't have more than 2 tasks"
+
+        response = client.post('/tasks/batch', json={"tasks": []}, headers=post_json_admin_header)
+        assert response.status_code == 400
+        assert response.json["error"] == "tasks should be a non-empty list"
@@ -0,0 +1,156 @@
+import json
+from datetime import datetime, timedelta
+from kubernetes.client.exceptions import ApiException
+from pytest import fixture
+from sqlalchemy import update
+from unittest.mock import Mock
+
+from app.helpers.base_model import db
+from app.helpers.const import TASK_NAMESPACE
+from app.helpers.task_queue import TaskQueue
+from app.models.queued_task import QueuedTask
+from app.models.task import Task
+from tests.fixtures.azure_cr_fixtures import *
+from tests.fixtures.tasks_fixtures import *
+
+
+def pod_creation_error() -> ApiException:
+    return ApiException(http_resp=Mock(status=500, reason="Unavailable", data=json.dumps({"message": "Unavailable"})))
+
+@fixture
+def queue_mode(mocker):
+    mocker.patch('app.tasks_api.TASK_QUEUE', "enabled")
+
+@fixture
+def queued_task(
+        queue_mode,
+        cr_client,
+        post_json_admin_header,
+        client,
+        reg_k8s_client,
+        registry_client,
+        task_body
+    ) -> Task:
+    response = client.post('/tasks/', json=task_body, headers=post_json_admin_header)
+    assert response.status_code == 202
+    return db.session.get(Task, response.json["task_id"])
+
+
+class TestTaskQueue:
+    def test_post_task_is_queued(
+            self,
+            queued_task,
+            reg_k8s_client
+        ):
+        """
+        In queue mode, the task is stored with its run spec,
+        and no pod is created within the request
+        """
+        assert queued_task.status == "queued"
+        reg_k8s_client["create_namespaced_pod_mock"].assert_not_called()
+        item = QueuedTask.query.filter(QueuedTask.task_id == queued_task.id).one()
+        assert item.run_spec["executors"][0]["env"]["USERNAME"] == "test"
+        assert item.run_spec["db_query"]["dialect"] == "postgres"
+
+    def test_worker_runs_queued_task(
+            self,
+            queued_task,
+            reg_k8s_client
+        ):
+        """
+        A worker creates the pod, and removes the task from the queue
+        """
+        queue = TaskQueue()
+        assert queue.process_next()
+
+        reg_k8s_client["create_namespaced_pod_mock"].assert_called_once()
+        pod_body = reg_k8s_client["create_namespaced_pod_mock"].call_args.kwargs["body"]
+        assert [pod.name for pod in pod_body.spec.init_containers] == [f"init-{queued_task.id}", "fetch-data"]
+        assert queued_task.status == "scheduled"
+        assert QueuedTask.query.count() == 0
+        assert not queue.process_next()
+
+    def test_failed_attempt_is_retried_later(
+            self,
+            queued_task,
+            reg_k8s_client
+        ):
+        """
+        A failure leaves the task queued, and due again after the backoff
+        """
+        reg_k8s_client["create_namespaced_pod_mock"].side_effect = pod_creation_error()
+        queue = TaskQueue(retry_seconds=60)
+        assert queue.process_next()
+
+        item = QueuedTask.query.filter(QueuedTask.task_id == queued_task.id).one()
+        assert item.attempts == 1
+        assert item.last_error == "Failed to run pod: Unavailable"
+        assert item.next_attempt_at > datetime.now() + timedelta(seconds=50)
+        assert queued_task.status == "queued"
+        # Not due yet
+        assert not queue.process_next()
+
+        assert queue.retry_delay(3) == timedelta(seconds=240)
+        assert queue.retry_delay(10) == timedelta(seconds=300)
+
+    def test_task_fails_after_max_attempts(
+            self,
+            queued_task,
+            reg_k8s_client
+        ):
+        """
+        After the last attempt the task is marked as failed
+        """
+        reg_k8s_client["create_namespaced_pod_mock"].side_effect = pod_creation_error()
+        queue = TaskQueue(max_attempts=1)
+        assert queue.process_next()
+
+        assert queued_task.status == "failed"
+        assert queued_task.status_reason == "Failed to run pod: Unavailable"
+        assert QueuedTask.query.count() == 0
+
+    def test_cancelled_task_is_not_started(
+            self,
+            queued_task,
+            client,
+            simple_admin_header,
+            reg_k8s_client
+        ):
+        """
+        A task cancelled while queued is dropped from the queue
+        """
+        response = client.post(f'/tasks/{queued_task.id}/cancel', headers=simple_admin_header)
+        assert response.status_code == 201
+        reg_k8s_client["delete_namespaced_pod_mock"].assert_not_called()
+
+        assert TaskQueue().process_next()
+        reg_k8s_client["create_namespaced_pod_mock"].assert_not_called()
+        assert QueuedTask.query.count() == 0
+
+    def test_cancelled_while_starting(
+            self,
+            queued_task,
+            reg_k8s_client
+        ):
+        """
+        A task cancelled after the claim, while its pod is
+        created, stays cancelled and its pod is removed
+        """
+        def cancel(*args, **kwargs):
+            # What a concurrent cancel commits, without touching the
+            # worker's copy of the task
+            db.session.execute(
+                update(Task).where(Task.id == queued_task.id).values(status='cancelled'),
+                execution_options={"synchronize_session": False}
+            )
+
+        reg_k8s_client["create_namespaced_pod_mock"].side_effect = cancel
+        queue = TaskQueue()
+        assert queue.process_next()
+
+        assert queued_task.status == "cancelled"
+        reg_k8s_client["delete_namespaced_pod_mock"].assert_called_once_with(
+            queued_task.pod_name(), namespace=TASK_NAMESPACE
+        )
+        assert QueuedTask.query.count() == 0
+        assert queue.stats()["started"] == 0
@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta
+from pytest import fixture
+
+from app.helpers.base_model import db
+from app.helpers.task_queue import TaskQueue
+from app.helpers.task_scheduler import ActiveCounts, TaskScheduler, task_scheduler
+from app.models.queued_task import QueuedTask
+from app.models.task import Task
+from tests.fixtures.azure_cr_fixtures import *
+from tests.fixtures.tasks_fixtures import *
+
+
+@fixture
+def reconciler_mode(mocker):
+    # Statuses are set by the tests, rather than read from pods
+    mocker.patch('app.helpers.task_scheduler.TASK_RECONCILER', "enabled")
+
+@fixture
+def post_task(
+        cr_client,
+        post_json_admin_header,
+        client,
+        reg_k8s_client,
+        registry_client,
+        task_body
+    ):
+    def _post(requested_by:str|None=None) -> Task:
+        response = client.post('/tasks/', json=task_body, headers=post_json_admin_header)
+        assert response.status_code == 202
+        task = db.session.get(Task, response.json["task_id"])
+        if requested_by:
+            task.requested_by = requested_by
+            db.session.commit()
+        return task
+    return _post
+
+
+class TestTaskScheduler:
+    def test_admits(self):
+        """
+        A task is admitted only if it stays within every cap,
+        0 means no limit
+        """
+        task = Task(name="t", docker_image="image", requested_by="user1", dataset=None, project_name="proj")
+        task.dataset_id = 1
+        counts = ActiveCounts()
+        counts.add("user1", "proj", 1, 2)
+        counts.add("user2", None, 2, 1)
+
+        assert not TaskScheduler().enabled
+        assert TaskScheduler().admits(counts, task)
+        assert TaskScheduler(max_active=4).admits(counts, task)
+        assert not TaskScheduler(max_active=3).admits(counts, task)
+        assert not TaskScheduler(max_per_user=2).admits(counts, task)
+        assert not TaskScheduler(max_per_project=2).admits(counts, task)
+        assert not TaskScheduler(max_per_dataset=2).admits(counts, task)
+        assert TaskScheduler(max_per_user=3, max_per_dataset=3).admits(counts, task)
+
+    def test_caps_enable_the_queue(
+            self,
+            mocker,
+            reconciler_mode,
+            post_task,
+            reg_k8s_client
+        ):
+        """
+        With any cap set, tasks are queued even if
+        the queue mode is not enabled
+        """
+        mocker.patch.object(task_scheduler, "max_active", 10)
+        task = post_task()
+
+        assert task.status == "queued"
+        reg_k8s_client["create_namespaced_pod_mock"].assert_not_called()
+
+    def test_per_user_cap(
+            self,
+            mocker,
+            reconciler_mode,
+            post_task,
+            reg_k8s_client
+        ):
+        """
+        A second task from the same user waits in the queue
+        until the first one terminates
+        """
+        mocker.patch.object(task_scheduler, "max_per_user", 1)
+        first = post_task()
+        second = post_task()
+        queue = TaskQueue()
+
+        assert queue.process_next()
+        assert first.status == "scheduled"
+        assert not queue.process_next()
+        assert second.status == "queued"
+        reg_k8s_client["create_namespaced_pod_mock"].assert_called_once()
+
+        first.status = "terminated"
+        db.session.commit()
+
+        assert queue.process_next()
+        assert second.status == "scheduled"
+        assert QueuedTask.query.count() == 0
+        assert queue.stats()["admitted"] == 2
+
+    def test_global_cap(
+            self,
+            mocker,
+            reconciler_mode,
+            post_task
+        ):
+        """
+        No task starts while the node is at capacity,
+        regardless of who submitted it
+        """
+        mocker.patch.object(task_scheduler, "max_active", 1)
+        first = post_task("user1")
+        second = post_task("user2")
+        queue = TaskQueue()
+
+        assert queue.process_next()
+        assert not queue.process_next()
+        assert first.status == "scheduled"
+        assert second.status == "queued"
+        assert queue.stats()["depth"] == 1
+
+    def test_fair_share(
+            self,
+            mocker,
+            reconciler_mode,
+            post_task
+        ):
+        """
+        A user with no active tasks goes before older
+        submissions from a user already running one
+        """
+        mocker.patch.object(task_scheduler, "max_active", 10)
+        first = post_task("user1")
+        second = post_task("user1")
+        other = post_task("user2")
+        queue = TaskQueue()
+
+        assert queue.process_next()
+        assert first.status == "scheduled"
+        assert queue.process_next()
+        assert other.status == "scheduled"
+        assert second.status == "queued"
+
+    def test_missing_pods_release_slots(
+            self,
+            mocker,
+            post_task,
+            k8s_client
+        ):
+        """
+        Without the reconciler, a scheduled task whose pod
+        is gone is marked as deleted and frees its slot
+        """
+        mocker.patch('app.helpers.task_scheduler.TASK_RECONCILER', None)
+        mocker.patch.object(task_scheduler, "max_per_user", 1)
+        first = post_task()
+        second = post_task()
+        queue = TaskQueue()
+        assert queue.process_next()
+
+        k8s_client["list_namespaced_pod_mock"].return_value.items = []
+        first.updated_at = datetime.now() - timedelta(minutes=5)
+        db.session.commit()
+
+        assert queue.process_next()
+        assert first.status == "deleted"
+        assert second.status == "scheduled"
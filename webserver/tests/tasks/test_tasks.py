@@ -6,6 +6,7 @@ from unittest.mock import Mock
 
 from app.helpers.const import TASK_POD_RESULTS_PATH
 from app.helpers.base_model import db
+from app.helpers.container_registries import image_cache
 from app.models.task import Task
 from tests.fixtures.azure_cr_fixtures import *
 from tests.fixtures.tasks_fixtures import *
@@ -27,6 +28,45 @@ class TestGetTasks:
         )
         assert response.status_code == 200
 
+    def test_get_list_tasks_lists_pods_once(
+            self,
+            client,
+            simple_admin_header,
+            k8s_client,
+            task_mock,
+            pod_listed
+        ):
+        """
+        Tests that the pods for a page of tasks are fetched with
+        a single k8s call, and matched to their task by label
+        """
+        for i in range(2):
+            Task(
+                name=f"Test Task {i}",
+                docker_image=task_mock.docker_image,
+                description="something",
+                requested_by=task_mock.requested_by,
+                dataset=task_mock.dataset,
+                created_at=datetime.now()
+            ).add()
+        pod = pod_listed.items[0]
+        pod.metadata.labels = {"task_id": str(task_mock.id)}
+        pod.spec.containers = [Mock(image=task_mock.docker_image)]
+        k8s_client["list_namespaced_pod_mock"].reset_mock()
+
+        response = client.get(
+            '/tasks/',
+            headers=simple_admin_header
+        )
+        assert response.status_code == 200
+        k8s_client["list_namespaced_pod_mock"].assert_called_once()
+        selector = k8s_client["list_namespaced_pod_mock"].call_args.kwargs["label_selector"]
+        assert re.match(r"^task_id in \(\d+,\d+,\d+\)$", selector)
+
+        statuses = {task["id"]: task["status"] for task in response.json["items"]}
+        assert "terminated" in statuses[task_mock.id]
+        assert len([st for st in statuses.values() if st == "scheduled"]) == 2
+
     def test_get_list_tasks_base_user(
             self,
             client,
@@ -60,7 +100,6 @@ class TestGetTasks:
         If an admin wants to check a specific task they should be allowed regardless
         of who requested it
         """
-        mock_kc_client["tasks_api_kc"].return_value.get_user_by_id.return_value = {"username": "user"}
         resp = client.post(
             '/tasks/',
             json=task_body,
@@ -88,7 +127,7 @@ class TestGetTasks:
         """
         decode_return = {"sub": basic_user["id"]}
         decode_return.update(basic_user)
-        mock_kc_client["tasks_api_kc"].return_value.decode_token.return_value = decode_return
+        mock_kc_client["wrappers_kc"].return_value.decode_token.return_value = decode_return
         task.requested_by = basic_user["id"]
         resp = client.get(
             f'/tasks/{task.id}',
@@ -629,6 +668,41 @@ class TestPostTask:
         reg_k8s_client["create_namespaced_pod_mock"].assert_called()
         v1_crd_mock.return_value.create_cluster_custom_object.assert_not_called()
 
+    def test_create_task_runs_by_resolved_digest(
+            self,
+            mocker,
+            cr_client,
+            post_json_admin_header,
+            client,
+            reg_k8s_client,
+            container,
+            task_body,
+            v1_crd_mock
+        ):
+        """
+        With the container digest resolved, the registry is not
+        checked, and the pod runs the image by digest
+        """
+        digest = f"sha256:{'a' * 64}"
+        container.digest = digest
+        db.session.commit()
+        registry_mock = mocker.patch('app.models.registry.AzureRegistry', return_value=Mock())
+
+        response = client.post(
+            '/tasks/',
+            json=task_body,
+            headers=post_json_admin_header
+        )
+        assert response.status_code == 201
+        registry_mock.assert_not_called()
+        pod_body = reg_k8s_client["create_namespaced_pod_mock"].call_args.kwargs["body"]
+        assert pod_body.spec.containers[0].image == f"{container.registry.url}/{container.name}@{digest}"
+
+        task = db.session.get(Task, response.json["task_id"])
+        assert task.docker_image == container.full_image_name()
+        assert task.image_digest == digest
+        assert task.runs_task_image([pod_body.spec.containers[0].image])
+
     def test_create_task_image_same_name_different_registry(
             self,
             cr_client,
@@ -1080,6 +1154,61 @@ class TestValidateTask:
         assert response.status_code == 200, response.json
 
 
+    def test_validate_task_registry_check_is_cached(
+            self,
+            mocker,
+            client,
+            task_body,
+            cr_client,
+            post_json_admin_header,
+
+        ):
+        """
+        Repeated validations of the same image only
+        check the registry once
+        """
+        registry_mock = mocker.patch('app.models.registry.AzureRegistry', return_value=Mock())
+        for _ in range(3):
+            response = client.post(
+                '/tasks/validate',
+                json=task_body,
+                headers=post_json_admin_header
+            )
+            assert response.status_code == 200
+        registry_mock.assert_called_once()
+        registry_mock.return_value.has_image_tag_or_sha.assert_called_once()
+
+    def test_validate_task_missing_image_is_cached(
+            self,
+            mocker,
+            client,
+            task_body,
+            cr_client,
+            container,
+            post_json_admin_header,
+
+        ):
+        """
+        An image not found is cached as well, until
+        the registry entries are invalidated (i.e. by a sync)
+        """
+        registry_mock = mocker.patch(
+            'app.models.registry.AzureRegistry',
+            return_value=Mock(has_image_tag_or_sha=Mock(return_value=False))
+        )
+        response = client.post('/tasks/validate', json=task_body, headers=post_json_admin_header)
+        assert response.status_code != 200
+
+        registry_mock.return_value.has_image_tag_or_sha.return_value = True
+        response = client.post('/tasks/validate', json=task_body, headers=post_json_admin_header)
+        assert response.status_code != 200
+
+        image_cache.invalidate_prefix((container.registry.url,))
+        response = client.post('/tasks/validate', json=task_body, headers=post_json_admin_header)
+        assert response.status_code == 200
+        assert registry_mock.return_value.has_image_tag_or_sha.call_count == 2
+
+
 class TestTasksLogs:
     def test_task_get_logs(
             self,
@@ -0,0 +1,93 @@
+import os
+import tarfile
+import tracemalloc
+import zipfile
+from io import BytesIO
+
+from app.helpers.archive import IterStream, directory_to_tar, tar_to_zip
+from tests.conftest import results_tar
+
+
+def synthetic_tar(files:list[tuple[str, int]], chunk_size:int=64 * 1024):
+    """
+    Generates a tar stream with files of the given sizes,
+    without ever holding a whole file in memory
+    """
+    block = bytes(range(256)) * (chunk_size // 256)
+    for name, size in files:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = 1700000000
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+        left = size
+        while left:
+            yield block[:min(left, chunk_size)]
+            left -= min(left, chunk_size)
+        if size % tarfile.BLOCKSIZE:
+            yield b"\0" * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+    yield b"\0" * tarfile.BLOCKSIZE * 2
+
+
+class TestArchive:
+    def test_iter_stream_reads_across_chunks(self):
+        """
+        Reads of any size are served from the chunks in order
+        """
+        stream = IterStream([b"abc", b"", b"defgh"])
+        assert stream.read(2) == b"ab"
+        assert stream.read(4) == b"c"
+        assert stream.read() == b"defgh"
+        assert stream.read(1) == b""
+
+    def test_tar_to_zip(self):
+        """
+        Binary files are converted untouched, with relative names
+        """
+        binary = bytes(range(256)) * 10
+        zip_bytes = b"".join(tar_to_zip([results_tar({"data.bin": binary, "dir/out.txt": b"text"})]))
+
+        with zipfile.ZipFile(BytesIO(zip_bytes)) as archive:
+            assert archive.testzip() is None
+            assert sorted(archive.namelist()) == ["data.bin", "dir/out.txt"]
+            assert archive.read("data.bin") == binary
+
+    def test_directory_to_tar(self, tmp_path):
+        """
+        A local results folder is streamed like the results job does,
+        without following symlinks out of it
+        """
+        (tmp_path / "plots").mkdir()
+        (tmp_path / "plots" / "plot.png").write_bytes(bytes(range(256)) * 300)
+        (tmp_path / "results.csv").write_text("a,b")
+        os.symlink("/etc/passwd", tmp_path / "passwd")
+        os.symlink("/etc", tmp_path / "etc")
+
+        with tarfile.open(fileobj=BytesIO(b"".join(directory_to_tar(tmp_path)))) as tar:
+            assert tar.getnames() == [".", "./results.csv", "./plots", "./plots/plot.png"]
+            assert tar.extractfile("./plots/plot.png").read() == bytes(range(256)) * 300
+
+    def test_tar_to_zip_large_results_constant_memory(self):
+        """
+        A multi-GB result set, with a file over the 4GB zip limit,
+        is converted with a memory footprint independent of its size.
+        Files are stored to keep the test fast, the deflate path
+        is chunked in the same way
+        """
+        sizes = [("./small.csv", 1000), ("./large.bin", 4500 * 1024 * 1024)]
+        total = 0
+        tail = b""
+
+        tracemalloc.start()
+        try:
+            for chunk in tar_to_zip(synthetic_tar(sizes), compression=zipfile.ZIP_STORED):
+                total += len(chunk)
+                tail = (tail + chunk)[-1024:]
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert total > sum(size for _, size in sizes)
+        assert peak < 5 * 1024 * 1024
+        # zip64 end of central directory record and locator
+        assert b"PK\x06\x06" in tail
+        assert b"PK\x06\x07" in tail
@@ -0,0 +1,160 @@
+import threading
+import time
+from unittest.mock import MagicMock
+from sqlalchemy import func, select
+
+from app.helpers.audit_writer import AuditWriter
+from app.helpers.base_model import db
+from app.models.audit import Audit
+
+
+def audit_record(index:int=0) -> dict:
+    return {
+        "ip_address": "127.0.0.1",
+        "http_method": "GET",
+        "endpoint": f"/datasets/{index}",
+        "requested_by": "",
+        "status_code": 200,
+        "api_function": "get_datasets",
+        "details": None
+    }
+
+def blocking_bind(release:threading.Event) -> MagicMock:
+    """
+    Engine mock whose transactions hang until release is set
+    """
+    def begin():
+        release.wait(10)
+        return MagicMock()
+
+    bind = MagicMock()
+    bind.begin.return_value.__enter__.side_effect = begin
+    return bind
+
+def count_audits() -> int:
+    db.session.rollback()
+    return db.session.execute(select(func.count()).select_from(Audit)).scalar()
+
+
+class TestAuditWriter:
+    def test_stop_drains_the_queue(self, client):
+        """
+        All records enqueued before stopping the writer
+        are written to the db, in batches
+        """
+        writer = AuditWriter(batch_size=10, flush_interval=5)
+        writer.start()
+        for i in range(25):
+            writer.submit(audit_record(i))
+        writer.stop(timeout=10)
+
+        assert not writer.running
+        assert count_audits() == 25
+        assert writer.stats()["written"] == 25
+        assert writer.stats()["queued"] == 0
+
+    def test_flush_waits_for_pending_records(self, client):
+        """
+        Records are written after the flush interval even if
+        the batch is not full
+        """
+        writer = AuditWriter(batch_size=100, flush_interval=0.05)
+        writer.start()
+        for i in range(3):
+            writer.submit(audit_record(i))
+
+        assert writer.flush(timeout=10)
+        assert count_audits() == 3
+        writer.stop(timeout=10)
+
+    def test_event_time_is_set_on_submit(self, client):
+        """
+        The event time reflects the request, not the insert
+        """
+        writer = AuditWriter(batch_size=100, flush_interval=5)
+        writer.start()
+        record = audit_record()
+        writer.submit(record)
+        writer.stop(timeout=10)
+
+        audit = db.session.execute(select(Audit)).scalars().one()
+        assert audit.event_time == record["event_time"]
+
+    def test_not_started_writes_synchronously(self, client):
+        """
+        Without the worker thread, records are still written
+        """
+        writer = AuditWriter()
+        writer.submit(audit_record())
+
+        assert count_audits() == 1
+        assert writer.stats()["sync_writes"] == 1
+
+    def test_full_queue_drop_policy(self):
+        """
+        With the drop policy, records exceeding the queue
+        size are counted and discarded
+        """
+        release = threading.Event()
+        bind = blocking_bind(release)
+
+        writer = AuditWriter(bind=bind, maxsize=1, batch_size=1, flush_interval=0.01, policy="drop")
+        writer.start()
+        # Picked up by the worker, which then hangs on the insert
+        writer.submit(audit_record(0))
+        while writer.stats()["queued"]:
+            time.sleep(0.01)
+        writer.submit(audit_record(1))
+        writer.submit(audit_record(2))
+
+        assert writer.stats()["dropped"] == 1
+        release.set()
+        writer.stop(timeout=10)
+        assert writer.stats()["written"] == 2
+
+    def test_full_queue_block_policy(self):
+        """
+        With the block policy, records that can't be queued in time
+        are written synchronously rather than lost
+        """
+        release = threading.Event()
+        worker_bind = blocking_bind(release)
+
+        writer = AuditWriter(
+            bind=worker_bind, maxsize=1, batch_size=1,
+            flush_interval=0.01, policy="block", block_timeout=0.01
+        )
+        writer.start()
+        writer.submit(audit_record(0))
+        while writer.stats()["queued"]:
+            time.sleep(0.01)
+        writer.submit(audit_record(1))
+        release.set()
+        writer.submit(audit_record(2))
+        writer.stop(timeout=10)
+
+        assert writer.stats()["dropped"] == 0
+        assert writer.stats()["written"] == 3
+
+    def test_audit_wrapper_enqueues(
+            self,
+            mocker,
+            simple_admin_header,
+            client
+        ):
+        """
+        With AUDIT_ASYNC, the audit wrapper hands the record
+        over to the writer
+        """
+        writer = AuditWriter(batch_size=100, flush_interval=5)
+        writer.start()
+        mocker.patch('app.helpers.wrappers.AUDIT_ASYNC', True)
+        mocker.patch('app.helpers.wrappers.audit_writer', writer)
+
+        r = client.get("/datasets/", headers=simple_admin_header)
+        assert r.status_code == 200, r.text
+        writer.stop(timeout=10)
+
+        audit = db.session.execute(select(Audit)).scalars().one()
+        assert audit.api_function == "get_datasets"
+        assert audit.endpoint == "/datasets/"
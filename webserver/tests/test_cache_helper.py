@@ -0,0 +1,82 @@
+from unittest import mock
+import pytest
+
+from app.helpers.cache import TTLCache
+
+
+class TestTTLCache:
+    def test_get_set(self):
+        """
+        Simple set and get, counting hits and misses
+        """
+        cache = TTLCache()
+        assert cache.get("key") is None
+        cache.set("key", "value")
+        assert cache.get("key") == "value"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_entries_expire(self):
+        """
+        Entries are dropped once their ttl passed
+        """
+        cache = TTLCache(ttl=10)
+        with mock.patch('app.helpers.cache.time.monotonic', return_value=100):
+            cache.set("key", "value")
+            cache.set("short", "value", ttl=1)
+        with mock.patch('app.helpers.cache.time.monotonic', return_value=105):
+            assert cache.get("key") == "value"
+            assert cache.get("short") is None
+        with mock.patch('app.helpers.cache.time.monotonic', return_value=111):
+            assert cache.get("key") is None
+        assert len(cache) == 0
+
+    def test_lru_eviction(self):
+        """
+        The least recently used entry is evicted when full
+        """
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+    def test_get_or_set(self):
+        """
+        The factory is only called on misses
+        """
+        cache = TTLCache()
+        factory = mock.Mock(return_value="value")
+        assert cache.get_or_set("key", factory) == "value"
+        assert cache.get_or_set("key", factory) == "value"
+        factory.assert_called_once()
+
+    def test_get_or_set_exceptions_not_cached(self):
+        """
+        If the factory raises, nothing is cached
+        """
+        cache = TTLCache()
+        with pytest.raises(ValueError):
+            cache.get_or_set("key", mock.Mock(side_effect=ValueError))
+        assert len(cache) == 0
+
+    def test_invalidate(self):
+        """
+        Single keys and prefixes can be dropped
+        """
+        cache = TTLCache()
+        cache.set(("realm", "client", "resource", "a"), 1)
+        cache.set(("realm", "client", "resource", "b"), 2)
+        cache.set(("realm", "client", "scope", "a"), 3)
+
+        cache.invalidate(("realm", "client", "resource", "a"))
+        assert cache.get(("realm", "client", "resource", "a")) is None
+
+        cache.invalidate_prefix(("realm", "client", "resource"))
+        assert cache.get(("realm", "client", "resource", "b")) is None
+        assert cache.get(("realm", "client", "scope", "a")) == 3
@@ -4,6 +4,7 @@ from unittest.mock import Mock
 
 from app.helpers.exceptions import InvalidRequest
 from app.models.container import Container
+from app.models.registry_repository import RegistryRepository
 from tests.fixtures.azure_cr_fixtures import *
 
 
@@ -25,6 +26,8 @@ class ContainersMixin:
             "name": container.name,
             "tag": container.tag,
             "sha": container.sha,
+            "digest": container.digest,
+            "digest_resolved_at": None,
             "ml": container.ml,
             "registry_id": container.registry_id
         }
@@ -188,6 +191,37 @@ class TestPostContainers(ContainersMixin):
             name="testimage", sha="sha256:123123123"
         ).one_or_none() is not None
 
+    def test_add_new_container_resolves_digest(
+        self,
+        mocker,
+        client,
+        registry,
+        post_json_admin_header
+    ):
+        """
+        The digest the tag points to is stored with the container
+        """
+        digest = f"sha256:{'a' * 64}"
+        registry_mock = mocker.patch(
+            'app.models.registry.AzureRegistry',
+            return_value=Mock(resolve_digest=Mock(return_value=digest))
+        )
+        resp = client.post(
+            "/containers",
+            json={
+                "name": "testimage",
+                "registry": registry.url,
+                "tag": "1.0.25"
+            },
+            headers=post_json_admin_header
+        )
+        assert resp.status_code == 201
+        container = Container.query.filter_by(name="testimage", tag="1.0.25").one()
+        assert container.digest == digest
+        assert container.digest_resolved_at is not None
+        assert container.pinned_image_name() == f"{registry.url}/testimage@{digest}"
+        registry_mock.return_value.resolve_digest.assert_called_once_with("testimage", "1.0.25", None)
+
     def test_add_duplicate_container(
         self,
         client,
@@ -446,6 +480,53 @@ class TestSync:
         assert resp.status_code == 201, resp.json
         assert resp.json["images"] == []
 
+    def test_sync_skips_unchanged_repositories(
+        self,
+        client,
+        post_json_admin_header,
+        cr_client,
+        tags_request,
+        registry,
+        cr_name,
+        expected_image_names
+    ):
+        """
+        Repositories whose tags listing was not modified since the
+        previous sync, as per its ETag, are not listed again
+        """
+        for image in expected_image_names:
+            tags_request.replace(
+                responses.GET,
+                f"https://{cr_name}/v2/{image}/tags/list",
+                json={"tags": ["1.0.0"]},
+                headers={"ETag": f'"{image}-v1"'},
+                status=200
+            )
+            tags_request.add(
+                responses.GET,
+                f"https://{cr_name}/v2/{image}/manifests/1.0.0",
+                json={"config": {"digest": f"sha256:{'b' * 64}"}},
+                status=200
+            )
+        resp = client.post("/containers/sync", headers=post_json_admin_header)
+        assert resp.status_code == 201
+        assert len(resp.json["images"]) == 2 * len(expected_image_names)
+        repo = RegistryRepository.query.filter_by(registry_id=registry.id, name=expected_image_names[0]).one()
+        assert repo.etag == f'"{expected_image_names[0]}-v1"'
+
+        for image in expected_image_names:
+            tags_request.replace(
+                responses.GET,
+                f"https://{cr_name}/v2/{image}/tags/list",
+                match=[responses.matchers.header_matcher({"If-None-Match": f'"{image}-v1"'})],
+                status=304
+            )
+        manifest_calls = len([c for c in tags_request.calls if "/manifests/" in c.request.url])
+        resp = client.post("/containers/sync", headers=post_json_admin_header)
+        assert resp.status_code == 201
+        assert resp.json["images"] == []
+        assert len([c for c in tags_request.calls if "/manifests/" in c.request.url]) == manifest_calls
+
     def test_sync_no_action_inactive_registry(
         self,
         client,
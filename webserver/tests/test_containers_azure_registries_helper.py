@@ -1,6 +1,11 @@
+import base64
+import json
+import time
 import responses
 import requests
 from tests.fixtures.azure_cr_fixtures import *
+from app.helpers.const import REGISTRY_TOKEN_TTL
+from app.helpers.container_registries import token_ttl
 from app.helpers.exceptions import ContainerRegistryException
 
 
@@ -167,6 +172,38 @@ class TestAzureRegistry:
                 cr_class.get_image_tags(container.name)
             assert cre.value.description == f"Failed to fetch the list of tags for {container.name}"
 
+    def test_cr_tag_digest(
+        self,
+        cr_name,
+        container,
+        cr_class
+    ):
+        """
+        The tag digest is read from the manifest headers,
+        and None if the tag doesn't exist
+        """
+        digest = f"sha256:{'a' * 64}"
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.GET,
+                f"https://{cr_name}/oauth2/token?service={cr_name}&scope=repository:{container.name}:*",
+                json={"access_token": "12345asdf"},
+                status=200
+            )
+            rsps.add(
+                responses.HEAD,
+                f"https://{cr_name}/v2/{container.name}/manifests/{container.tag}",
+                headers={"Docker-Content-Digest": digest},
+                status=200
+            )
+            rsps.add(
+                responses.HEAD,
+                f"https://{cr_name}/v2/{container.name}/manifests/missing",
+                status=404
+            )
+            assert cr_class.resolve_digest(container.name, container.tag) == digest
+            assert cr_class.get_tag_digest(container.name, "missing") is None
+
     def test_cr_list_repo_connection_error(
         self,
         registry,
@@ -211,3 +248,112 @@ class TestAzureRegistry:
             with pytest.raises(ContainerRegistryException) as cre:
                 cr_class.list_repos()
             assert cre.value.description == "Could not fetch the list of images"
+
+    def test_cr_tags_pagination(
+        self,
+        container,
+        cr_name,
+        cr_class
+    ):
+        """
+        Checks that the tags listing follows the Link header
+        through all pages, and that every tag digest is kept
+        """
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.GET,
+                f"https://{cr_name}/oauth2/token?service={cr_name}&scope=repository:{container.name}:*",
+                json={"access_token": "12345asdf"},
+                status=200
+            )
+            rsps.add(
+                responses.GET,
+                f"https://{cr_name}/v2/{container.name}/tags/list",
+                match=[responses.matchers.query_param_matcher({"n": "100"})],
+                json={"tags": ["1.0.0"]},
+                headers={"Link": f'</v2/{container.name}/tags/list?last=1.0.0&n=100>; rel="next"'},
+                status=200
+            )
+            rsps.add(
+                responses.GET,
+                f"https://{cr_name}/v2/{container.name}/tags/list",
+                match=[responses.matchers.query_param_matcher({"last": "1.0.0", "n": "100"})],
+                json={"tags": ["2.0.0"]},
+                status=200
+            )
+            for tag, digest in [("1.0.0", "sha256:111"), ("2.0.0", "sha256:222")]:
+                rsps.add(
+                    responses.GET,
+                    f"https://{cr_name}/v2/{container.name}/manifests/{tag}",
+                    json={"config": {"digest": digest}},
+                    status=200
+                )
+            assert cr_class.get_image_tags(container.name) == {
+                "tag": ["1.0.0", "2.0.0"],
+                "sha": ["sha256:111", "sha256:222"]
+            }
+
+    def test_cr_tags_not_modified(
+        self,
+        container,
+        cr_name,
+        cr_class
+    ):
+        """
+        Checks that the tags listing is a conditional request
+        when the validators of a previous listing are given
+        """
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.GET,
+                f"https://{cr_name}/oauth2/token?service={cr_name}&scope=repository:{container.name}:*",
+                json={"access_token": "12345asdf"},
+                status=200
+            )
+            rsps.add(
+                responses.GET,
+                f"https://{cr_name}/v2/{container.name}/tags/list",
+                match=[responses.matchers.header_matcher({"If-None-Match": '"v1"'})],
+                status=304
+            )
+            tags, digests, validators = cr_class.get_image_tags_if_changed(
+                container.name, {"etag": '"v1"', "last_modified": None}
+            )
+            assert tags is None
+            assert digests == {}
+            assert validators["etag"] == '"v1"'
+
+    def test_cr_repository_token_reused(
+        self,
+        container,
+        cr_name,
+        cr_class
+    ):
+        """
+        Checks that a repository token is requested once
+        for any number of requests on that repository,
+        and requested again when rejected as expired
+        """
+        login_url = f"https://{cr_name}/oauth2/token?service={cr_name}&scope=repository:{container.name}:*"
+        tags_url = f"https://{cr_name}/v2/{container.name}/tags/list"
+        with responses.RequestsMock() as rsps:
+            rsps.add(responses.GET, login_url, json={"access_token": "12345asdf"}, status=200)
+            rsps.add(responses.GET, tags_url, json={"tags": []}, status=200)
+
+            cr_class.get_image_tags(container.name)
+            cr_class.get_image_tags(container.name)
+            assert len([call for call in rsps.calls if call.request.url == login_url]) == 1
+
+            rsps.replace(responses.GET, tags_url, json={"errors": []}, status=401)
+            rsps.add(responses.GET, tags_url, json={"tags": []}, status=200)
+            assert cr_class.get_image_tags(container.name) == {"tag": [], "sha": []}
+            assert len([call for call in rsps.calls if call.request.url == login_url]) == 2
+
+    def test_token_ttl(self):
+        """
+        JWT tokens are cached until shortly before they expire,
+        other tokens for REGISTRY_TOKEN_TTL
+        """
+        payload = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + 120}).encode()).decode().rstrip("=")
+        assert 80 < token_ttl(f"header.{payload}.signature") <= 90
+        assert token_ttl("opaque") == REGISTRY_TOKEN_TTL
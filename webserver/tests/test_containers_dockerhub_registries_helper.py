@@ -53,12 +53,7 @@ class TestDockerRegistry:
             metadata response is empty. Which is an empty dictionary
         """
         with responses.RequestsMock() as rsps:
-            rsps.add(
-                responses.GET,
-                self.login_url,
-                json={"token": "12345asdf"},
-                status=200
-            )
+            # The token from the client login is reused
             rsps.add(
                 responses.GET,
                 self.tags_url % (registry.url, container.name),
@@ -78,12 +73,7 @@ class TestDockerRegistry:
             tag is not in the list of the metadata info. Which is a `False`
         """
         with responses.RequestsMock() as rsps:
-            rsps.add(
-                responses.GET,
-                self.login_url,
-                json={"token": "12345asdf"},
-                status=200
-            )
+            # The token from the client login is reused
             rsps.add(
                 responses.GET,
                 self.tags_url % (registry.url ,container.name),
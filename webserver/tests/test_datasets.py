@@ -913,7 +913,7 @@ class TestBeacon:
         """
         Test that the beacon endpoint is accessible to admin users
         """
-        mocker.patch('app.helpers.query_validator.create_engine')
+        mocker.patch('app.helpers.dataset_engines.create_engine')
         mocker.patch(
             'app.helpers.query_validator.sessionmaker',
         ).__enter__.return_value = Mock()
@@ -938,7 +938,7 @@ class TestBeacon:
         """
         Test that the beacon endpoint is accessible to admin users
         """
-        mocker.patch('app.helpers.query_validator.create_engine')
+        mocker.patch('app.helpers.dataset_engines.create_engine')
         mocker.patch(
             'app.helpers.query_validator.sessionmaker',
             side_effect = ProgrammingError(statement="", params={}, orig="error test")
@@ -966,7 +966,7 @@ class TestBeacon:
         but returns an appropriate error message in case of connection
         failed
         """
-        mocker.patch('app.helpers.query_validator.create_engine')
+        mocker.patch('app.helpers.dataset_engines.create_engine')
         mocker.patch(
             'app.helpers.query_validator.sessionmaker',
             side_effect = OperationalError(
@@ -985,6 +985,123 @@ class TestBeacon:
         assert response.status_code == 500
         assert response.json['error'] == 'Could not connect to the database'
 
+    def beacon_session(self, mocker, rows:int) -> Mock:
+        """
+        Dataset session planning any query, and counting rows
+        """
+        session = Mock()
+        session.execute.return_value.scalar.side_effect = lambda: (
+            rows if "COUNT(*)" in str(session.execute.call_args.args[0])
+            else [{"Plan": {"Node Type": "Seq Scan"}}]
+        )
+        mocker.patch('app.helpers.query_validator.connect_to_dataset', return_value=session)
+        return session
+
+    def test_beacon_count(
+            self,
+            client,
+            post_json_admin_header,
+            mocker,
+            dataset
+    ):
+        """
+        Count mode returns the rows the query selects,
+        and reuses the count for the same query
+        """
+        session = self.beacon_session(mocker, 120)
+        for query in ["SELECT * FROM patients;", "SELECT *\n  FROM patients"]:
+            response = client.post(
+                "/datasets/selection/beacon",
+                json={
+                    "query": query,
+                    "dataset_id": dataset.id,
+                    "mode": "count"
+                },
+                headers=post_json_admin_header
+            )
+            assert response.status_code == 200
+            assert response.json == {
+                "query": query,
+                "result": "Ok",
+                "count": 120,
+                "suppressed": False
+            }
+        assert [str(call.args[0]) for call in session.execute.call_args_list].count(
+            "SELECT COUNT(*) FROM (SELECT * FROM patients) fn_beacon"
+        ) == 1
+
+    def test_beacon_count_suppressed(
+            self,
+            client,
+            post_json_admin_header,
+            mocker,
+            dataset
+    ):
+        """
+        Counts under BEACON_MIN_COUNT are not disclosed
+        """
+        self.beacon_session(mocker, 3)
+        response = client.post(
+            "/datasets/selection/beacon",
+            json={
+                "query": "SELECT * FROM patients WHERE age > 100",
+                "dataset_id": dataset.id,
+                "mode": "count"
+            },
+            headers=post_json_admin_header
+        )
+        assert response.status_code == 200
+        assert response.json["count"] is None
+        assert response.json["suppressed"]
+
+    def test_beacon_count_reset_on_dataset_update(
+            self,
+            client,
+            post_json_admin_header,
+            mocker,
+            dataset,
+            k8s_client
+    ):
+        """
+        Updating the dataset discards its cached counts
+        """
+        self.beacon_session(mocker, 120)
+        body = {
+            "query": "SELECT * FROM patients",
+            "dataset_id": dataset.id,
+            "mode": "count"
+        }
+        client.post("/datasets/selection/beacon", json=body, headers=post_json_admin_header)
+
+        response = client.patch(
+            f"/datasets/{dataset.id}",
+            json={"host": "another.example.com"},
+            headers=post_json_admin_header
+        )
+        assert response.status_code == 202
+
+        self.beacon_session(mocker, 80)
+        response = client.post("/datasets/selection/beacon", json=body, headers=post_json_admin_header)
+        assert response.json["count"] == 80
+
+    def test_beacon_unknown_mode(
+            self,
+            client,
+            post_json_admin_header,
+            dataset
+    ):
+        response = client.post(
+            "/datasets/selection/beacon",
+            json={
+                "query": "SELECT * FROM patients",
+                "dataset_id": dataset.id,
+                "mode": "rows"
+            },
+            headers=post_json_admin_header
+        )
+        assert response.status_code == 400
+        assert response.json["error"] == "mode should be either validate or count"
+
 
 class TestDeleteDataset(MixinTestDataset):
     def test_delete_dataset_with_secrets(
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+from app.helpers.base_model import db
+from app.helpers.container_registries import image_cache
+from app.helpers.digest_refresher import DigestRefresher
+from tests.fixtures.azure_cr_fixtures import *
+
+
+OLD_DIGEST = f"sha256:{'a' * 64}"
+NEW_DIGEST = f"sha256:{'b' * 64}"
+
+
+class TestDigestRefresher:
+    def test_stale_digests_are_resolved_again(
+            self,
+            mocker,
+            container
+        ):
+        """
+        A tag pushed again gets its new digest, recent
+        ones are left alone
+        """
+        registry_mock = mocker.patch(
+            'app.models.registry.AzureRegistry',
+            return_value=Mock(resolve_digest=Mock(return_value=NEW_DIGEST))
+        )
+        container.digest = OLD_DIGEST
+        container.digest_resolved_at = datetime.now() - timedelta(hours=2)
+        db.session.commit()
+        image_cache.set((container.registry.url, container.name, container.tag, None), True)
+
+        refresher = DigestRefresher(interval_minutes=60)
+        assert refresher.refresh() == 1
+
+        assert container.digest == NEW_DIGEST
+        assert container.digest_resolved_at > datetime.now() - timedelta(minutes=1)
+        assert refresher.stats()["changed"] == 1
+        assert len(image_cache) == 0
+
+        assert refresher.refresh() == 0
+        registry_mock.return_value.resolve_digest.assert_called_once()
+
+    def test_removed_tag_clears_digest(
+            self,
+            mocker,
+            container
+        ):
+        """
+        A tag not found anymore loses its digest, so
+        tasks go through the registry check again
+        """
+        mocker.patch(
+            'app.models.registry.AzureRegistry',
+            return_value=Mock(resolve_digest=Mock(return_value=None))
+        )
+        container.digest = OLD_DIGEST
+        db.session.commit()
+
+        DigestRefresher(interval_minutes=60).refresh()
+
+        assert container.digest is None
+        assert container.pinned_image_name() == container.full_image_name()
+
+    def test_sha_containers_are_not_refreshed(
+            self,
+            mocker,
+            container_with_sha
+        ):
+        """
+        A sha can't point to anything else, once
+        resolved it's not checked again
+        """
+        registry_mock = mocker.patch(
+            'app.models.registry.AzureRegistry',
+            return_value=Mock(resolve_digest=Mock(return_value=container_with_sha.sha))
+        )
+        refresher = DigestRefresher(interval_minutes=60)
+        assert refresher.refresh() == 1
+        assert container_with_sha.digest == container_with_sha.sha
+
+        container_with_sha.digest_resolved_at = datetime.now() - timedelta(hours=2)
+        db.session.commit()
+        assert refresher.refresh() == 0
+        registry_mock.return_value.resolve_digest.assert_called_once()
@@ -0,0 +1,97 @@
+import pytest
+import requests
+import responses
+
+from app.helpers.exceptions import KeycloakError
+from app.helpers.http_session import PooledSession, endpoint_label
+from app.helpers.keycloak import REALM, URLS, Keycloak, keycloak_latency
+from app.helpers.metrics import Histogram
+
+
+class TestPooledSession:
+    def test_endpoint_label(self):
+        """
+        Ids and query strings are stripped from the label
+        """
+        assert endpoint_label(
+            "get",
+            "http://kc/admin/realms/FN/clients/5b0c3f1e-7d0a-4b8e-9a39-6f1f1c8a6a01/authz/resource-server/resource?name=1-ds"
+        ) == "GET /admin/realms/FN/clients/{id}/authz/resource-server/resource"
+        assert endpoint_label("delete", "http://kc/users/12") == "DELETE /users/{id}"
+
+    def test_default_timeout(self):
+        """
+        Requests without an explicit timeout get the session's one
+        """
+        session = PooledSession(timeout=(1, 2))
+        with responses.RequestsMock() as rsps:
+            rsps.add(responses.GET, "http://service/path", json={})
+            session.get("http://service/path")
+            session.get("http://service/path", timeout=10)
+            assert rsps.calls[0].request.req_kwargs["timeout"] == (1, 2)
+            assert rsps.calls[1].request.req_kwargs["timeout"] == 10
+
+    def test_retries_transient_errors(self):
+        """
+        GETs are retried on 503
+        """
+        session = PooledSession(retries=2)
+        with responses.RequestsMock() as rsps:
+            rsps.add(responses.GET, "http://service/path", status=503)
+            rsps.add(responses.GET, "http://service/path", json={"ok": True})
+            resp = session.get("http://service/path")
+            assert resp.status_code == 200
+            assert len(rsps.calls) == 2
+
+    def test_post_not_retried_on_error_status(self):
+        """
+        POSTs are not idempotent, a 503 is returned as is
+        """
+        session = PooledSession(retries=2)
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+            rsps.add(responses.POST, "http://service/path", status=503)
+            rsps.add(responses.POST, "http://service/path", json={"ok": True})
+            resp = session.post("http://service/path")
+            assert resp.status_code == 503
+            assert len(rsps.calls) == 1
+
+    def test_latency_is_recorded(self):
+        """
+        Each request is observed in the histogram, grouped by endpoint
+        """
+        histogram = Histogram()
+        session = PooledSession(histogram=histogram)
+        with responses.RequestsMock() as rsps:
+            rsps.add(responses.GET, "http://service/items/1", json={})
+            rsps.add(responses.GET, "http://service/items/2", json={})
+            session.get("http://service/items/1")
+            session.get("http://service/items/2")
+        assert histogram.collect()["GET /items/{id}"]["count"] == 2
+
+
+class TestKeycloakSession:
+    def test_unreachable_keycloak(self):
+        """
+        Connection errors are reported as a KeycloakError
+        """
+        with responses.RequestsMock() as rsps:
+            rsps.add(responses.POST, URLS["get_token"], body=requests.exceptions.ConnectionError("refused"))
+            with pytest.raises(KeycloakError) as exc:
+                Keycloak()
+            assert exc.value.code == 503
+            assert exc.value.description == "Keycloak is not reachable"
+
+    def test_keycloak_latency_metrics(self):
+        """
+        Keycloak calls are tracked per endpoint
+        """
+        keycloak_latency.clear()
+        with responses.RequestsMock() as rsps:
+            rsps.add(responses.POST, URLS["get_token"], json={"access_token": "token", "expires_in": 300})
+            rsps.add(responses.GET, URLS["client"], json=[{"id": "12"}])
+            rsps.add(responses.GET, URLS["client_secret"] % "12", json={"value": "secret"})
+            Keycloak()
+        assert keycloak_latency.collect().keys() >= {
+            f"POST /realms/{REALM}/protocol/openid-connect/token",
+            f"GET /admin/realms/{REALM}/clients"
+        }
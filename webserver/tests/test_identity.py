@@ -0,0 +1,45 @@
+from unittest.mock import Mock
+
+from app.helpers.identity import Identity
+
+
+class TestIdentity:
+    def test_admin_check_is_lazy(self):
+        """
+        The admin flag is only resolved when needed, and only once
+        """
+        admin_check = Mock(return_value=True)
+        identity = Identity(id="user_id", admin_check=admin_check)
+        admin_check.assert_not_called()
+
+        assert identity.is_admin
+        assert identity.is_admin
+        admin_check.assert_called_once()
+
+    def test_known_admin_flag(self):
+        """
+        If the flag is known already, no check is performed
+        """
+        admin_check = Mock(return_value=True)
+        identity = Identity(id="user_id", is_admin=False, admin_check=admin_check)
+
+        assert not identity.is_admin
+        admin_check.assert_not_called()
+
+    def test_user_resolved_once_per_request(
+            self,
+            simple_admin_header,
+            client,
+            mock_kc_client,
+            user_uuid
+        ):
+        """
+        auth resolves the user, audit reuses it rather than
+        asking Keycloak again
+        """
+        wrappers_kc = mock_kc_client["wrappers_kc"].return_value
+        response = client.get("/datasets/", headers=simple_admin_header)
+
+        assert response.status_code == 200
+        assert wrappers_kc.decode_token.call_count == 1
+        wrappers_kc.get_user_by_email.assert_not_called()
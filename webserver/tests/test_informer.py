@@ -0,0 +1,147 @@
+import threading
+from unittest.mock import Mock
+from kubernetes.client import V1ObjectMeta, V1Pod, V1PodStatus
+from kubernetes.client.exceptions import ApiException
+from pytest import fixture
+
+from app.helpers.informer import Informer, pod_informer
+from app.helpers.kubernetes import KubernetesClient
+
+
+def make_pod(name:str, labels:dict, resource_version:str="1", phase:str="Pending") -> V1Pod:
+    return V1Pod(
+        metadata=V1ObjectMeta(name=name, labels=labels, resource_version=resource_version),
+        status=V1PodStatus(phase=phase)
+    )
+
+@fixture
+def informer():
+    return Informer("pods", list_func=Mock())
+
+@fixture
+def running_pod_informer(mocker):
+    """
+    Makes the module pod informer look synced, without a watch
+    """
+    pod_informer.replace([], "1")
+    mocker.patch.object(pod_informer, "_synced", Mock(is_set=Mock(return_value=True)))
+    mocker.patch.object(pod_informer, "_thread", Mock(is_alive=Mock(return_value=True)))
+    yield pod_informer
+    pod_informer.replace([], None)
+
+
+class TestInformer:
+    def test_replace_indexes_by_labels(self, informer):
+        """
+        After a list, objects can be looked up by each indexed label
+        """
+        informer.replace([
+            make_pod("task-1", {"task_id": "1"}),
+            make_pod("task-2", {"task_id": "2"}),
+            make_pod("result-job-a", {"job-name": "result-job", "result_task_id": "1"})
+        ], "10")
+
+        assert [p.metadata.name for p in informer.by_label("task_id", "1")] == ["task-1"]
+        assert [p.metadata.name for p in informer.by_label("job-name", "result-job")] == ["result-job-a"]
+        assert informer.by_label("task_id", "3") == []
+        assert informer.resource_version == "10"
+
+    def test_apply_events(self, informer):
+        """
+        Watch events update the store, the indexes and the resourceVersion
+        """
+        informer.replace([make_pod("task-1", {"task_id": "1"})], "10")
+
+        informer.apply("MODIFIED", make_pod("task-1", {"task_id": "1"}, "11", "Running"))
+        assert informer.by_label("task_id", "1")[0].status.phase == "Running"
+
+        informer.apply("ADDED", make_pod("task-2", {"task_id": "2"}, "12"))
+        informer.apply("DELETED", make_pod("task-1", {"task_id": "1"}, "13"))
+        assert informer.by_label("task_id", "1") == []
+        assert len(informer.by_label("task_id", "2")) == 1
+
+        informer.apply("BOOKMARK", make_pod("", None, "20"))
+        assert informer.resource_version == "20"
+        assert informer.stats()["objects"] == 1
+
+    def test_label_change_reindexes(self, informer):
+        """
+        A modified object is removed from the index of its old label value
+        """
+        informer.replace([make_pod("pod", {"task_id": "1"})], "1")
+        informer.apply("MODIFIED", make_pod("pod", {"task_id": "2"}, "2"))
+
+        assert informer.by_label("task_id", "1") == []
+        assert len(informer.by_label("task_id", "2")) == 1
+
+    def test_wait_for(self, informer):
+        """
+        wait_for returns as soon as an event satisfies the condition
+        """
+        informer.replace([make_pod("pod", {"job-name": "job"})], "1")
+        is_running = lambda pods: any(p.status.phase == "Running" for p in pods)
+
+        assert not informer.wait_for("job-name", "job", is_running, timeout=0.05)
+
+        timer = threading.Timer(
+            0.05, informer.apply, args=("MODIFIED", make_pod("pod", {"job-name": "job"}, "2", "Running"))
+        )
+        timer.start()
+        assert informer.wait_for("job-name", "job", is_running, timeout=5)
+        timer.join()
+
+    def test_expired_watch_lists_again(self, informer, mocker):
+        """
+        A 410 Gone from the watch makes the informer list again,
+        instead of resuming from the stale resourceVersion
+        """
+        informer.list_func.return_value = Mock(
+            items=[make_pod("task-1", {"task_id": "1"})],
+            metadata=Mock(resource_version="5")
+        )
+        calls = []
+
+        def stream(*args, **kwargs):
+            calls.append(kwargs["resource_version"])
+            if len(calls) == 1:
+                raise ApiException(status=410, reason="Expired")
+            informer.stop()
+            return iter([])
+
+        mocker.patch('app.helpers.informer.Watch', return_value=Mock(stream=stream))
+        informer._run()
+
+        assert informer.list_func.call_count == 2
+        assert calls == ["5", "5"]
+        assert informer.stats()["relists"] == 2
+
+    def test_get_current_pod_uses_informer(
+            self,
+            running_pod_informer,
+            k8s_client
+        ):
+        """
+        When the informer is synced, no k8s API call is made to find the pods
+        """
+        running_pod_informer.replace([make_pod("task-1", {"task_id": "1"})], "1")
+
+        pods = KubernetesClient().list_pods_by_label("task_id", "1")
+
+        assert [p.metadata.name for p in pods] == ["task-1"]
+        k8s_client["list_namespaced_pod_mock"].assert_not_called()
+
+    def test_is_pod_ready_uses_informer(
+            self,
+            running_pod_informer,
+            k8s_client,
+            mocker
+        ):
+        """
+        is_pod_ready waits on the informer instead of opening a watch
+        """
+        watch_mock = mocker.patch('app.helpers.kubernetes.Watch')
+        running_pod_informer.replace([make_pod("job-pod", {"job-name": "job"}, phase="Running")], "1")
+
+        KubernetesClient().is_pod_ready("job-name=job")
+
+        watch_mock.assert_not_called()
@@ -19,7 +19,8 @@ from unittest import mock
 from unittest.mock import Mock
 
 from app.helpers.exceptions import InvalidRequest, KubernetesException
-from app.helpers.kubernetes import KubernetesClient, KubernetesBatchClient
+from app.helpers.const import KUBERNETES_POOL_SIZE
+from app.helpers.kubernetes import KubernetesClient, KubernetesBatchClient, KubernetesCRDClient
 from tests.conftest import side_effect
 from app.helpers.task_pod import TaskPod
 
@@ -56,6 +57,22 @@ def job_dict():
     }
 
 class TestKubernetesHelper:
+    def test_api_client_is_shared(
+        self,
+        mocker,
+        k8s_config
+    ):
+        """
+        Test that the cluster config is loaded once, and all
+            the API classes share the same client and pool
+        """
+        load_config = mocker.patch('app.helpers.kubernetes.config.load_kube_config')
+        clients = [KubernetesClient(), KubernetesBatchClient(), KubernetesCRDClient(), KubernetesClient()]
+
+        load_config.assert_called_once()
+        assert len({id(k8s.api_client) for k8s in clients}) == 1
+        assert clients[0].api_client.configuration.connection_pool_maxsize == KUBERNETES_POOL_SIZE
+
     @mock.patch('urllib3.PoolManager')
     def test_create_pod(
         self,
@@ -189,6 +206,27 @@ class TestKubernetesHelper:
         with pytest.raises(InvalidRequest):
             k8s.delete_pod('pod', namespace)
 
+    @mock.patch('kubernetes.stream.ws_client.WSClient')
+    def test_stream_from_pod(
+        self,
+        ws_mock,
+        k8s_config
+    ):
+        """
+        Tests the tar stream is read as bytes, chunk by chunk,
+        and the exec connection closed at the end
+        """
+        ws_mock.return_value = Mock(
+            is_open=Mock(side_effect=[True, True, False]),
+            peek_stdout=Mock(return_value=True),
+            read_stdout=Mock(side_effect=[b'\x00\xff', b'\x89PNG']),
+            peek_stderr=Mock(return_value=False)
+        )
+
+        k8s = KubernetesClient()
+        assert list(k8s.stream_from_pod("pod_name", "/mnt")) == [b'\x00\xff', b'\x89PNG']
+        ws_mock.return_value.close.assert_called_once()
+
     @mock.patch('kubernetes.stream.ws_client.WSClient')
     def test_cp_from_pod(
         self,
@@ -0,0 +1,42 @@
+from app.helpers.metrics import collect, register_collector
+
+
+class TestMetrics:
+    def test_get_metrics(
+            self,
+            simple_admin_header,
+            client
+        ):
+        """
+        Admins can see the registered collectors
+        """
+        response = client.get("/metrics", headers=simple_admin_header)
+        assert response.status_code == 200
+        assert "keycloak_metadata_cache" in response.json
+        assert response.json["keycloak_metadata_cache"].keys() >= {"hits", "misses", "size"}
+
+    def test_get_metrics_not_by_standard_users(
+            self,
+            simple_user_header,
+            client,
+            mock_kc_client
+        ):
+        """
+        Non admins get a 403
+        """
+        mock_kc_client["wrappers_kc"].return_value.is_token_valid.return_value = False
+        response = client.get("/metrics", headers=simple_user_header)
+        assert response.status_code == 403
+
+    def test_failing_collector_is_skipped(self):
+        """
+        A broken collector doesn't prevent others from reporting
+        """
+        def broken():
+            raise ValueError("broken")
+
+        register_collector("broken_test", broken)
+        register_collector("working_test", lambda: {"value": 1})
+        snapshot = collect()
+        assert "broken_test" not in snapshot
+        assert snapshot["working_test"] == {"value": 1}
@@ -1,4 +1,7 @@
+from app.helpers.base_model import db
+from app.helpers.pagination import Pagination
 from app.models.dataset import Dataset
+from app.models.task import Task
 
 
 class TestPagination:
@@ -55,3 +58,153 @@ class TestPagination:
 
         assert resp.status_code == 400
         assert resp.json["error"] == "page and per_page parameters should be integers"
+
+    def test_cursor_pagination(
+            self,
+            client,
+            mocker,
+            k8s_client,
+            user_uuid,
+            dataset,
+            dataset_oracle,
+            simple_admin_header
+        ):
+        """
+        Test that following the next_cursor returns all records
+        once, newest first, without counting them
+        """
+        mocker.patch('app.helpers.wrappers.Keycloak.is_token_valid', return_value=True)
+        Dataset(
+            name="testnew",
+            host="host.url",
+            username="user",
+            password="pass"
+        ).add(user_id=user_uuid)
+        resp = client.get('/datasets', query_string={"limit": '2'}, headers=simple_admin_header)
+
+        assert resp.status_code == 200
+        assert len(resp.json["items"]) == 2
+        assert resp.json["items"][0]["name"] == "testnew"
+        assert "total" not in resp.json
+        assert resp.json["next_cursor"]
+
+        resp_next = client.get(
+            '/datasets',
+            query_string={"limit": '2', "cursor": resp.json["next_cursor"]},
+            headers=simple_admin_header
+        )
+        assert resp_next.status_code == 200
+        assert len(resp_next.json["items"]) == 1
+        assert resp_next.json["next_cursor"] is None
+        ids = [ds["id"] for ds in resp.json["items"] + resp_next.json["items"]]
+        assert ids == sorted(ids, reverse=True)
+
+    def test_cursor_pagination_with_count(
+            self,
+            client,
+            dataset,
+            dataset_oracle,
+            simple_admin_header
+        ):
+        """
+        Test that the total is only returned if requested
+        """
+        resp = client.get('/datasets', query_string={"cursor": "", "count": "true"}, headers=simple_admin_header)
+
+        assert resp.status_code == 200
+        assert resp.json["total"] == 2
+        assert resp.json["next_cursor"] is None
+
+    def test_cursor_pagination_with_time_column(
+            self,
+            client,
+            simple_admin_header
+        ):
+        """
+        Test that models with a time column are paginated
+        on it, with filters still applied
+        """
+        for _ in range(3):
+            client.get('/datasets', headers=simple_admin_header)
+
+        resp = client.get(
+            '/audit',
+            query_string={"limit": '2', "api_function": "get_datasets"},
+            headers=simple_admin_header
+        )
+        assert resp.status_code == 200
+        assert len(resp.json["items"]) == 2
+
+        resp_next = client.get(
+            '/audit',
+            query_string={"limit": '2', "api_function": "get_datasets", "cursor": resp.json["next_cursor"]},
+            headers=simple_admin_header
+        )
+        assert resp_next.status_code == 200
+        assert len(resp_next.json["items"]) == 1
+        assert resp.json["items"][-1]["id"] > resp_next.json["items"][0]["id"]
+
+    def test_cursor_pagination_null_time_column(
+            self,
+            client,
+            user_uuid,
+            dataset,
+            container
+        ):
+        """
+        Test that rows without a time value are still returned,
+        after the others, and that an existing ordering on
+        the query does not take precedence over the keyset one
+        """
+        tasks = []
+        for i in range(4):
+            task = Task(
+                dataset=dataset,
+                docker_image=container.full_image_name(),
+                name=f"task{i}",
+                executors=[{"image": container.full_image_name()}],
+                requested_by=user_uuid
+            )
+            task.add()
+            tasks.append(task)
+        for task in tasks[:2]:
+            task.created_at = None
+        db.session.commit()
+
+        query = Task.query.order_by(Task.id)
+        ids = []
+        cursor = ""
+        while cursor is not None:
+            page = Pagination(cursor=cursor, limit=1).apply(query, Task)
+            ids += [task.id for task in page.items]
+            cursor = page.next_cursor
+
+        assert ids == [tasks[3].id, tasks[2].id, tasks[1].id, tasks[0].id]
+
+    def test_cursor_pagination_invalid_cursor(
+            self,
+            client,
+            simple_admin_header
+        ):
+        """
+        Test that a tampered cursor returns a 400
+        """
+        resp = client.get('/datasets', query_string={"cursor": "notacursor"}, headers=simple_admin_header)
+
+        assert resp.status_code == 400
+        assert resp.json["error"] == "Invalid cursor"
+
+    def test_cursor_pagination_invalid_limit(
+            self,
+            client,
+            simple_admin_header
+        ):
+        """
+        Test that the limit is validated
+        """
+        resp = client.get('/datasets', query_string={"limit": "0"}, headers=simple_admin_header)
+        assert resp.status_code == 400
+
+        resp = client.get('/datasets', query_string={"limit": "asdf"}, headers=simple_admin_header)
+        assert resp.status_code == 400
+        assert resp.json["error"] == "limit parameter should be an integer"
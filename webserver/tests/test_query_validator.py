@@ -0,0 +1,94 @@
+from unittest.mock import Mock
+from sqlalchemy.exc import OperationalError
+
+from app.helpers.query_validator import (
+    BaseValidator, MariaDBValidator, MssqlValidator, MysqlValidator, PostgresValidator,
+    normalise_query, validate
+)
+
+
+def executed(session:Mock) -> list[str]:
+    return [str(call.args[0]) for call in session.execute.call_args_list]
+
+
+class TestQueryValidators:
+    def test_postgres_explains(self):
+        """
+        The query is only planned, in a read only
+        transaction with a statement timeout
+        """
+        session = Mock()
+        session.execute.return_value.scalar.return_value = [{"Plan": {"Node Type": "Seq Scan"}}]
+
+        assert PostgresValidator(timeout=5).validate(session, "SELECT * FROM patients;")
+        assert executed(session) == [
+            "SET TRANSACTION READ ONLY",
+            "SET LOCAL statement_timeout = 5000",
+            "EXPLAIN (FORMAT JSON) SELECT * FROM patients"
+        ]
+
+    def test_postgres_rejects_data_changes(self):
+        session = Mock()
+        session.execute.return_value.scalar.return_value = '[{"Plan": {"Node Type": "ModifyTable"}}]'
+
+        assert not PostgresValidator().validate(session, "DELETE FROM patients")
+
+    def test_mssql_describes(self):
+        """
+        The query is described, a statement with no
+        result set is not a query
+        """
+        session = Mock()
+        session.execute.return_value.all.return_value = [{"name": "id"}]
+        assert MssqlValidator().validate(session, "SELECT TOP 10 * FROM patients")
+        assert session.execute.call_args.args[1] == {"tsql": "SELECT TOP 10 * FROM patients"}
+
+        session.execute.return_value.all.return_value = []
+        assert not MssqlValidator().validate(session, "UPDATE patients SET age = 1")
+
+    def test_mysql_explains(self):
+        session = Mock()
+        session.execute.return_value.mappings.return_value.all.return_value = [{"select_type": "SIMPLE"}]
+
+        assert MysqlValidator(timeout=2).validate(session, "SELECT * FROM patients")
+        assert executed(session) == [
+            "SET SESSION max_execution_time = 2000",
+            "EXPLAIN SELECT * FROM patients"
+        ]
+
+        session.execute.return_value.mappings.return_value.all.return_value = [{"select_type": "UPDATE"}]
+        assert not MariaDBValidator(timeout=2).validate(session, "UPDATE patients SET age = 1")
+        assert executed(session)[-2] == "SET SESSION max_statement_time = 2"
+
+    def test_other_engines_wrap_the_query(self):
+        """
+        Other engines run the query as a subquery returning no rows
+        """
+        session = Mock()
+
+        assert BaseValidator().validate(session, "SELECT * FROM patients")
+        assert executed(session) == ["SELECT * FROM (SELECT * FROM patients) fn_beacon WHERE 1 = 0"]
+
+    def test_errors_after_connecting_are_invalid_queries(
+            self,
+            mocker,
+            dataset
+        ):
+        """
+        Once connected, a database error (i.e. a timeout)
+        means the query is not valid
+        """
+        session = Mock()
+        session.execute.side_effect = OperationalError(statement="", params={}, orig="canceling statement due to statement timeout")
+        mocker.patch('app.helpers.query_validator.connect_to_dataset', return_value=session)
+
+        assert not validate("SELECT * FROM patients", dataset)
+        session.close.assert_called_once()
+
+    def test_normalise_query(self):
+        """
+        Whitespace and the trailing semicolon don't matter,
+        quoted values are left as they are
+        """
+        assert normalise_query(" SELECT *\n\tFROM patients\nWHERE name = 'a  b' ; ") == \
+            "SELECT * FROM patients WHERE name = 'a  b'"
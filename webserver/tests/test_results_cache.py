@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from pytest import fixture
+
+from app.helpers.const import CLEANUP_AFTER_DAYS
+from app.helpers.results_cache import ResultsCache
+from tests.conftest import results_tar
+
+
+@fixture
+def cache(tmp_path):
+    return ResultsCache(root=tmp_path, max_size=2**20, max_age_days=CLEANUP_AFTER_DAYS)
+
+
+def store(cache:ResultsCache, task_id:int, content:bytes, created_at:datetime=None) -> bytes:
+    chunks = [content[i:i + 100] for i in range(0, len(content), 100)]
+    return b"".join(cache.store(task_id, created_at or datetime.now(), "tar", chunks))
+
+
+class TestResultsCache:
+    def test_store_and_get(self, cache):
+        """
+        The streamed archive is passed through unchanged, and cached
+        under its digest with the list of files
+        """
+        archive = results_tar()
+        assert cache.get(1, "tar") is None
+        assert store(cache, 1, archive) == archive
+
+        cached = cache.get(1, "tar")
+        assert cached.digest == hashlib.sha256(archive).hexdigest()
+        assert cached.path.name == f"{cached.digest}.tar"
+        assert cached.path.read_bytes() == archive
+        assert sorted(f["name"] for f in cached.files) == ["plots/plot.png", "results.csv"]
+        assert cache.get(1, "zip") is None
+        assert cache.stats()["hits"] == 1
+
+    def test_interrupted_download_is_not_cached(self, cache, tmp_path):
+        """
+        If the client goes away mid download, nothing is left on disk
+        """
+        stream = cache.store(1, datetime.now(), "tar", [b"a" * 100] * 5)
+        next(stream)
+        stream.close()
+
+        assert cache.get(1, "tar") is None
+        assert list((tmp_path / "1" / "cache").iterdir()) == []
+
+    def test_expired_entries_are_evicted(self, cache, tmp_path):
+        """
+        Entries follow the CLEANUP_AFTER_DAYS retention of the task results
+        """
+        store(cache, 1, results_tar(), datetime.now() - timedelta(days=CLEANUP_AFTER_DAYS))
+
+        assert cache.get(1, "tar") is None
+        assert list((tmp_path / "1" / "cache").iterdir()) == []
+
+    def test_least_recently_used_evicted_over_max_size(self, cache):
+        """
+        When the cache grows over its max size, the entries
+        downloaded the longest ago are removed first
+        """
+        big = results_tar({"data.bin": os.urandom(400 * 1024)})
+        store(cache, 1, big)
+        store(cache, 2, big)
+        # Task 1 is downloaded again, so 2 is now the oldest
+        manifest_2 = cache._manifest_path(2, "tar")
+        os.utime(manifest_2, (0, 0))
+        assert cache.get(1, "tar") is not None
+
+        store(cache, 3, big)
+
+        assert cache.get(1, "tar") is not None
+        assert cache.get(2, "tar") is None
+        assert cache.get(3, "tar") is not None
+        assert json.loads(cache._manifest_path(3, "tar").read_text())["size"] == len(big)
+
+    def test_disabled(self, tmp_path):
+        """
+        With a 0 max size, results are only passed through
+        """
+        cache = ResultsCache(root=tmp_path, max_size=0)
+        assert store(cache, 1, b"results") == b"results"
+        assert cache.get(1, "tar") is None
+        assert list(tmp_path.iterdir()) == []